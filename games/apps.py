@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class GamesConfig(AppConfig):
     name = 'games'
+
+    def ready(self):
+        # connects signal receivers of the games app
+        from . import signals  # noqa
@@ -0,0 +1,165 @@
+# python imports
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+# django imports
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+
+
+class ASGIHandler(object):
+    '''
+    ASGI 3 application serving Django requests.
+
+    The server keeps waiting connections, request bodies and slow clients
+        on its event loop; each request then runs on one of ASGI_THREADS
+        threads, from the request_started to the request_finished signal,
+        because the Django ORM and database drivers block and keep their
+        connections per thread. Response chunks are handed back to the
+        event loop as they are produced, so streaming responses keep
+        streaming and a slow reader only holds its thread while it
+        applies back pressure.
+
+    Size ASGI_THREADS like the database connection pool: more threads
+        only wait for connections, fewer leave connections idle.
+    '''
+    def __init__(self, wsgi_application=None, threads=None):
+        self.wsgi_application = wsgi_application or WSGIHandler()
+        self.executor = ThreadPoolExecutor(
+            threads or getattr(settings, 'ASGI_THREADS', 20)
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(
+                'Unsupported ASGI scope type {}'.format(scope['type'])
+            )
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            self.executor,
+            self.handle,
+            loop,
+            self.get_environ(scope, body),
+            send
+        )
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        '''
+        Returns the request body, or None when the client disconnected.
+        '''
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    def get_environ(self, scope, body):
+        '''
+        Returns the WSGI environ of an ASGI HTTP scope (PEP 3333 strings
+            are latin-1 decoded bytes).
+        '''
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode(
+                'utf-8'
+            ).decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/{}'.format(
+                scope.get('http_version', '1.1')
+            ),
+            'REMOTE_ADDR': str(client[0]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', ()):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_LENGTH':
+                continue
+            if name != 'CONTENT_TYPE':
+                name = 'HTTP_' + name
+            if name in environ:
+                value = environ[name] + ',' + value
+            environ[name] = value
+        return environ
+
+    def handle(self, loop, environ, send):
+        '''
+        Runs a request on the current thread and sends its response through
+            the event loop. A chunk is sent once the next one is produced,
+            so the last one carries more_body False.
+        '''
+        def send_message(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        start = []
+
+        def start_response(status, headers, exc_info=None):
+            start[:] = [{
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [
+                    (name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in headers
+                ],
+            }]
+
+        response = self.wsgi_application(environ, start_response)
+        try:
+            pending = None
+            for chunk in response:
+                if not chunk:
+                    continue
+                if pending is None:
+                    send_message(start[0])
+                else:
+                    send_message({
+                        'type': 'http.response.body',
+                        'body': pending,
+                        'more_body': True,
+                    })
+                pending = chunk
+            if pending is None:
+                send_message(start[0])
+            send_message({
+                'type': 'http.response.body',
+                'body': pending or b'',
+                'more_body': False,
+            })
+        finally:
+            # sends request_finished, which closes database connections of
+            # this thread
+            close = getattr(response, 'close', None)
+            if close is not None:
+                close()
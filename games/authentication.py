@@ -0,0 +1,89 @@
+# django imports
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare, salted_hmac
+# rest_framework import
+from rest_framework.authentication import BasicAuthentication
+# local imports
+from . import instrumentation
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    '''
+    Basic authentication which remembers successful verifications for
+        cache_timeout seconds, so repeated requests of the same client
+        skip the password hash.
+
+    Cache keys are keyed hashes of the username and password, the plaintext
+        password is never stored. A cached verification also stores a
+        fingerprint of the password hash of the user and is only accepted
+        while the fingerprint still matches and the user is active, so
+        password changes and deactivation invalidate it right away.
+    '''
+    cache_alias = 'default'
+    cache_timeout = 300
+    cache_prefix = 'basic-auth'
+    key_salt = 'games.authentication.CachedBasicAuthentication'
+
+    def get_cache_key(self, userid, password):
+        digest = salted_hmac(
+            self.key_salt,
+            '{}\0{}'.format(userid, password)
+        ).hexdigest()
+        return '{}:{}'.format(self.cache_prefix, digest)
+
+    def get_fingerprint(self, user):
+        return salted_hmac(self.key_salt, user.password).hexdigest()
+
+    @classmethod
+    def get_stats(cls):
+        '''
+        Returns hit and miss counts of cached verifications of this process,
+            also exposed by /metrics/ (see instrumentation.AUTH_CACHE).
+        '''
+        values = dict(
+            (labels, value)
+            for _, labels, value in instrumentation.AUTH_CACHE.get_samples()
+        )
+        return dict(
+            (name, values.get((('result', result),), 0))
+            for name, result in (('hits', 'hit'), ('misses', 'miss'))
+        )
+
+    def count_lookup(self, result):
+        instrumentation.AUTH_CACHE.inc((('result', result),))
+
+    def get_cached_user(self, key):
+        '''
+        Returns the user of a cached verification if it's still valid.
+        '''
+        cached = caches[self.cache_alias].get(key)
+        if cached is None:
+            return None
+        user_pk, fingerprint = cached
+        user_model = get_user_model()
+        try:
+            user = user_model._default_manager.get(pk=user_pk)
+        except user_model.DoesNotExist:
+            return None
+        if not user.is_active or \
+                not constant_time_compare(fingerprint,
+                                          self.get_fingerprint(user)):
+            return None
+        return user
+
+    def authenticate_credentials(self, userid, password):
+        key = self.get_cache_key(userid, password)
+        user = self.get_cached_user(key)
+        if user is not None:
+            self.count_lookup('hit')
+            return (user, None)
+        self.count_lookup('miss')
+        parent = super(CachedBasicAuthentication, self)
+        user, auth = parent.authenticate_credentials(userid, password)
+        caches[self.cache_alias].set(
+            key,
+            (user.pk, self.get_fingerprint(user)),
+            self.cache_timeout
+        )
+        return (user, auth)
@@ -0,0 +1,87 @@
+# django imports
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import DatabaseCreation as \
+    BaseDatabaseCreation
+# local imports
+from games import pool
+
+
+DEFAULT_POOL_OPTIONS = {
+    'MAX_SIZE': 10,
+    'MAX_LIFETIME': 1800,
+    'TIMEOUT': 10,
+    'CHECK_AFTER': 5,
+}
+
+
+class DatabaseCreation(BaseDatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would keep the test database in use.
+        pool.clear_pools()
+        super(DatabaseCreation, self)._destroy_test_db(
+            test_database_name, verbosity
+        )
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    '''
+    PostgreSQL backend taking connections from a pool shared by the threads
+        of the process (see pool.ConnectionPool) instead of opening one per
+        request. Closing the connection at the end of a request, i.e.
+        CONN_MAX_AGE 0, returns it to the pool.
+
+    POOL key of the database settings configures the pool:
+        MAX_SIZE - connections open at once
+        MAX_LIFETIME - seconds after which a connection is closed
+        TIMEOUT - seconds to wait for a connection when all are in use
+        CHECK_AFTER - seconds a connection may be idle before it's checked
+            with SELECT 1 on checkout
+    '''
+    def __init__(self, *args, **kwargs):
+        super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        self.creation = DatabaseCreation(self)
+
+    def get_pool(self, conn_params):
+        options = dict(DEFAULT_POOL_OPTIONS)
+        options.update(self.settings_dict.get('POOL', {}))
+        return pool.get_pool(
+            self.alias,
+            conn_params['database'],
+            lambda: base.Database.connect(**conn_params),
+            max_size=options['MAX_SIZE'],
+            max_lifetime=options['MAX_LIFETIME'],
+            timeout=options['TIMEOUT'],
+            check_after=options['CHECK_AFTER']
+        )
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        try:
+            connection = self.pool.acquire()
+        except pool.PoolTimeout as exc:
+            raise base.Database.OperationalError(str(exc))
+        # Hand pooled connections over in the state of a new connection,
+        # the isolation level of autocommit mode isn't the one of the
+        # session.
+        if connection.autocommit:
+            connection.autocommit = False
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # A connection closed inside an atomic block is still referenced
+        # until the block exits, so it can't go to another thread.
+        reuse = not self.in_atomic_block and (
+            not self.errors_occurred or self.is_usable()
+        )
+        with self.wrap_database_errors:
+            self.pool.release(self.connection, reuse)
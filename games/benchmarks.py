@@ -0,0 +1,121 @@
+# python imports
+import random
+import time
+from datetime import timedelta
+# django imports
+from django.contrib.auth.models import User
+from django.db import connections
+from django.utils import timezone
+# local imports
+from .models import Game, GameCategory, Player, PlayerScore
+
+
+def _create_missing(model, prefix, total, build, batch_size):
+    '''
+    Creates rows named <prefix><n> until the model has total of them.
+    '''
+    existing = model.objects.filter(name__startswith=prefix).count()
+    for start in range(existing, total, batch_size):
+        stop = min(start + batch_size, total)
+        model.objects.bulk_create(
+            [build('{}{}'.format(prefix, n)) for n in range(start, stop)]
+        )
+
+
+def seed(categories=10, games=1000, players=10000, scores=100000,
+         batch_size=10000, random_seed=0):
+    '''
+    Seeds benchmark data. Rows are only added up to the requested volumes,
+        so seeding again with larger numbers grows an existing data set.
+
+    Scores are spread over the last year in insertion order, like scores
+        reported by game servers.
+    '''
+    rnd = random.Random(random_seed)
+    now = timezone.now()
+    owner, created = User.objects.get_or_create(username='benchmark')
+    _create_missing(
+        GameCategory, 'bench-category-', categories,
+        lambda name: GameCategory(name=name), batch_size
+    )
+    category_pks = list(GameCategory.objects.filter(
+        name__startswith='bench-category-'
+    ).values_list('pk', flat=True))
+    _create_missing(
+        Game, 'bench-game-', games,
+        lambda name: Game(
+            name=name,
+            owner=owner,
+            game_category_id=rnd.choice(category_pks),
+            release_date=now - timedelta(days=rnd.randint(0, 3650))
+        ),
+        batch_size
+    )
+    _create_missing(
+        Player, 'bench-player-', players,
+        lambda name: Player(name=name, gender=rnd.choice('MF')),
+        batch_size
+    )
+    game_pks = list(Game.objects.filter(
+        name__startswith='bench-game-'
+    ).values_list('pk', flat=True))
+    player_pks = list(Player.objects.filter(
+        name__startswith='bench-player-'
+    ).values_list('pk', flat=True))
+    existing = PlayerScore.objects.count()
+    year = 365 * 24 * 3600
+    for start in range(existing, scores, batch_size):
+        stop = min(start + batch_size, scores)
+        PlayerScore.objects.bulk_create([
+            PlayerScore(
+                player_id=rnd.choice(player_pks),
+                game_id=rnd.choice(game_pks),
+                score=rnd.randint(0, 100000),
+                score_date=now - timedelta(
+                    seconds=year * (scores - n) // scores
+                )
+            )
+            for n in range(start, stop)
+        ])
+
+
+def explain(queryset):
+    '''
+    Returns the query plan of a queryset as a list of lines.
+    '''
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) '
+    else:
+        prefix = 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return [
+            ' '.join(str(column) for column in row)
+            for row in cursor.fetchall()
+        ]
+
+
+def timed(function, repeat):
+    '''
+    Calls function repeat times and returns sorted durations in seconds.
+    '''
+    durations = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        durations.append(time.time() - start)
+    return sorted(durations)
+
+
+def percentile(durations, percent):
+    '''
+    Returns a percentile of sorted durations (nearest rank).
+    '''
+    if not durations:
+        return 0.0
+    rank = int(round(percent / 100.0 * (len(durations) - 1)))
+    return durations[rank]
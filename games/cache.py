@@ -0,0 +1,198 @@
+# python imports
+import hashlib
+import threading
+import time
+# django imports
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import http_date, parse_etags, parse_http_date_safe,\
+    quote_etag, urlencode
+# local imports
+from . import routers
+from .models import CacheTag
+
+
+# Must be shared by every worker process, responses stored by one are
+# served by all. Tag versions are kept in the CacheTag table instead.
+RESPONSE_CACHE_ALIAS = 'shared'
+
+# Tags invalidated by the current transaction of the thread, see invalidate.
+_pending = threading.local()
+
+
+def get_tag_versions(tags):
+    '''
+    Returns current versions of cache tags. Missing tags start from the
+        current time in milliseconds, so a tag whose row was deleted never
+        returns to a version some stale response was stored with.
+    '''
+    versions = dict(
+        CacheTag.objects.filter(tag__in=tags).values_list('tag', 'version')
+    )
+    missing = [tag for tag in tags if tag not in versions]
+    if missing:
+        version = int(time.time() * 1000)
+        try:
+            with transaction.atomic():
+                CacheTag.objects.bulk_create([
+                    CacheTag(tag=tag, version=version) for tag in missing
+                ])
+            versions.update((tag, version) for tag in missing)
+        except IntegrityError:
+            # inserted concurrently
+            versions.update(CacheTag.objects.filter(
+                tag__in=missing
+            ).values_list('tag', 'version'))
+    return [versions[tag] for tag in tags]
+
+
+def _bump_pending():
+    tags, _pending.tags = _pending.tags, None
+    written = timezone.now()
+    bumped = CacheTag.objects.filter(tag__in=tags).update(
+        version=F('version') + 1,
+        written=written
+    )
+    if bumped == len(tags) or not routers.get_replicas():
+        return
+    # tags no response was stored with yet still record the write for
+    # routers.recently_written
+    missing = tags - set(
+        CacheTag.objects.filter(tag__in=tags).values_list('tag', flat=True)
+    )
+    version = int(time.time() * 1000)
+    try:
+        with transaction.atomic():
+            CacheTag.objects.bulk_create([
+                CacheTag(tag=tag, version=version, written=written)
+                for tag in missing
+            ])
+    except IntegrityError:
+        # inserted concurrently, with a version newer than any response
+        CacheTag.objects.filter(tag__in=missing).update(written=written)
+
+
+def invalidate(*tags):
+    '''
+    Bumps versions of cache tags, which makes every response stored with
+        one of the tags unreachable, and marks them as written for
+        routers.recently_written. Inside a transaction the tags are bumped
+        once it's committed, so no request caches data read before the
+        commit under the new versions; tags invalidated by the same
+        transaction are bumped together with a single update.
+    '''
+    connection = transaction.get_connection()
+    pending = getattr(_pending, 'tags', None)
+    if pending is not None and connection.in_atomic_block and any(
+            func is _bump_pending for sids, func in connection.run_on_commit):
+        pending.update(tags)
+        return
+    # the callback of an earlier transaction was run or rolled back
+    _pending.tags = set(tags)
+    transaction.on_commit(_bump_pending)
+
+
+class CachedResponseMixin(object):
+    '''
+    Caches rendered GET responses of a generic view.
+
+    Responses are keyed on the absolute path, the query string, the
+        negotiated renderer and the authenticated user, and stored together
+        with versions of the cache tags the view depends on. cache_tags
+        lists model tags bumped on any write of the model, the pk of
+        detail views adds an object tag (e.g. game:5) bumped only by writes
+        which change that object. Signal receivers of the games app bump
+        the tags, see signals.py.
+
+    Cached responses carry an ETag and Last-Modified header and requests
+        revalidating them get 304 Not Modified. The browsable API isn't
+        cached because its pages contain per-request forms.
+    '''
+    cache_timeout = 300
+    cache_tags = ()
+    cache_object_tag = None
+    cache_key_prefix = 'response'
+    uncached_formats = ('api',)
+
+    def get_cache_tags(self):
+        tags = list(self.cache_tags)
+        if self.cache_object_tag is not None:
+            tags.append(
+                '{}:{}'.format(self.cache_object_tag, self.kwargs['pk'])
+            )
+        return tags
+
+    def get_response_cache_key(self, request):
+        if request.user.is_authenticated():
+            identity = request.user.pk
+        else:
+            identity = 'anon'
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        base = '|'.join(str(part) for part in (
+            request.build_absolute_uri(request.path),
+            query,
+            request.accepted_media_type,
+            identity,
+            get_tag_versions(self.get_cache_tags())
+        ))
+        return '{}:{}'.format(
+            self.cache_key_prefix,
+            hashlib.md5(base.encode('utf-8')).hexdigest()
+        )
+
+    def get_not_modified(self, request, cached):
+        etags = request.META.get('HTTP_IF_NONE_MATCH')
+        if etags is not None:
+            etags = parse_etags(etags)
+            if cached['etag'] not in etags and '*' not in etags:
+                return None
+        else:
+            since = parse_http_date_safe(
+                request.META.get('HTTP_IF_MODIFIED_SINCE', '')
+            )
+            if since is None or cached['last_modified'] > since:
+                return None
+        response = HttpResponseNotModified()
+        self.set_validators(response, cached)
+        return response
+
+    def set_validators(self, response, cached):
+        response['ETag'] = quote_etag(cached['etag'])
+        response['Last-Modified'] = http_date(cached['last_modified'])
+
+    def get(self, request, *args, **kwargs):
+        if request.accepted_renderer.format in self.uncached_formats:
+            return super(CachedResponseMixin, self).get(
+                request, *args, **kwargs
+            )
+        cache = caches[RESPONSE_CACHE_ALIAS]
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            response = self.get_not_modified(request, cached)
+            if response is None:
+                response = HttpResponse(
+                    cached['content'],
+                    content_type=cached['content_type']
+                )
+                self.set_validators(response, cached)
+            return response
+
+        response = super(CachedResponseMixin, self).get(
+            request, *args, **kwargs
+        )
+        if response.status_code == 200:
+            def store(response):
+                cached = {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'etag': hashlib.md5(response.content).hexdigest(),
+                    'last_modified': int(time.time()),
+                }
+                cache.set(key, cached, self.cache_timeout)
+                self.set_validators(response, cached)
+            response.add_post_render_callback(store)
+        return response
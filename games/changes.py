@@ -0,0 +1,144 @@
+# django imports
+from django.db import connections, transaction
+# local imports
+from .models import Change, Game, GameCategory, Player, PlayerScore
+
+
+# Models whose rows are recorded in the change log, by Change.model.
+MODELS = dict(
+    (model._meta.model_name, model)
+    for model in (GameCategory, Game, Player, PlayerScore)
+)
+
+# pg_advisory_xact_lock key serializing sequence()
+SEQUENCE_LOCK = 0x67616d6573
+
+
+def _sequence_on_commit():
+    '''
+    Numbers the changes of the current transaction once it's committed,
+        with a single update however many changes it records.
+    '''
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(
+            func is sequence for sids, func in connection.run_on_commit):
+        return
+    transaction.on_commit(sequence)
+
+
+def record(instance, action):
+    Change.objects.create(
+        model=instance._meta.model_name,
+        object_id=instance.pk,
+        action=action
+    )
+    _sequence_on_commit()
+
+
+def record_many(model, pks, action):
+    Change.objects.bulk_create([
+        Change(model=model._meta.model_name, object_id=pk, action=action)
+        for pk in pks
+    ])
+    _sequence_on_commit()
+
+
+def sequence(using='default'):
+    '''
+    Numbers the changes committed since the last call after all numbered
+        ones, in id order. A transaction inserts its changes with ids
+        taken before it commits, so numbering by id on insert would let a
+        reader at seq N skip changes of a slower transaction which commits
+        below N later; committed changes are only numbered once they are
+        visible, by the writing transaction right after its commit. Calls
+        are serialized, by an advisory lock on PostgreSQL and by the
+        database lock of the single writer on SQLite.
+    '''
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT pg_advisory_xact_lock(%s)', [SEQUENCE_LOCK]
+                )
+            cursor.execute(
+                'UPDATE {table} SET seq = id '
+                '- (SELECT MIN(id) FROM {table} WHERE seq IS NULL) '
+                '+ (SELECT COALESCE(MAX(seq), 0) FROM {table}) + 1 '
+                'WHERE seq IS NULL'.format(table=Change._meta.db_table)
+            )
+
+
+def sequence_committed(using='default'):
+    '''
+    Numbers committed changes their transaction didn't number, e.g. when
+        its process exited between the commit and sequence(). Readers call
+        it, so it only reads, from the seq index, unless there are any.
+    '''
+    if Change.objects.using(using).filter(seq=None).exists():
+        sequence(using)
+
+
+def get_head(using='default'):
+    '''
+    Returns the seq of the latest change, 0 without changes.
+    '''
+    sequence_committed(using)
+    return Change.objects.using(using).exclude(seq=None).order_by(
+        '-seq'
+    ).values_list('seq', flat=True).first() or 0
+
+
+def get_changes(since, limit, models=None, using='default'):
+    '''
+    Returns up to limit changes after seq since, oldest first.
+    '''
+    sequence_committed(using)
+    changes = Change.objects.using(using).filter(seq__gt=since)
+    if models is not None:
+        changes = changes.filter(model__in=models)
+    return list(changes.order_by('seq')[:limit])
+
+
+def is_pruned(since, using='default'):
+    '''
+    Tells whether changes after seq since were deleted by prune(). Seqs
+        have no gaps, so they were when the oldest change left is newer
+        than the one after since.
+    '''
+    oldest = Change.objects.using(using).exclude(seq=None).order_by(
+        'seq'
+    ).values_list('seq', flat=True).first()
+    return oldest is not None and oldest > since + 1
+
+
+def prune(before, using='default'):
+    '''
+    Deletes the numbered changes recorded before a datetime, except the
+        latest change, which the seqs of new changes follow. Returns the
+        number of deleted changes.
+    '''
+    head = get_head(using)
+    return Change.objects.using(using).filter(
+        created__lt=before,
+        seq__lt=head
+    ).delete()[0]
+
+
+def get_data(changes, using='default'):
+    '''
+    Returns {(model, pk): column values} of the rows changed by creates
+        and updates which still exist, read once per model.
+    '''
+    pks = {}
+    for change in changes:
+        if change.action != Change.DELETE:
+            pks.setdefault(change.model, set()).add(change.object_id)
+    data = {}
+    for name, model_pks in pks.items():
+        rows = MODELS[name].objects.using(using).filter(
+            pk__in=model_pks
+        ).order_by().values()
+        for row in rows:
+            data[(name, row['id'])] = row
+    return data
@@ -0,0 +1,169 @@
+# python imports
+import operator
+from functools import reduce
+# django imports
+from django import forms
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import BooleanField, Case, F, FloatField, Func,\
+    IntegerField, Q, Value, When
+from django.db.models.functions import Greatest, Upper
+# django_filter imports
+from django_filters import CharFilter
+# rest_framework import
+from rest_framework import filters
+# local imports
+from .cache import RESPONSE_CACHE_ALIAS, get_tag_versions
+
+
+class CachedNameChoices(object):
+    '''
+    Iterable of (name, name) choices of a model, loaded only when iterated
+        (i.e. when an HTML form is rendered) and cached until the model tag
+        of the response cache is bumped by a write of the model. Names are
+        kept in the shared response cache and keyed on the tag version, so
+        a write served by one worker process refreshes them in all.
+    '''
+    cache_alias = RESPONSE_CACHE_ALIAS
+    cache_timeout = 3600
+
+    def __init__(self, model, field_name='name', tag=None):
+        self.model = model
+        self.field_name = field_name
+        self.tag = tag or model._meta.model_name
+
+    def get_names(self):
+        cache = caches[self.cache_alias]
+        key = 'filter-choices:{}:{}:{}'.format(
+            self.model._meta.label,
+            self.field_name,
+            get_tag_versions([self.tag])[0]
+        )
+        names = cache.get(key)
+        if names is None:
+            names = list(
+                self.model._default_manager.order_by(
+                    self.field_name
+                ).values_list(self.field_name, flat=True)
+            )
+            cache.set(key, names, self.cache_timeout)
+        return names
+
+    def __iter__(self):
+        yield ('', '---------')
+        for name in self.get_names():
+            yield (name, name)
+
+
+class NameFilter(CharFilter):
+    '''
+    Filters by a name with a plain lookup instead of enumerating every
+        value like AllValuesFilter does. HTML forms still render a select
+        filled from CachedNameChoices of choices_model.
+    '''
+    def __init__(self, *args, **kwargs):
+        choices_model = kwargs.pop('choices_model')
+        widget = forms.Select()
+        widget.choices = CachedNameChoices(choices_model)
+        kwargs.setdefault('widget', widget)
+        super(NameFilter, self).__init__(*args, **kwargs)
+
+
+class NameSearchFilter(filters.SearchFilter):
+    '''
+    Searches the '^' (starts with) fields of view.search_fields with the
+        indexes of migration 0009 instead of a sequential scan. The whole
+        search parameter is one case-insensitive prefix:
+        - PostgreSQL: UPPER(name) LIKE 'TERM%', served by an expression
+          index with text_pattern_ops,
+        - SQLite: range on UPPER(name), served by an expression index;
+          terms that aren't ASCII, which SQLite can't upper case, fall
+          back to an unindexed LIKE.
+
+    search_mode=fuzzy matches similar names, ordered by relevance
+        (search_rank) unless an ordering is requested. PostgreSQL matches
+        trigrams with the % operator of pg_trgm and its GIN index, other
+        databases fall back to substrings ranked exact, prefix, anywhere.
+    '''
+    mode_param = 'search_mode'
+
+    def get_name_fields(self, view):
+        return [
+            field[1:] for field in getattr(view, 'search_fields', ())
+            if field.startswith('^')
+        ]
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').strip()
+        fields = self.get_name_fields(view)
+        if not term or not fields:
+            return queryset
+        vendor = connections[queryset.db].vendor
+        if request.query_params.get(self.mode_param) == 'fuzzy':
+            if vendor == 'postgresql':
+                return self.filter_similar(queryset, fields, term)
+            return self.filter_substring(queryset, fields, term)
+        conditions = []
+        for field in fields:
+            upper = '_search_{}'.format(field)
+            queryset = queryset.annotate(**{upper: Upper(field)})
+            if vendor == 'postgresql':
+                conditions.append(Q(**{upper + '__startswith': term.upper()}))
+            elif vendor == 'sqlite' and all(ord(c) < 128 for c in term):
+                conditions.append(self.get_range(upper, term.upper()))
+            else:
+                conditions.append(Q(**{field + '__istartswith': term}))
+        return queryset.filter(reduce(operator.or_, conditions))
+
+    def get_range(self, name, prefix):
+        '''
+        Returns a condition matching values starting with an ASCII prefix
+            in binary collation: prefix <= value < the next prefix.
+        '''
+        return Q(**{
+            name + '__gte': prefix,
+            name + '__lt': prefix[:-1] + chr(ord(prefix[-1]) + 1),
+        })
+
+    def get_rank(self, ranks):
+        if len(ranks) == 1:
+            return ranks[0]
+        return Greatest(*ranks)
+
+    def filter_similar(self, queryset, fields, term):
+        conditions = []
+        ranks = []
+        for field in fields:
+            match = '_search_{}'.format(field)
+            queryset = queryset.annotate(**{match: Func(
+                F(field),
+                Value(term),
+                template='%(expressions)s',
+                arg_joiner=' %% ',
+                output_field=BooleanField()
+            )})
+            conditions.append(Q(**{match: True}))
+            ranks.append(Func(
+                F(field),
+                Value(term),
+                function='similarity',
+                output_field=FloatField()
+            ))
+        return queryset.filter(reduce(operator.or_, conditions)).annotate(
+            search_rank=self.get_rank(ranks)
+        ).order_by('-search_rank', 'pk')
+
+    def filter_substring(self, queryset, fields, term):
+        conditions = []
+        ranks = []
+        for field in fields:
+            conditions.append(Q(**{field + '__icontains': term}))
+            ranks.append(Case(
+                When(**{field + '__iexact': term, 'then': Value(3)}),
+                When(**{field + '__istartswith': term, 'then': Value(2)}),
+                default=Value(1),
+                output_field=IntegerField()
+            ))
+        return queryset.filter(reduce(operator.or_, conditions)).annotate(
+            search_rank=self.get_rank(ranks)
+        ).order_by('-search_rank', 'pk')
@@ -0,0 +1,142 @@
+# django imports
+from django.core.signals import setting_changed
+from django.core.urlresolvers import NoReverseMatch, get_script_prefix,\
+    reverse as django_reverse
+from django.dispatch import receiver
+# rest_framework import
+from rest_framework import relations, serializers
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+
+
+# Digits matching the [0-9]+ pk groups of games/urls.py which don't occur
+# anywhere else in the reversed paths.
+PLACEHOLDER = '9' * 19
+
+_templates = None
+
+
+def build_url_templates():
+    '''
+    Returns {route name: (path before pk, path after pk)} for the named
+        routes of games/urls.py whose only argument is a pk. Paths are
+        relative to the script prefix.
+    '''
+    # games.urls imports the views, which import the serializers using
+    # this module.
+    from . import urls
+    templates = {}
+    prefix = get_script_prefix()
+    for pattern in urls.urlpatterns:
+        if not pattern.name or \
+                set(pattern.regex.groupindex) != set(['pk']):
+            continue
+        try:
+            path = django_reverse(pattern.name, kwargs={'pk': PLACEHOLDER})
+        except NoReverseMatch:
+            continue
+        if not path.startswith(prefix) or path.count(PLACEHOLDER) != 1:
+            continue
+        templates[pattern.name] = tuple(
+            path[len(prefix):].split(PLACEHOLDER)
+        )
+    return templates
+
+
+def get_url_templates():
+    global _templates
+    if _templates is None:
+        _templates = build_url_templates()
+    return _templates
+
+
+@receiver(setting_changed)
+def clear_url_templates(setting, **kwargs):
+    global _templates
+    if setting == 'ROOT_URLCONF':
+        _templates = None
+
+
+def get_link_prefix(request):
+    '''
+    Returns scheme://host/script-prefix/ of a request, or an empty string
+        when links of the request need reverse(): API versioning, format
+        query overrides and per-request URL confs. Computed once per
+        request because get_host() validates ALLOWED_HOSTS on every call.
+    '''
+    prefix = getattr(request, '_link_prefix', None)
+    if prefix is None:
+        prefix = ''
+        if getattr(request, 'versioning_scheme', None) is None and \
+                getattr(request, 'urlconf', None) is None and \
+                api_settings.URL_FORMAT_OVERRIDE not in request.GET:
+            prefix = '{}://{}{}'.format(
+                request.scheme,
+                request.get_host(),
+                get_script_prefix()
+            )
+        request._link_prefix = prefix
+    return prefix
+
+
+def build_url(view_name, pk, request=None, format=None):
+    '''
+    Formats the absolute URL of a route with a pk argument from its
+        precompiled template. Gives the same result as reverse() of
+        rest_framework and falls back to it for anything a template can't
+        express, see get_link_prefix.
+    '''
+    template = get_url_templates().get(view_name)
+    if template is not None and format is None and request is not None:
+        prefix = get_link_prefix(request)
+        if prefix:
+            return '{}{}{}{}'.format(prefix, template[0], pk, template[1])
+    return reverse(
+        view_name,
+        kwargs={'pk': pk},
+        request=request,
+        format=format
+    )
+
+
+class HyperlinkedRelatedField(relations.HyperlinkedRelatedField):
+    '''
+    HyperlinkedRelatedField.hyperlinks
+
+    Builds links with build_url instead of resolving the route on every
+        object.
+    '''
+    def get_url(self, obj, view_name, request, format):
+        # Unsaved objects will not yet have a valid URL.
+        if hasattr(obj, 'pk') and obj.pk in (None, ''):
+            return None
+        if self.lookup_url_kwarg != 'pk':
+            return super(HyperlinkedRelatedField, self).get_url(
+                obj, view_name, request, format
+            )
+        return build_url(
+            view_name,
+            getattr(obj, self.lookup_field),
+            request,
+            format
+        )
+
+
+class HyperlinkedIdentityField(HyperlinkedRelatedField,
+                               relations.HyperlinkedIdentityField):
+    '''
+    HyperlinkedIdentityField.hyperlinks
+
+    Identity link of an object built with build_url.
+    '''
+
+
+class HyperlinkedModelSerializer(serializers.HyperlinkedModelSerializer):
+    '''
+    HyperlinkedModelSerializer.hyperlinks
+
+    Hyperlinked serializer whose url field and generated relations use the
+        precompiled URL templates of this module.
+    '''
+    serializer_related_field = HyperlinkedRelatedField
+    serializer_url_field = HyperlinkedIdentityField
@@ -0,0 +1,392 @@
+# python imports
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+# django imports
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, connections, transaction
+from django.dispatch import receiver
+from django.utils.dateparse import parse_datetime
+# local imports
+from . import instrumentation
+from .models import Game, Player, PlayerScore, ScoreBufferSegment
+from .signals import scores_bulk_created
+
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.ndjson'
+# <pid>-<random token>-<number>, the token keeps names unique when a pid
+# is reused
+SEGMENT_NAME = re.compile(r'^\d+-[0-9a-f]+-\d+$')
+
+
+def is_enabled():
+    return getattr(settings, 'SCORE_BUFFER_ENABLED', False)
+
+
+def parse_tracking_id(tracking_id):
+    '''
+    Returns (segment name, line) of a tracking id, or None when it's
+        malformed.
+    '''
+    name, separator, line = tracking_id.rpartition(':')
+    if not separator or not SEGMENT_NAME.match(name) or not line.isdigit():
+        return None
+    return name, int(line)
+
+
+def read_segment(path):
+    '''
+    Returns the scores of a segment file. A last line without newline is
+        a write torn by a crash, its request never got a response.
+    '''
+    scores = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            scores.append(json.loads(line.decode('utf-8')))
+    return scores
+
+
+def store_segment(name, scores):
+    '''
+    Inserts the scores of a segment with bulk_create in one transaction
+        and records the segment in it, so a segment flushed again after a
+        crash isn't stored twice. Scores of players or games deleted since
+        they were accepted are dropped, as the cascade would have deleted
+        them.
+
+    Returns (stored, dropped), or None when the segment was already stored.
+    '''
+    try:
+        with transaction.atomic():
+            if ScoreBufferSegment.objects.filter(name=name).exists():
+                return None
+            player_pks = set(Player.objects.filter(
+                pk__in=set(score['player'] for score in scores)
+            ).values_list('pk', flat=True))
+            game_pks = set(Game.objects.filter(
+                pk__in=set(score['game'] for score in scores)
+            ).values_list('pk', flat=True))
+            instances = PlayerScore.objects.bulk_create([
+                PlayerScore(
+                    player_id=score['player'],
+                    game_id=score['game'],
+                    score=score['score'],
+                    score_date=parse_datetime(score['score_date'])
+                )
+                for score in scores
+                if score['player'] in player_pks and
+                score['game'] in game_pks
+            ], batch_size=500)
+            scores_bulk_created.send(sender=PlayerScore, instances=instances)
+            ScoreBufferSegment.objects.create(
+                name=name,
+                scores=len(instances),
+                dropped=len(scores) - len(instances)
+            )
+    except IntegrityError:
+        # recorded by a concurrent flush of the same segment
+        if ScoreBufferSegment.objects.filter(name=name).exists():
+            return None
+        raise
+    return len(instances), len(scores) - len(instances)
+
+
+class Segment(object):
+    '''
+    Append-only NDJSON file of accepted scores. The file stays open and
+        locked until its scores are stored, so recover() can tell the
+        segments of running processes from those left behind.
+    '''
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name + SEGMENT_SUFFIX)
+        # locked before it gets the name recover() looks for
+        self.file = open(self.path + '.new', 'ab')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        os.rename(self.path + '.new', self.path)
+        self.opened = time.time()
+        self.lines = 0
+
+    def remove(self):
+        os.remove(self.path)
+        self.file.close()
+
+
+class ScoreBuffer(object):
+    '''
+    Write-behind buffer of the scores accepted by one process.
+
+    Scores are appended to the active segment file and synced to disk
+        before their tracking ids are returned; requests waiting for the
+        same fsync share it. The active segment is closed once it holds
+        flush_size scores (concurrent writes may add a few more) or is
+        flush_interval seconds old, and a flusher thread stores closed
+        segments with store_segment(). Segments which can't be stored,
+        e.g. while the database is down, are retried on the next flush.
+        Without fsync, accepted scores survive a crash of the process but
+        not of the host.
+    '''
+    def __init__(self, directory, flush_size=1000, flush_interval=1.0,
+                 fsync=True):
+        self.directory = directory
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.pid = os.getpid()
+        self.prefix = '{}-{}'.format(self.pid, uuid.uuid4().hex[:12])
+        # guards the active segment, _sync_lock is taken first when both
+        # are needed
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._active = None
+        self._closed = []
+        self._count = 0
+        self._written = 0
+        self._synced = 0
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            self._thread = threading.Thread(
+                target=self.run,
+                name='score-buffer-flusher'
+            )
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def _open(self):
+        self._count += 1
+        segment = Segment(
+            self.directory,
+            '{}-{}'.format(self.prefix, self._count)
+        )
+        if self.fsync:
+            # makes the new file itself durable
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        return segment
+
+    def _rotate(self):
+        '''
+        Closes the active segment, called with both locks held.
+        '''
+        segment = self._active
+        self._active = None
+        segment.file.flush()
+        if self.fsync:
+            os.fsync(segment.file.fileno())
+        self._synced = self._written
+        self._closed.append(segment)
+
+    def _sync(self, ticket):
+        '''
+        Waits until write number ticket is on disk. One fsync covers all
+            writes made before it started.
+        '''
+        if not self.fsync:
+            return
+        with self._sync_lock:
+            if self._synced >= ticket:
+                return
+            with self._lock:
+                written = self._written
+                fileno = self._active.file.fileno()
+            os.fsync(fileno)
+            self._synced = written
+
+    def append(self, scores):
+        '''
+        Buffers scores, dicts of player and game pks, score and score_date
+            in ISO 8601, and returns their tracking ids.
+        '''
+        self.start()
+        accepted = time.time()
+        with self._lock:
+            if self._active is None:
+                self._active = self._open()
+            segment = self._active
+            ids, lines = [], []
+            for score in scores:
+                ids.append('{}:{}'.format(segment.name, segment.lines))
+                lines.append(json.dumps(
+                    dict(score, line=segment.lines, accepted=accepted),
+                    sort_keys=True
+                ))
+                segment.lines += 1
+            segment.file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            segment.file.flush()
+            self._written += 1
+            ticket = self._written
+            full = segment.lines >= self.flush_size
+        self._sync(ticket)
+        instrumentation.SCORE_BUFFER_DEPTH.inc((), len(scores))
+        instrumentation.SCORE_BUFFER_SCORES.inc(
+            (('status', 'accepted'),), len(scores)
+        )
+        if full:
+            with self._sync_lock:
+                with self._lock:
+                    if self._active is segment:
+                        self._rotate()
+            self._wake.set()
+        return ids
+
+    def flush(self, force=False):
+        '''
+        Closes the active segment when it's older than flush_interval, or
+            whenever it holds scores if force is True, and stores closed
+            segments.
+        '''
+        with self._sync_lock:
+            with self._lock:
+                segment = self._active
+                if segment is not None and segment.lines and (
+                        force or time.time() - segment.opened >=
+                        self.flush_interval):
+                    self._rotate()
+                closed, self._closed = self._closed, []
+        for index, segment in enumerate(closed):
+            try:
+                self.store(segment)
+            except Exception:
+                logger.exception(
+                    'Storing score buffer segment %s failed, retrying on '
+                    'the next flush', segment.name
+                )
+                with self._lock:
+                    self._closed[:0] = closed[index:]
+                return
+
+    def store(self, segment):
+        started = time.time()
+        scores = read_segment(segment.path)
+        result = store_segment(segment.name, scores)
+        stored = time.time()
+        segment.remove()
+        instrumentation.SCORE_BUFFER_DEPTH.inc((), -segment.lines)
+        if result is None:
+            return
+        instrumentation.SCORE_BUFFER_FLUSH_DURATION.observe(
+            (), stored - started
+        )
+        for score in scores:
+            instrumentation.SCORE_BUFFER_DELAY.observe(
+                (), stored - score['accepted']
+            )
+        instrumentation.SCORE_BUFFER_SCORES.inc(
+            (('status', 'stored'),), result[0]
+        )
+        instrumentation.SCORE_BUFFER_SCORES.inc(
+            (('status', 'dropped'),), result[1]
+        )
+
+    def run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                # connections of this thread go back to the pool
+                for connection in connections.all():
+                    connection.close()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    '''
+    Returns the score buffer of the process, created from the SCORE_BUFFER
+        settings on first use and again in forked processes.
+    '''
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None or _buffer.pid != os.getpid():
+            _buffer = ScoreBuffer(
+                settings.SCORE_BUFFER_DIR,
+                flush_size=settings.SCORE_BUFFER_FLUSH_SIZE,
+                flush_interval=settings.SCORE_BUFFER_FLUSH_INTERVAL,
+                fsync=settings.SCORE_BUFFER_FSYNC
+            )
+        return _buffer
+
+
+@receiver(setting_changed)
+def reset_buffer(setting, **kwargs):
+    global _buffer
+    if setting.startswith('SCORE_BUFFER_'):
+        with _buffer_lock:
+            if _buffer is not None:
+                _buffer.stop()
+            _buffer = None
+
+
+def get_status(tracking_id):
+    '''
+    Returns 'stored' or 'pending' for a tracking id, or None when it isn't
+        known. Pending scores are only known to the host which accepted
+        them.
+    '''
+    parsed = parse_tracking_id(tracking_id)
+    if parsed is None:
+        return None
+    name, line = parsed
+    segment = ScoreBufferSegment.objects.filter(name=name).first()
+    if segment is not None:
+        if line < segment.scores + segment.dropped:
+            return 'stored'
+        return None
+    path = os.path.join(settings.SCORE_BUFFER_DIR, name + SEGMENT_SUFFIX)
+    if os.path.exists(path):
+        return 'pending'
+    return None
+
+
+def recover(directory):
+    '''
+    Stores the segments of a buffer directory which no running process
+        holds, i.e. those left behind by processes which exited or
+        crashed, and removes them. Returns the number of segments stored.
+    '''
+    recovered = 0
+    for filename in sorted(os.listdir(directory)):
+        name = filename[:-len(SEGMENT_SUFFIX)]
+        if not filename.endswith(SEGMENT_SUFFIX) or \
+                not SEGMENT_NAME.match(name):
+            continue
+        path = os.path.join(directory, filename)
+        with open(path, 'rb') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                continue
+            scores = read_segment(path)
+            if store_segment(name, scores) is not None:
+                recovered += 1
+            os.remove(path)
+    return recovered
@@ -0,0 +1,426 @@
+# python imports
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import Counter
+# django imports
+from django.conf import settings
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+# rest_framework import
+from rest_framework.serializers import ListSerializer
+# local imports
+from . import pool
+
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# IN (%s, %s, ...) lists of any length have the same shape
+_PLACEHOLDER_LIST = re.compile(r'%s(?:\s*,\s*%s)+')
+
+_state = threading.local()
+
+
+def is_enabled():
+    return getattr(settings, 'INSTRUMENTATION_ENABLED', False)
+
+
+def get_recorder():
+    '''
+    Returns the Recorder of the request handled by the current thread, or
+        None when it isn't instrumented.
+    '''
+    return getattr(_state, 'recorder', None)
+
+
+def get_query_shape(sql):
+    return _PLACEHOLDER_LIST.sub('%s, ...', sql)
+
+
+class Recorder(object):
+    '''
+    Query count, SQL shapes and time spent per phase of one request.
+    '''
+    phases = ('db', 'serialize', 'render')
+
+    def __init__(self):
+        self.started = time.time()
+        self.queries = 0
+        self.shapes = Counter()
+        self.timings = dict((phase, 0.0) for phase in self.phases)
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.shapes[get_query_shape(sql)] += 1
+        self.timings['db'] += duration
+
+    def add_time(self, phase, duration):
+        self.timings[phase] += duration
+
+    def get_repeated_queries(self, threshold):
+        '''
+        Returns [(SQL shape, count)] of shapes run more than threshold
+            times, the usual sign of an N+1 query pattern.
+        '''
+        return [
+            (shape, count) for shape, count in self.shapes.most_common()
+            if count > threshold
+        ]
+
+    def get_server_timing(self, total):
+        timings = ['db;dur={:.3f};desc="{} queries"'.format(
+            self.timings['db'] * 1000, self.queries
+        )]
+        for phase in self.phases[1:]:
+            timings.append('{};dur={:.3f}'.format(
+                phase, self.timings[phase] * 1000
+            ))
+        timings.append('total;dur={:.3f}'.format(total * 1000))
+        return ', '.join(timings)
+
+
+class InstrumentedCursorWrapper(CursorWrapper):
+    '''
+    Cursor adding every query it runs to a Recorder. Wraps the cursor
+        wrapper Django would use otherwise, so DEBUG query logging keeps
+        working.
+    '''
+    def __init__(self, cursor, db, recorder):
+        super(InstrumentedCursorWrapper, self).__init__(cursor, db)
+        self.recorder = recorder
+
+    def execute(self, sql, params=None):
+        started = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.recorder.add_query(sql, time.time() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.recorder.add_query(sql, time.time() - started)
+
+
+def instrument_connections(recorder):
+    for connection in connections.all():
+        for name in ('make_cursor', 'make_debug_cursor'):
+            def make(cursor, connection=connection,
+                     make=getattr(connection, name)):
+                return InstrumentedCursorWrapper(
+                    make(cursor), connection, recorder
+                )
+            setattr(connection, name, make)
+
+
+def uninstrument_connections():
+    for connection in connections.all():
+        for name in ('make_cursor', 'make_debug_cursor'):
+            connection.__dict__.pop(name, None)
+
+
+class TimedSerializerMixin(object):
+    '''
+    Adds time spent in to_representation of the outermost serializer of a
+        response (or of the children of an outermost list serializer) to
+        the serialize phase of the request.
+    '''
+    def to_representation(self, instance):
+        recorder = get_recorder()
+        parent = self.parent
+        if recorder is None or parent is not None and (
+                parent.parent is not None or
+                not isinstance(parent, ListSerializer)):
+            return super(TimedSerializerMixin, self).to_representation(
+                instance
+            )
+        started = time.time()
+        try:
+            return super(TimedSerializerMixin, self).to_representation(
+                instance
+            )
+        finally:
+            recorder.add_time('serialize', time.time() - started)
+
+
+def _format_labels(labels):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace(
+            '"', '\\"'
+        ).replace('\n', '\\n'))
+        for name, value in labels
+    )
+
+
+class Histogram(object):
+    '''
+    Prometheus histogram of observations per label set, kept in memory of
+        the process.
+    '''
+    type = 'histogram'
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # labels: ([count per bucket and +Inf], sum)
+        self.values = {}
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(
+                labels, ([0] * (len(self.buckets) + 1), 0)
+            )
+            counts[index] += 1
+            self.values[labels] = (counts, total + value)
+
+    def get_samples(self):
+        with self.lock:
+            values = sorted(
+                (labels, list(counts), total)
+                for labels, (counts, total) in self.values.items()
+            )
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield (
+                    '_bucket',
+                    labels + (('le', bound),),
+                    cumulative
+                )
+            yield '_sum', labels, total
+            yield '_count', labels, cumulative
+
+
+class Total(object):
+    '''
+    Prometheus counter per label set, kept in memory of the process.
+    '''
+    type = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.lock = threading.Lock()
+        self.values = Counter()
+
+    def inc(self, labels, value=1):
+        with self.lock:
+            self.values[labels] += value
+
+    def get_samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            yield '', labels, value
+
+
+class Gauge(object):
+    '''
+    Prometheus gauge per label set, kept in memory of the process.
+    '''
+    type = 'gauge'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, labels, value=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def get_samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            yield '', labels, value
+
+
+REQUEST_DURATION = Histogram(
+    'games_request_duration_seconds',
+    'Time spent handling requests.',
+    DURATION_BUCKETS
+)
+DB_DURATION = Histogram(
+    'games_db_duration_seconds',
+    'Time spent running SQL queries per request.',
+    DURATION_BUCKETS
+)
+DB_QUERIES = Histogram(
+    'games_db_queries',
+    'SQL queries run per request.',
+    QUERY_BUCKETS
+)
+SERIALIZE_DURATION = Histogram(
+    'games_serialize_duration_seconds',
+    'Time spent serializing response data per request.',
+    DURATION_BUCKETS
+)
+RENDER_DURATION = Histogram(
+    'games_render_duration_seconds',
+    'Time spent rendering responses.',
+    DURATION_BUCKETS
+)
+RESPONSE_BYTES = Histogram(
+    'games_response_bytes',
+    'Size of response bodies.',
+    BYTES_BUCKETS
+)
+REPEATED_QUERIES = Total(
+    'games_repeated_queries_total',
+    'Requests running the same SQL shape more than '
+    'INSTRUMENTATION_N_PLUS_ONE_THRESHOLD times.'
+)
+SCORE_BUFFER_DEPTH = Gauge(
+    'games_score_buffer_depth',
+    'Scores in the write-behind buffer of the process not stored yet.'
+)
+SCORE_BUFFER_SCORES = Total(
+    'games_score_buffer_scores_total',
+    'Scores accepted into, stored from and dropped by the write-behind '
+    'buffer.'
+)
+SCORE_BUFFER_FLUSH_DURATION = Histogram(
+    'games_score_buffer_flush_duration_seconds',
+    'Time spent storing a segment of the write-behind buffer.',
+    DURATION_BUCKETS
+)
+SCORE_BUFFER_DELAY = Histogram(
+    'games_score_buffer_delay_seconds',
+    'Time from accepting a buffered score to storing it.',
+    DURATION_BUCKETS + (30, 60, 300)
+)
+AUTH_CACHE = Total(
+    'games_basic_auth_cache_total',
+    'Basic authentication verifications served from the cache (hit) or '
+    'checked against the password hash (miss).'
+)
+METRICS = (
+    REQUEST_DURATION, DB_DURATION, DB_QUERIES, SERIALIZE_DURATION,
+    RENDER_DURATION, RESPONSE_BYTES, REPEATED_QUERIES, SCORE_BUFFER_DEPTH,
+    SCORE_BUFFER_SCORES, SCORE_BUFFER_FLUSH_DURATION, SCORE_BUFFER_DELAY,
+    AUTH_CACHE
+)
+
+POOL_STATS = (
+    ('in_use', 'gauge', 'Pooled connections in use.'),
+    ('idle', 'gauge', 'Idle pooled connections.'),
+    ('max_size', 'gauge', 'Maximum size of connection pools.'),
+    ('waits', 'counter', 'Checkouts which waited for a connection.'),
+    ('wait_time', 'counter', 'Seconds spent waiting for connections.'),
+    ('timeouts', 'counter', 'Checkouts which timed out.'),
+)
+
+
+def _format_sample(name, labels, value):
+    if labels:
+        return '{}{{{}}} {}'.format(name, _format_labels(labels), value)
+    return '{} {}'.format(name, value)
+
+
+def expose():
+    '''
+    Returns request, score buffer and authentication cache metrics and
+        connection pool stats of the process in the Prometheus text format.
+    '''
+    lines = []
+    for metric in METRICS:
+        lines.append('# HELP {} {}'.format(metric.name, metric.description))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+        for suffix, labels, value in metric.get_samples():
+            lines.append(_format_sample(metric.name + suffix, labels, value))
+    pools = pool.get_stats()
+    for stat, metric_type, description in POOL_STATS:
+        name = 'games_db_pool_{}'.format(stat)
+        if metric_type == 'counter':
+            name += '_total'
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for alias in sorted(pools):
+            for database in sorted(pools[alias]):
+                lines.append(_format_sample(
+                    name,
+                    (('alias', alias), ('database', database)),
+                    pools[alias][database][stat]
+                ))
+    return '\n'.join(lines) + '\n'
+
+
+class InstrumentationMiddleware(object):
+    '''
+    Records query count, database, serialization and render time and the
+        response size of requests when INSTRUMENTATION_ENABLED setting is
+        True. Timings are sent in a Server-Timing header and added to the
+        histograms of expose(), labeled with the URL name of the view.
+        Requests running one SQL shape more than
+        INSTRUMENTATION_N_PLUS_ONE_THRESHOLD times are logged as warnings.
+
+    Rows a streaming response reads after the view returns aren't counted.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_enabled():
+            return self.get_response(request)
+        recorder = Recorder()
+        _state.recorder = recorder
+        instrument_connections(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            uninstrument_connections()
+            _state.recorder = None
+        total = time.time() - recorder.started
+        response['Server-Timing'] = recorder.get_server_timing(total)
+        self.observe(request, response, recorder, total)
+        return response
+
+    def process_template_response(self, request, response):
+        recorder = get_recorder()
+        if recorder is not None:
+            started = time.time()
+
+            def rendered(response):
+                recorder.add_time('render', time.time() - started)
+            response.add_post_render_callback(rendered)
+        return response
+
+    def observe(self, request, response, recorder, total):
+        match = request.resolver_match
+        labels = (
+            ('view', match.url_name if match is not None else 'unresolved'),
+            ('method', request.method),
+        )
+        REQUEST_DURATION.observe(labels, total)
+        DB_DURATION.observe(labels, recorder.timings['db'])
+        DB_QUERIES.observe(labels, recorder.queries)
+        SERIALIZE_DURATION.observe(labels, recorder.timings['serialize'])
+        RENDER_DURATION.observe(labels, recorder.timings['render'])
+        if not response.streaming:
+            RESPONSE_BYTES.observe(labels, len(response.content))
+        repeated = recorder.get_repeated_queries(
+            getattr(settings, 'INSTRUMENTATION_N_PLUS_ONE_THRESHOLD', 10)
+        )
+        if repeated:
+            REPEATED_QUERIES.inc(labels)
+            for shape, count in repeated:
+                logger.warning(
+                    'Possible N+1 queries: %s %s ran %d times: %s',
+                    request.method, request.path, count, shape
+                )
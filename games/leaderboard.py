@@ -0,0 +1,162 @@
+# django imports
+from django.db import IntegrityError, transaction
+# local imports
+from .models import Game, LeaderboardEntry, PlayerScore, ScoreArchive
+
+
+# Number of players changed at once above which a leaderboard is rebuilt
+# instead of refreshing every player separately.
+REBUILD_THRESHOLD = 50
+
+# Competition rank of an entry: one more than the number of entries of the
+# game with a higher score, counted on the (game, score) index.
+RANK_SQL = (
+    'SELECT COUNT(*) + 1 FROM {table} ranked '
+    'WHERE ranked.game_id = {table}.game_id '
+    'AND ranked.score > {table}.score'
+).format(table=LeaderboardEntry._meta.db_table)
+
+
+def _lock_game(game_id):
+    '''
+    Keeps writers from inserting entries of a game while it's rebuilt.
+    '''
+    list(Game.objects.select_for_update().filter(pk=game_id).values('pk'))
+
+
+def _is_better(score, score_date, than):
+    '''
+    Tells whether a score ranks before a (score, score_date) pair, earlier
+        dates win ties.
+    '''
+    return than is None or (-score, score_date) < (-than[0], than[1])
+
+
+def _best_score(game_id, player_id):
+    '''
+    Returns the best PlayerScore of a player in a game, an unsaved one when
+        the best score was archived.
+    '''
+    best = PlayerScore.objects.filter(
+        game_id=game_id,
+        player_id=player_id
+    ).order_by('-score', 'score_date').only('score', 'score_date').first()
+    archived = ScoreArchive.objects.filter(
+        game_id=game_id,
+        player_id=player_id
+    ).order_by('-best_score', 'best_score_date').only(
+        'best_score', 'best_score_date'
+    ).first()
+    if archived is not None and _is_better(
+            archived.best_score,
+            archived.best_score_date,
+            best and (best.score, best.score_date)):
+        best = PlayerScore(
+            game_id=game_id,
+            player_id=player_id,
+            score=archived.best_score,
+            score_date=archived.best_score_date
+        )
+    return best
+
+
+def with_ranks(queryset):
+    '''
+    Adds the rank of every entry of a LeaderboardEntry queryset as rank
+        attribute. Ranks are computed when they're read, so a write only
+        changes the entry of its own player.
+    '''
+    return queryset.extra(select={'rank': RANK_SQL})
+
+
+def _store_entry(game_id, player_id):
+    '''
+    Saves the best score of a player in a game to the entry of the player,
+        which is locked first so concurrent writers of the same player
+        store their scores one after another. Returns False when the entry
+        is missing and a concurrent writer inserted it first.
+    '''
+    lookup = {'game_id': game_id, 'player_id': player_id}
+    current = LeaderboardEntry.objects.select_for_update().filter(
+        **lookup
+    ).values_list('score', 'score_date').first()
+    best = _best_score(game_id, player_id)
+    if best is None:
+        if current is not None:
+            LeaderboardEntry.objects.filter(**lookup).delete()
+        return True
+    values = {'score': best.score, 'score_date': best.score_date}
+    if current is not None:
+        if current != (best.score, best.score_date):
+            LeaderboardEntry.objects.filter(**lookup).update(**values)
+        return True
+    try:
+        with transaction.atomic():
+            LeaderboardEntry.objects.create(**dict(lookup, **values))
+    except IntegrityError:
+        return False
+    return True
+
+
+def refresh_entry(game_id, player_id):
+    '''
+    Recomputes the best score of a player in a game and stores it in the
+        leaderboard entry of the player. Entries of other players don't
+        change.
+    '''
+    with transaction.atomic():
+        if not _store_entry(game_id, player_id):
+            # the entry inserted concurrently is locked and recomputed,
+            # its best score includes both writers' scores
+            _store_entry(game_id, player_id)
+
+
+def record_score(player_score):
+    '''
+    Updates the leaderboard for a newly created PlayerScore. Scores that
+        don't rank before the current best score of the player, including
+        equal scores of a later date, leave the leaderboard untouched.
+    '''
+    entry = LeaderboardEntry.objects.filter(
+        game_id=player_score.game_id,
+        player_id=player_score.player_id
+    ).values_list('score', 'score_date').first()
+    if entry is not None and not _is_better(
+            player_score.score, player_score.score_date, entry):
+        return
+    refresh_entry(player_score.game_id, player_score.player_id)
+
+
+def rebuild(game_id):
+    '''
+    Rebuilds the whole leaderboard of a game from its PlayerScore rows and
+        archived scores. The game row stays locked until the rebuild is
+        committed; writers inserting an entry meanwhile wait for it and
+        then update the rebuilt entry instead.
+    '''
+    with transaction.atomic():
+        _lock_game(game_id)
+        LeaderboardEntry.objects.filter(game_id=game_id).delete()
+        scores = PlayerScore.objects.filter(game_id=game_id).order_by(
+            'player_id',
+            '-score',
+            'score_date'
+        ).values_list('player_id', 'score', 'score_date')
+        best = {}
+        for player_id, score, score_date in scores.iterator():
+            best.setdefault(player_id, (score, score_date))
+        archived = ScoreArchive.objects.filter(game_id=game_id).values_list(
+            'player_id', 'best_score', 'best_score_date'
+        )
+        for player_id, score, score_date in archived.iterator():
+            if _is_better(score, score_date, best.get(player_id)):
+                best[player_id] = (score, score_date)
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(
+                game_id=game_id,
+                player_id=player_id,
+                score=score,
+                score_date=score_date
+            )
+            for player_id, (score, score_date) in sorted(best.items())
+        ], batch_size=1000)
@@ -0,0 +1,52 @@
+# django imports
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+# local imports
+from games import partitions
+
+
+class Command(BaseCommand):
+    '''
+    Rolls up the scores of the months before the retention period into
+        ScoreArchive rows and drops them, a month at a time, then creates
+        the monthly PlayerScore partitions up to --ahead months after the
+        current one on PostgreSQL. Dropping whole partitions keeps the
+        size of the table and its indexes, and the cost of vacuuming them,
+        flat as scores accumulate. Run it monthly, e.g. from cron; scores
+        of months without a partition are stored in the default partition
+        and moved out when their partition is created.
+    '''
+    help = 'Archives expired scores and creates upcoming partitions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months', type=int,
+            default=getattr(settings, 'SCORE_RETENTION_MONTHS', 24),
+            help='Months of scores kept, the current one included.'
+        )
+        parser.add_argument(
+            '--ahead', type=int,
+            default=getattr(settings, 'SCORE_PARTITIONS_AHEAD', 3),
+            help='Months after the current one to create partitions for.'
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        current = partitions.month_start(timezone.now())
+        cutoff = partitions.add_months(current, 1 - options['months'])
+        month = partitions.get_first_month(using)
+        while month is not None and month < cutoff:
+            archived = partitions.archive_month(month, using)
+            self.stdout.write('Archived {} scores of {:%Y-%m}'.format(
+                archived, month
+            ))
+            month = partitions.add_months(month, 1)
+        if partitions.is_partitioned(using):
+            created = partitions.ensure_partitions(
+                cutoff,
+                partitions.add_months(current, options['ahead']),
+                using
+            )
+            self.stdout.write('Created {} partitions'.format(len(created)))
@@ -0,0 +1,359 @@
+# python imports
+import json
+import re
+import time
+# django imports
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+# rest_framework import
+from rest_framework import throttling
+# local imports
+from games import benchmarks, instrumentation, leaderboard, summaries
+from games.cache import CachedResponseMixin
+from games.models import Game, GameCategory, LeaderboardEntry, Player,\
+    PlayerScore, ScoreBufferSegment
+
+
+PASSWORD = 'benchmark'
+# Buffer segment whose first score playerscore-pending reports as stored
+SEGMENT = '0-0-0'
+
+
+class Command(BaseCommand):
+    '''
+    Drives every endpoint of games/urls.py with the test client and reports
+        latency percentiles, throughput, SQL query count and response size
+        per scenario (list, detail, filtered, ordered, search, fields and
+        create requests). Requests are sent as the benchmark user, which is
+        made staff for the metrics endpoints.
+
+    Responses aren't served from the response cache unless --cached is
+        given, throttles are off and DEBUG is False. Create scenarios run
+        in a transaction rolled back afterwards, so runs don't change the
+        data set. --save writes the results as a baseline, --compare reads
+        one and fails when a scenario runs more queries or its p95 latency
+        grew by more than --tolerance percent. No baseline is shipped:
+        latencies depend on the machine and the data set, so save one with
+        --save on the machine and data the comparison runs on, e.g.
+
+        manage.py benchmark_api --seed --players 10000 --scores 1000000
+        manage.py benchmark_api --save baseline.json
+        (apply a change)
+        manage.py benchmark_api --compare baseline.json
+    '''
+    help = 'Benchmarks all API endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', action='store_true',
+            help='Seed benchmark data up to the given volumes first.'
+        )
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--games', type=int, default=1000)
+        parser.add_argument('--players', type=int, default=10000)
+        parser.add_argument('--scores', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--only', default='',
+            help='Run scenarios whose name matches this regular expression.'
+        )
+        parser.add_argument('--cached', action='store_true')
+        parser.add_argument('--save', metavar='PATH')
+        parser.add_argument('--compare', metavar='PATH')
+        parser.add_argument('--tolerance', type=float, default=20.0)
+
+    def seed(self, options):
+        benchmarks.seed(
+            categories=options['categories'],
+            games=options['games'],
+            players=options['players'],
+            scores=options['scores']
+        )
+        summaries.rebuild()
+        for game_pk in Game.objects.values_list('pk', flat=True).iterator():
+            leaderboard.rebuild(game_pk)
+
+    def get_scenarios(self):
+        '''
+        Returns [(name, method, path, data)], data is a function of the
+            iteration number returning the request body.
+        '''
+        category = GameCategory.objects.order_by('pk').first()
+        game = Game.objects.order_by('pk').first()
+        player = Player.objects.order_by('pk').first()
+        score = PlayerScore.objects.filter(game=game).order_by('pk').first()
+        entry = LeaderboardEntry.objects.filter(game=game).first()
+        if None in (category, game, player, score, entry):
+            raise CommandError('No benchmark data, run with --seed.')
+        user = User.objects.get(username='benchmark')
+        segment = ScoreBufferSegment.objects.get(name=SEGMENT)
+
+        def path(name, **kwargs):
+            return reverse(name, kwargs=kwargs)
+
+        def get(name, url):
+            return (name, 'get', url, None)
+
+        def post(name, url, data):
+            return (name, 'post', url, data)
+
+        prefix = player.name[:-1]
+        return [
+            get('api-root', path('api-root')),
+            get('gamecategory-list', path('gamecategory-list')),
+            get('gamecategory-list search', path('gamecategory-list') +
+                '?search=bench-category-1'),
+            get('gamecategory-detail',
+                path('gamecategory-detail', pk=category.pk)),
+            get('gamecategory-game-list',
+                path('gamecategory-game-list', pk=category.pk)),
+            get('game-list', path('game-list')),
+            get('game-list filtered', path('game-list') +
+                '?game_category={}'.format(category.pk)),
+            get('game-list ordered', path('game-list') +
+                '?ordering=-release_date'),
+            get('game-list search', path('game-list') +
+                '?search={}'.format(game.name)),
+            get('game-list expand', path('game-list') +
+                '?expand=game_category'),
+            get('game-detail', path('game-detail', pk=game.pk)),
+            get('game-stats', path('game-stats', pk=game.pk)),
+            get('game-leaderboard', path('game-leaderboard', pk=game.pk)),
+            get('game-leaderboard-player-rank', path(
+                'game-leaderboard-player-rank',
+                pk=game.pk,
+                player_pk=entry.player_id
+            )),
+            get('player-list', path('player-list')),
+            get('player-list filtered', path('player-list') + '?gender=F'),
+            get('player-list ordered', path('player-list') +
+                '?ordering=-name'),
+            get('player-list search', path('player-list') +
+                '?search={}'.format(prefix)),
+            get('player-list fields', path('player-list') +
+                '?fields=url,name'),
+            get('player-detail', path('player-detail', pk=player.pk)),
+            get('player-score-list',
+                path('player-score-list', pk=player.pk)),
+            get('player-stats', path('player-stats', pk=player.pk)),
+            get('playerscore-list', path('playerscore-list')),
+            get('playerscore-list filtered', path('playerscore-list') +
+                '?min_score=40000&max_score=40100'),
+            get('playerscore-list ordered', path('playerscore-list') +
+                '?ordering=-score_date'),
+            get('playerscore-list game_name', path('playerscore-list') +
+                '?game_name={}'.format(game.name)),
+            get('playerscore-list expand', path('playerscore-list') +
+                '?expand=player,game'),
+            get('playerscore-export', path('playerscore-export') +
+                '?format=ndjson&player_name={}'.format(player.name)),
+            get('playerscore-detail',
+                path('playerscore-detail', pk=score.pk)),
+            get('playerscore-pending', path(
+                'playerscore-pending',
+                tracking_id='{}:0'.format(segment.name)
+            )),
+            get('user-list', path('user-list')),
+            get('user-detail', path('user-detail', pk=user.pk)),
+            get('user-game-list', path('user-game-list', pk=user.pk)),
+            get('change-list', path('change-list')),
+            get('change-list since', path('change-list') + '?since=0'),
+            get('metrics', path('metrics')),
+            get('database-metrics', path('database-metrics')),
+            post('gamecategory-list create', path('gamecategory-list'),
+                 lambda n: {'name': 'bench-new-category-{}'.format(n)}),
+            post('game-list create', path('game-list'), lambda n: {
+                'name': 'bench-new-game-{}'.format(n),
+                'game_category': category.name,
+                'release_date': '2016-01-01T00:00:00Z',
+                'played': False,
+            }),
+            post('player-list create', path('player-list'), lambda n: {
+                'name': 'bench-new-player-{}'.format(n),
+                'gender': 'F',
+            }),
+            post('playerscore-list create', path('playerscore-list'),
+                 lambda n: {
+                     'player': player.name,
+                     'game': game.name,
+                     'score': n,
+                     'score_date': '2016-01-01T00:00:00Z',
+            }),
+            post('playerscore-list bulk create', path('playerscore-list'),
+                 lambda n: [{
+                     'player': player.name,
+                     'game': game.name,
+                     'score': n * 100 + i,
+                     'score_date': '2016-01-01T00:00:00Z',
+                 } for i in range(100)]),
+        ]
+
+    def request(self, client, method, url, data, n):
+        '''
+        Sends one request and returns (seconds, queries, bytes).
+        '''
+        recorder = instrumentation.Recorder()
+        instrumentation.instrument_connections(recorder)
+        try:
+            started = time.time()
+            if data is None:
+                response = getattr(client, method)(url)
+            else:
+                response = getattr(client, method)(
+                    url,
+                    json.dumps(data(n)),
+                    content_type='application/json'
+                )
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+            duration = time.time() - started
+        finally:
+            instrumentation.uninstrument_connections()
+        if response.status_code >= 400:
+            raise CommandError('{} {} returned {}: {}'.format(
+                method.upper(), url, response.status_code,
+                b''.join(response).decode('utf-8')[:500]
+            ))
+        return duration, recorder.queries, size
+
+    def measure(self, client, method, url, data, options):
+        durations, queries, sizes = [], [], []
+        for n in range(options['warmup'] + options['repeat']):
+            duration, count, size = self.request(client, method, url, data, n)
+            if n >= options['warmup']:
+                durations.append(duration)
+                queries.append(count)
+                sizes.append(size)
+        return sorted(durations), queries, sizes
+
+    def run_scenario(self, client, method, url, data, options):
+        if data is None:
+            durations, queries, sizes = self.measure(
+                client, method, url, data, options
+            )
+        else:
+            with transaction.atomic():
+                durations, queries, sizes = self.measure(
+                    client, method, url, data, options
+                )
+                transaction.set_rollback(True)
+        return {
+            'p50': benchmarks.percentile(durations, 50),
+            'p95': benchmarks.percentile(durations, 95),
+            'p99': benchmarks.percentile(durations, 99),
+            'throughput': len(durations) / max(sum(durations), 1e-9),
+            'queries': max(queries),
+            'bytes': max(sizes),
+        }
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options)
+        user = User.objects.get_or_create(username='benchmark')[0]
+        if not user.check_password(PASSWORD) or not user.is_staff:
+            user.set_password(PASSWORD)
+            user.is_staff = True
+            user.save()
+        ScoreBufferSegment.objects.get_or_create(
+            name=SEGMENT, defaults={'scores': 1}
+        )
+        client = Client()
+        client.login(username='benchmark', password=PASSWORD)
+        only = re.compile(options['only'])
+        scenarios = [
+            scenario for scenario in self.get_scenarios()
+            if only.search(scenario[0])
+        ]
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)['scenarios']
+
+        self.stdout.write('{} players, {} games, {} scores on {}'.format(
+            Player.objects.count(),
+            Game.objects.count(),
+            PlayerScore.objects.count(),
+            connections['default'].vendor
+        ))
+        self.stdout.write('{:<32} {:>8} {:>8} {:>8} {:>8} {:>4} {:>8}'.format(
+            'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'sql',
+            'bytes'
+        ))
+        results = {}
+        regressions = []
+        # Rates are looked up by scope when a throttle is created.
+        rates = throttling.SimpleRateThrottle.THROTTLE_RATES
+        uncached_formats = CachedResponseMixin.uncached_formats
+        throttling.SimpleRateThrottle.THROTTLE_RATES = dict(
+            (scope, None) for scope in rates
+        )
+        if not options['cached']:
+            CachedResponseMixin.uncached_formats = uncached_formats + (
+                'json',
+            )
+        try:
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+                for name, method, url, data in scenarios:
+                    result = self.run_scenario(
+                        client, method, url, data, options
+                    )
+                    results[name] = result
+                    self.stdout.write(
+                        '{:<32} {:8.2f} {:8.2f} {:8.2f} {:8.1f} {:4} {:8}'
+                        '{}'.format(
+                            name,
+                            result['p50'] * 1000,
+                            result['p95'] * 1000,
+                            result['p99'] * 1000,
+                            result['throughput'],
+                            result['queries'],
+                            result['bytes'],
+                            self.compare(name, result, baseline.get(name),
+                                         options['tolerance'], regressions)
+                        )
+                    )
+        finally:
+            throttling.SimpleRateThrottle.THROTTLE_RATES = rates
+            CachedResponseMixin.uncached_formats = uncached_formats
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(
+                    {'options': dict(
+                        (key, options[key])
+                        for key in ('repeat', 'warmup', 'cached')
+                    ), 'scenarios': results},
+                    f, indent=2, sort_keys=True
+                )
+            self.stdout.write('Saved baseline to {}'.format(options['save']))
+        if regressions:
+            raise CommandError('Regressions: {}'.format(
+                ', '.join(regressions)
+            ))
+
+    def compare(self, name, result, baseline, tolerance, regressions):
+        '''
+        Returns differences to a baseline result for the report and adds
+            regressions to the list.
+        '''
+        if baseline is None:
+            return ''
+        notes = ['  p95 {:+.0f}%'.format(
+            (result['p95'] / max(baseline['p95'], 1e-9) - 1) * 100
+        )]
+        if result['queries'] != baseline['queries']:
+            notes.append('sql {:+d}'.format(
+                result['queries'] - baseline['queries']
+            ))
+        if result['queries'] > baseline['queries']:
+            regressions.append('{} runs more queries'.format(name))
+        if result['p95'] > baseline['p95'] * (1 + tolerance / 100.0):
+            regressions.append('{} is slower'.format(name))
+        return ' '.join(notes)
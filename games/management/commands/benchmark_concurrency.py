@@ -0,0 +1,213 @@
+# python imports
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+# django imports
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.urlresolvers import reverse
+from django.db.backends.utils import CursorWrapper
+from django.test.utils import override_settings
+# rest_framework import
+from rest_framework import throttling
+# local imports
+from games import benchmarks
+from games.asgi import ASGIHandler
+from games.cache import CachedResponseMixin
+
+
+class Command(BaseCommand):
+    '''
+    Compares the WSGI application served by a pool of --threads worker
+        threads, like a threaded WSGI server, with games.asgi.ASGIHandler
+        running on an event loop with the same number of threads, at 1,
+        100 and 1000 concurrent clients by default. Clients send --requests
+        GET requests one after another, latencies include the time a
+        request waits for a thread.
+
+    --db-latency adds a delay to every SQL query, emulating the round trip
+        to a database on another host, i.e. requests which mostly wait.
+        Responses aren't served from the response cache unless --cached is
+        given, throttles are off and DEBUG is False.
+    '''
+    help = 'Benchmarks the WSGI and ASGI applications under concurrency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', default='1,100,1000')
+        parser.add_argument('--requests', type=int, default=5)
+        parser.add_argument(
+            '--threads', type=int,
+            default=getattr(settings, 'ASGI_THREADS', 20)
+        )
+        parser.add_argument(
+            '--path',
+            help='Path to request, the player list by default.'
+        )
+        parser.add_argument(
+            '--db-latency', type=float, default=0.0, metavar='MS',
+            help='Milliseconds added to every SQL query.'
+        )
+        parser.add_argument('--cached', action='store_true')
+
+    def get_scope(self, path):
+        path, _, query = path.partition('?')
+        return {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'query_string': query.encode('latin-1'),
+            'root_path': '',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'accept', b'application/json'),
+            ],
+            'server': ('testserver', 80),
+            'client': ('127.0.0.1', 0),
+        }
+
+    def call_wsgi(self, application, environ):
+        '''
+        Returns the status of a WSGI request after reading its response.
+        '''
+        status = []
+
+        def start_response(value, headers, exc_info=None):
+            status.append(int(value.split(' ', 1)[0]))
+
+        response = application(environ, start_response)
+        try:
+            for chunk in response:
+                pass
+        finally:
+            response.close()
+        return status[0]
+
+    async def call_asgi(self, application, scope):
+        '''
+        Returns the status of an ASGI request after reading its response.
+        '''
+        status = []
+        received = []
+
+        async def receive():
+            if received:
+                # the request was read, wait as a connected client does
+                await asyncio.sleep(3600)
+            received.append(True)
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await application(scope, receive, send)
+        return status[0]
+
+    def run(self, mode, clients, options):
+        '''
+        Returns sorted latencies, errors and the duration of a run.
+        '''
+        scope = self.get_scope(options['path'])
+        wsgi_application = WSGIHandler()
+        asgi_application = ASGIHandler(wsgi_application, options['threads'])
+        environ = asgi_application.get_environ(scope, b'')
+        pool = ThreadPoolExecutor(options['threads'])
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        durations = []
+        errors = []
+
+        async def request():
+            if mode == 'wsgi':
+                return await loop.run_in_executor(
+                    pool, self.call_wsgi, wsgi_application, dict(environ)
+                )
+            return await self.call_asgi(asgi_application, scope)
+
+        async def client():
+            for _ in range(options['requests']):
+                started = time.time()
+                try:
+                    status = await request()
+                except Exception as exc:
+                    errors.append(repr(exc))
+                    continue
+                durations.append(time.time() - started)
+                if status >= 400:
+                    errors.append(status)
+
+        started = time.time()
+        try:
+            loop.run_until_complete(asyncio.gather(
+                *[client() for _ in range(clients)]
+            ))
+        finally:
+            duration = time.time() - started
+            pool.shutdown()
+            asgi_application.executor.shutdown()
+            loop.close()
+        return sorted(durations), errors, duration
+
+    def handle(self, *args, **options):
+        if not options['path']:
+            options['path'] = reverse('player-list')
+        latency = options['db_latency'] / 1000.0
+        execute = CursorWrapper.execute
+
+        def slow_execute(self, sql, params=None):
+            time.sleep(latency)
+            return execute(self, sql, params)
+
+        # Rates are looked up by scope when a throttle is created.
+        rates = throttling.SimpleRateThrottle.THROTTLE_RATES
+        uncached_formats = CachedResponseMixin.uncached_formats
+        throttling.SimpleRateThrottle.THROTTLE_RATES = dict(
+            (scope, None) for scope in rates
+        )
+        if not options['cached']:
+            CachedResponseMixin.uncached_formats = uncached_formats + (
+                'json',
+            )
+        if latency:
+            CursorWrapper.execute = slow_execute
+        self.stdout.write(
+            'GET {}, {} threads, {:.1f} ms per query'.format(
+                options['path'], options['threads'], options['db_latency']
+            )
+        )
+        self.stdout.write('{:<5} {:>7} {:>9} {:>9} {:>9} {:>9} {:>7}'.format(
+            'mode', 'clients', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+            'errors'
+        ))
+        try:
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+                for clients in [
+                        int(value) for value in options['clients'].split(',')]:
+                    for mode in ('wsgi', 'asgi'):
+                        durations, errors, duration = self.run(
+                            mode, clients, options
+                        )
+                        self.stdout.write(
+                            '{:<5} {:>7} {:9.1f} {:9.2f} {:9.2f} {:9.2f} '
+                            '{:>7}'.format(
+                                mode,
+                                clients,
+                                len(durations) / max(duration, 1e-9),
+                                benchmarks.percentile(durations, 50) * 1000,
+                                benchmarks.percentile(durations, 95) * 1000,
+                                benchmarks.percentile(durations, 99) * 1000,
+                                len(errors)
+                            )
+                        )
+                        if errors:
+                            self.stderr.write('  first error: {}'.format(
+                                errors[0]
+                            ))
+        finally:
+            CursorWrapper.execute = execute
+            throttling.SimpleRateThrottle.THROTTLE_RATES = rates
+            CachedResponseMixin.uncached_formats = uncached_formats
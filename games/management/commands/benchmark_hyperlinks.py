@@ -0,0 +1,99 @@
+# django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+# rest_framework import
+from rest_framework import relations
+from rest_framework.request import Request
+from rest_framework.reverse import reverse
+# local imports
+from games import benchmarks, hyperlinks
+from games.models import PlayerScore
+from games.serializers import ScoreGameSerializer, ScoreSerializer
+
+
+class ReversingScoreGameSerializer(ScoreGameSerializer):
+    serializer_url_field = relations.HyperlinkedIdentityField
+
+
+class ReversingScoreSerializer(ScoreSerializer):
+    '''
+    ScoreSerializer building its links with reverse() of rest_framework,
+        the baseline of the benchmark.
+    '''
+    serializer_url_field = relations.HyperlinkedIdentityField
+    game = ReversingScoreGameSerializer()
+
+
+class Command(BaseCommand):
+    '''
+    Checks that links built from the precompiled URL templates equal the
+        ones of reverse() and compares their speed, for single links and
+        for serializing a large list of scores.
+    '''
+    help = 'Benchmarks hyperlink generation against reverse().'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scores', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def report(self, name, baseline, durations):
+        self.stdout.write(
+            '{:<28} reverse p50 {:8.2f} ms  templates p50 {:8.2f} ms  '
+            'x{:.1f}'.format(
+                name,
+                benchmarks.percentile(baseline, 50) * 1000,
+                benchmarks.percentile(durations, 50) * 1000,
+                benchmarks.percentile(baseline, 50) /
+                max(benchmarks.percentile(durations, 50), 1e-9)
+            )
+        )
+
+    def handle(self, *args, **options):
+        request = Request(RequestFactory().get('/'))
+        pks = [1, 42, 1000000]
+        templates = hyperlinks.get_url_templates()
+        for name in sorted(templates):
+            for pk in pks:
+                expected = reverse(name, kwargs={'pk': pk}, request=request)
+                built = hyperlinks.build_url(name, pk, request)
+                if built != expected:
+                    raise CommandError(
+                        '{} != {} for {}'.format(built, expected, name)
+                    )
+        self.stdout.write('{} routes build the same links as reverse()'.format(
+            len(templates)
+        ))
+
+        links = [(name, pk) for name in templates for pk in pks] * 100
+        self.report(
+            '{} single links'.format(len(links)),
+            benchmarks.timed(lambda: [
+                reverse(name, kwargs={'pk': pk}, request=request)
+                for name, pk in links
+            ], options['repeat']),
+            benchmarks.timed(lambda: [
+                hyperlinks.build_url(name, pk, request)
+                for name, pk in links
+            ], options['repeat'])
+        )
+
+        scores = list(PlayerScore.objects.select_related(
+            'game__owner',
+            'game__game_category'
+        )[:options['scores']])
+        context = {'request': request}
+        expected = ReversingScoreSerializer(
+            scores, many=True, context=context
+        ).data
+        if ScoreSerializer(scores, many=True, context=context).data != \
+                expected:
+            raise CommandError('Serialized scores differ')
+        self.report(
+            '{} serialized scores'.format(len(scores)),
+            benchmarks.timed(lambda: ReversingScoreSerializer(
+                scores, many=True, context=context
+            ).data, options['repeat']),
+            benchmarks.timed(lambda: ScoreSerializer(
+                scores, many=True, context=context
+            ).data, options['repeat'])
+        )
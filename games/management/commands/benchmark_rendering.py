@@ -0,0 +1,101 @@
+# python imports
+from io import BytesIO
+# django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+# rest_framework import
+from rest_framework import parsers, renderers
+from rest_framework.request import Request
+# local imports
+from games import benchmarks
+from games.models import Game, PlayerScore
+from games.parsers import JSONParser, orjson
+from games.renderers import JSONRenderer
+from games.serializers import GameSerializer, PlainColumnsMixin,\
+    PlayerScoreSerializer
+
+
+class Command(BaseCommand):
+    '''
+    Compares the rendering path of rest_framework (every field through
+        Field.to_representation, stdlib json) with the games path (plain
+        columns read directly, games JSONRenderer and JSONParser) on list
+        payloads of scores and games. Both paths must produce the same
+        bytes.
+    '''
+    help = 'Benchmarks serialization, JSON rendering and parsing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scores', type=int, default=1000)
+        parser.add_argument('--games', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def render(self, serializer_class, instances, renderer, plain_columns):
+        request = Request(RequestFactory().get('/'))
+        request.accepted_renderer = renderer
+        PlainColumnsMixin.plain_columns = plain_columns
+        try:
+            data = serializer_class(
+                instances,
+                many=True,
+                context={'request': request}
+            ).data
+        finally:
+            PlainColumnsMixin.plain_columns = True
+        return renderer.render(data)
+
+    def report(self, name, rows, baseline, durations):
+        baseline = benchmarks.percentile(baseline, 50)
+        durations = benchmarks.percentile(durations, 50)
+        self.stdout.write(
+            '{:<22} rest_framework {:9.0f} rows/s  games {:9.0f} rows/s  '
+            'x{:.1f}'.format(
+                name,
+                rows / max(baseline, 1e-9),
+                rows / max(durations, 1e-9),
+                baseline / max(durations, 1e-9)
+            )
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('orjson {}'.format(
+            'installed' if orjson is not None else 'not installed'
+        ))
+        payloads = [
+            ('player-scores', PlayerScoreSerializer, list(
+                PlayerScore.objects.select_related('player', 'game')[
+                    :options['scores']
+                ]
+            )),
+            ('games', GameSerializer, list(Game.objects.select_related(
+                'owner', 'game_category', 'summary'
+            )[:options['games']])),
+        ]
+        for name, serializer_class, instances in payloads:
+            expected = self.render(
+                serializer_class, instances, renderers.JSONRenderer(), False
+            )
+            if self.render(serializer_class, instances, JSONRenderer(),
+                           True) != expected:
+                raise CommandError('Rendered {} differ'.format(name))
+            self.report(
+                'render ' + name,
+                len(instances),
+                benchmarks.timed(lambda: self.render(
+                    serializer_class, instances,
+                    renderers.JSONRenderer(), False
+                ), options['repeat']),
+                benchmarks.timed(lambda: self.render(
+                    serializer_class, instances, JSONRenderer(), True
+                ), options['repeat'])
+            )
+            self.report(
+                'parse ' + name,
+                len(instances),
+                benchmarks.timed(lambda: parsers.JSONParser().parse(
+                    BytesIO(expected)
+                ), options['repeat']),
+                benchmarks.timed(lambda: JSONParser().parse(
+                    BytesIO(expected)
+                ), options['repeat'])
+            )
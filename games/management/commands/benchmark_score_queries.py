@@ -0,0 +1,100 @@
+# django imports
+from django.core.management.base import BaseCommand
+# local imports
+from games import benchmarks
+from games.models import Game, Player, PlayerScore
+from games.pagination import KeysetPagination
+
+
+class Command(BaseCommand):
+    '''
+    Prints query plans and latency of the PlayerScore access paths used by
+        PlayerScoreFilter, ordering and keyset pagination.
+    Compare indexes by running it before and after the index migration,
+        e.g. `migrate games 0005`, benchmark, `migrate games`, benchmark.
+    '''
+    help = 'Benchmarks PlayerScore list queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scores', type=int, default=0,
+            help='Seed benchmark data up to this number of scores.'
+        )
+        parser.add_argument('--players', type=int, default=10000)
+        parser.add_argument('--games', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--plans', action='store_true')
+
+    def get_keyset_page(self, scores, fraction):
+        '''
+        Returns the queryset of the keyset page after the row at fraction
+            of the default ordering, filtered as KeysetPagination does.
+        '''
+        ordered = scores.order_by('-score', 'pk')
+        offset = int(scores.count() * fraction)
+        position = ordered[offset:offset + 1].values_list(
+            'score', 'pk'
+        ).first() or (0, 0)
+        pagination = KeysetPagination()
+        pagination.ordering = ('-score', 'pk')
+        return ordered.filter(
+            pagination._keyset_filter(position, reverse=False)
+        )
+
+    def get_querysets(self):
+        scores = PlayerScore.objects.all()
+        game = Game.objects.order_by('pk').first()
+        player = Player.objects.order_by('pk').first()
+        dates = scores.order_by('score_date').values_list(
+            'score_date', flat=True
+        )
+        first_date = dates.first()
+        last_date = dates.last()
+        return [
+            ('default ordering', scores.order_by('-score', 'pk')),
+            ('keyset page near the start',
+             self.get_keyset_page(scores, 0.01)),
+            ('keyset page in the middle', self.get_keyset_page(scores, 0.5)),
+            ('keyset page near the end', self.get_keyset_page(scores, 0.99)),
+            ('game_name ordered by score', scores.filter(
+                game__name=getattr(game, 'name', '')
+            ).order_by('-score', 'pk')),
+            ('score range', scores.filter(
+                score__gte=40000,
+                score__lte=40100
+            ).order_by('-score', 'pk')),
+            ('score_date range', scores.filter(
+                score_date__gte=last_date,
+                score_date__lte=last_date
+            ).order_by('score_date', 'pk') if last_date else scores.none()),
+            ('ordering by score_date', scores.order_by('score_date', 'pk')),
+            ('player_name by recent', scores.filter(
+                player__name=getattr(player, 'name', '')
+            ).order_by('-score_date')),
+            ('oldest score_date range', scores.filter(
+                score_date__lte=first_date
+            ).order_by('score_date', 'pk') if first_date else scores.none()),
+        ]
+
+    def handle(self, *args, **options):
+        if options['scores']:
+            benchmarks.seed(
+                games=options['games'],
+                players=options['players'],
+                scores=options['scores']
+            )
+        self.stdout.write('{} scores'.format(PlayerScore.objects.count()))
+        for name, queryset in self.get_querysets():
+            page = queryset[:10]
+            durations = benchmarks.timed(
+                lambda: list(page.all()),
+                options['repeat']
+            )
+            self.stdout.write('{:<28} p50 {:8.2f} ms  p95 {:8.2f} ms'.format(
+                name,
+                benchmarks.percentile(durations, 50) * 1000,
+                benchmarks.percentile(durations, 95) * 1000
+            ))
+            if options['plans']:
+                for line in benchmarks.explain(page):
+                    self.stdout.write('    ' + line)
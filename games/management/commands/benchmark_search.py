@@ -0,0 +1,83 @@
+# django imports
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+# rest_framework import
+from rest_framework import filters
+from rest_framework.request import Request
+# local imports
+from games import benchmarks
+from games.filters import NameSearchFilter
+from games.models import Player
+from games.views import PlayerList
+
+
+class Command(BaseCommand):
+    '''
+    Compares the query plans and latency of player name search through
+        rest_framework SearchFilter (name__istartswith) with the prefix and
+        fuzzy modes of NameSearchFilter, for selective, broad, missing and
+        misspelled terms. Compare indexes by running it before and after
+        the index migration, e.g. `migrate games 0008`, benchmark,
+        `migrate games`, benchmark.
+    '''
+    help = 'Benchmarks name search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--players', type=int, default=0,
+            help='Seed benchmark data up to this number of players.'
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--plans', action='store_true')
+
+    def search(self, backend, term, mode=None):
+        params = {'search': term}
+        if mode is not None:
+            params['search_mode'] = mode
+        request = Request(RequestFactory().get('/', params))
+        return backend.filter_queryset(
+            request, Player.objects.all(), PlayerList()
+        )
+
+    def get_querysets(self):
+        player = Player.objects.order_by('-pk').first()
+        name = getattr(player, 'name', 'bench-player-0')
+        terms = [
+            ('selective', name),
+            ('broad', name[:-2]),
+            ('no match', 'no-such-player'),
+        ]
+        querysets = []
+        for label, term in terms:
+            querysets.extend([
+                ('{} istartswith'.format(label),
+                 self.search(filters.SearchFilter(), term)),
+                ('{} prefix'.format(label),
+                 self.search(NameSearchFilter(), term)),
+            ])
+        # a typo: two characters swapped
+        typo = name[:-2] + name[-1] + name[-2]
+        querysets.extend([
+            ('typo icontains', Player.objects.filter(name__icontains=typo)),
+            ('typo fuzzy', self.search(NameSearchFilter(), typo, 'fuzzy')),
+        ])
+        return querysets
+
+    def handle(self, *args, **options):
+        if options['players']:
+            benchmarks.seed(players=options['players'], scores=0)
+        self.stdout.write('{} players'.format(Player.objects.count()))
+        for name, queryset in self.get_querysets():
+            page = queryset[:10]
+            durations = benchmarks.timed(
+                lambda: list(page.all()),
+                options['repeat']
+            )
+            self.stdout.write('{:<24} p50 {:8.2f} ms  p95 {:8.2f} ms'.format(
+                name,
+                benchmarks.percentile(durations, 50) * 1000,
+                benchmarks.percentile(durations, 95) * 1000
+            ))
+            if options['plans']:
+                for line in benchmarks.explain(page):
+                    self.stdout.write('    ' + line)
@@ -0,0 +1,40 @@
+# python imports
+import os
+from datetime import timedelta
+# django imports
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+# local imports
+from games import ingestion
+from games.models import ScoreBufferSegment
+
+
+class Command(BaseCommand):
+    '''
+    Stores the write-behind buffer segments which no running process holds,
+        i.e. those left behind by worker processes which stopped or
+        crashed before their flusher stored them. Segments of running
+        processes are left to their flusher, so it's safe to run any time,
+        e.g. from cron or after a deploy.
+    '''
+    help = 'Stores scores left in the write-behind buffer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prune', type=int, metavar='DAYS',
+            help='Delete records of segments stored more than DAYS ago, '
+                 'their tracking ids become unknown.'
+        )
+
+    def handle(self, *args, **options):
+        directory = settings.SCORE_BUFFER_DIR
+        recovered = 0
+        if os.path.isdir(directory):
+            recovered = ingestion.recover(directory)
+        self.stdout.write('Stored {} segments'.format(recovered))
+        if options['prune'] is not None:
+            deleted, counts = ScoreBufferSegment.objects.filter(
+                stored__lt=timezone.now() - timedelta(days=options['prune'])
+            ).delete()
+            self.stdout.write('Pruned {} segment records'.format(deleted))
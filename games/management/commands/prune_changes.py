@@ -0,0 +1,33 @@
+# python imports
+from datetime import timedelta
+# django imports
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+# local imports
+from games import changes
+
+
+class Command(BaseCommand):
+    '''
+    Deletes the changes of the change feed recorded more than --days days
+        ago, so the Change table doesn't grow with every write. Run it
+        daily, e.g. from cron. The latest change is kept, seqs of new
+        changes follow it.
+    '''
+    help = 'Deletes old changes of the change feed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            default=getattr(settings, 'CHANGE_RETENTION_DAYS', 30),
+            help='Days of changes kept.'
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        deleted = changes.prune(
+            timezone.now() - timedelta(days=options['days']),
+            options['database']
+        )
+        self.stdout.write('Deleted {} changes'.format(deleted))
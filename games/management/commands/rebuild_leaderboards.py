@@ -0,0 +1,25 @@
+# django imports
+from django.core.management.base import BaseCommand
+# local imports
+from games import leaderboard
+from games.models import Game
+
+
+class Command(BaseCommand):
+    '''
+    Rebuilds precomputed game leaderboards from PlayerScore rows.
+    Used to fill leaderboards of existing scores and to repair them after
+        writes that bypass model signals (e.g. QuerySet.update).
+    '''
+    help = 'Rebuilds leaderboards of all or the given games.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('game_pks', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        games = Game.objects.all()
+        if options['game_pks']:
+            games = games.filter(pk__in=options['game_pks'])
+        for game_pk in games.values_list('pk', flat=True).iterator():
+            leaderboard.rebuild(game_pk)
+            self.stdout.write('Rebuilt leaderboard of game {}'.format(game_pk))
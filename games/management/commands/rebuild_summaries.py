@@ -0,0 +1,24 @@
+# django imports
+from django.core.management.base import BaseCommand
+# local imports
+from games import summaries
+from games.models import GameSummary, PlayerGameSummary, PlayerSummary
+
+
+class Command(BaseCommand):
+    '''
+    Rebuilds precomputed player and game score summaries from PlayerScore
+        rows. Used to fill summaries of existing scores and to repair them
+        after writes that bypass model signals (e.g. QuerySet.update).
+    '''
+    help = 'Rebuilds player and game score summaries.'
+
+    def handle(self, *args, **options):
+        summaries.rebuild()
+        self.stdout.write(
+            'Rebuilt {} player game, {} player and {} game summaries'.format(
+                PlayerGameSummary.objects.count(),
+                PlayerSummary.objects.count(),
+                GameSummary.objects.count()
+            )
+        )
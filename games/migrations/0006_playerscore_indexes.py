@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# Indexes matched to the PlayerScoreFilter and ordering workload. Mixed
+# sort directions (score DESC, id ASC) follow the keyset pagination order,
+# which Django 1.10 can't declare on models.
+INDEXES = (
+    ('games_playerscore_score_id', '(score DESC, id)'),
+    ('games_playerscore_game_score_id', '(game_id, score DESC, id)'),
+    ('games_playerscore_player_date', '(player_id, score_date DESC)'),
+    ('games_playerscore_date_id', '(score_date, id)'),
+)
+
+
+def create_brin_index(apps, schema_editor):
+    '''
+    Block range index for score_date range filters. Scores are inserted
+        roughly in score_date order, so a BRIN index stays tiny on
+        PostgreSQL while still pruning most of the table.
+    '''
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX games_playerscore_date_brin '
+            'ON games_playerscore USING brin (score_date)'
+        )
+
+
+def drop_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX games_playerscore_date_brin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0005_auto_20261017_2224'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            ['CREATE INDEX {} ON games_playerscore {}'.format(name, columns)],
+            ['DROP INDEX {}'.format(name)]
+        )
+        for name, columns in INDEXES
+    ] + [
+        migrations.RunPython(create_brin_index, drop_brin_index),
+    ]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-17 22:34
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0006_playerscore_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameSummary',
+            fields=[
+                ('score_count', models.PositiveIntegerField(default=0)),
+                ('score_total', models.BigIntegerField(default=0)),
+                ('best_score', models.IntegerField(null=True)),
+                ('last_played', models.DateTimeField(null=True)),
+                ('game', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='games.Game')),
+                ('players_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='PlayerGameSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score_count', models.PositiveIntegerField(default=0)),
+                ('score_total', models.BigIntegerField(default=0)),
+                ('best_score', models.IntegerField(null=True)),
+                ('last_played', models.DateTimeField(null=True)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='player_summaries', to='games.Game')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlayerSummary',
+            fields=[
+                ('score_count', models.PositiveIntegerField(default=0)),
+                ('score_total', models.BigIntegerField(default=0)),
+                ('best_score', models.IntegerField(null=True)),
+                ('last_played', models.DateTimeField(null=True)),
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='games.Player')),
+                ('games_played', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='playergamesummary',
+            name='player',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='game_summaries', to='games.Player'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='playergamesummary',
+            unique_together=set([('player', 'game')]),
+        ),
+    ]
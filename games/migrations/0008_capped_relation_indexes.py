@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-17 22:40
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('games', '0007_auto_20261017_2234'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='game',
+            index_together=set([('owner', 'name'), ('game_category', 'name')]),
+        ),
+        # Best scores of a player first, as listed by capped nested scores
+        # and /players/<pk>/scores/.
+        migrations.RunSQL(
+            [
+                'CREATE INDEX games_playerscore_player_score_id '
+                'ON games_playerscore (player_id, score DESC, id)'
+            ],
+            ['DROP INDEX games_playerscore_player_score_id']
+        ),
+    ]
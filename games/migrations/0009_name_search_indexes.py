@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# Tables searched by games.filters.NameSearchFilter.
+TABLES = ('games_gamecategory', 'games_game', 'games_player')
+
+
+def create_search_indexes(apps, schema_editor):
+    '''
+    Expression indexes on UPPER(name) for case-insensitive prefix search.
+        On PostgreSQL text_pattern_ops lets LIKE 'PREFIX%' use the index
+        whatever the collation, and pg_trgm GIN indexes serve fuzzy
+        search with the % operator.
+    '''
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in TABLES:
+        if vendor == 'postgresql':
+            schema_editor.execute(
+                'CREATE INDEX {0}_name_upper_prefix '
+                'ON {0} (UPPER(name) text_pattern_ops)'.format(table)
+            )
+            schema_editor.execute(
+                'CREATE INDEX {0}_name_trgm '
+                'ON {0} USING gin (name gin_trgm_ops)'.format(table)
+            )
+        elif vendor == 'sqlite':
+            schema_editor.execute(
+                'CREATE INDEX {0}_name_upper ON {0} (UPPER(name))'.format(
+                    table
+                )
+            )
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table in TABLES:
+        if vendor == 'postgresql':
+            schema_editor.execute(
+                'DROP INDEX {}_name_upper_prefix'.format(table)
+            )
+            schema_editor.execute('DROP INDEX {}_name_trgm'.format(table))
+        elif vendor == 'sqlite':
+            schema_editor.execute('DROP INDEX {}_name_upper'.format(table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0008_capped_relation_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
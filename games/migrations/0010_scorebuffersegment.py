@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-17 23:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0009_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreBufferSegment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('scores', models.PositiveIntegerField()),
+                ('dropped', models.PositiveIntegerField(default=0)),
+                ('stored', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
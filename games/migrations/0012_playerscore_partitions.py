@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+# Monthly partitions created ahead of the current month.
+MONTHS_AHEAD = 3
+
+
+def get_indexes(schema_editor):
+    '''
+    Returns the definitions of the indexes of games_playerscore but its
+        primary key.
+    '''
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes "
+            "WHERE tablename = 'games_playerscore' "
+            "AND indexname <> 'games_playerscore_pkey'"
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def copy_scores(schema_editor, create):
+    '''
+    Replaces games_playerscore by the table create() creates, keeping
+        its rows, indexes and id sequence.
+    '''
+    indexes = get_indexes(schema_editor)
+    schema_editor.execute(
+        'ALTER SEQUENCE games_playerscore_id_seq OWNED BY NONE'
+    )
+    schema_editor.execute(
+        'ALTER TABLE games_playerscore RENAME TO games_playerscore_old'
+    )
+    # frees the name of the primary key index for the new table
+    schema_editor.execute(
+        'ALTER TABLE games_playerscore_old RENAME CONSTRAINT '
+        'games_playerscore_pkey TO games_playerscore_old_pkey'
+    )
+    create()
+    schema_editor.execute(
+        'INSERT INTO games_playerscore '
+        '(id, score, score_date, game_id, player_id) '
+        'SELECT id, score, score_date, game_id, player_id '
+        'FROM games_playerscore_old'
+    )
+    schema_editor.execute('DROP TABLE games_playerscore_old')
+    schema_editor.execute(
+        'ALTER SEQUENCE games_playerscore_id_seq '
+        'OWNED BY games_playerscore.id'
+    )
+    for definition in indexes:
+        schema_editor.execute(definition)
+
+
+def create_table(schema_editor, primary_key, options=''):
+    schema_editor.execute(
+        'CREATE TABLE games_playerscore ('
+        'id integer NOT NULL '
+        "DEFAULT nextval('games_playerscore_id_seq'), "
+        'score integer NOT NULL, '
+        'score_date timestamp with time zone NOT NULL, '
+        'game_id integer NOT NULL REFERENCES games_game (id) '
+        'DEFERRABLE INITIALLY DEFERRED, '
+        'player_id integer NOT NULL REFERENCES games_player (id) '
+        'DEFERRABLE INITIALLY DEFERRED, '
+        'PRIMARY KEY ({})){}'.format(primary_key, options)
+    )
+
+
+def get_months(schema_editor):
+    '''
+    Returns the first days of the months from the oldest score to
+        MONTHS_AHEAD months after the current one.
+    '''
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT date_trunc('month', MIN(score_date) AT TIME ZONE 'UTC') "
+            "FROM games_playerscore"
+        )
+        first = cursor.fetchone()[0]
+    now = timezone.now()
+    last = (now.year * 12 + now.month - 1) + MONTHS_AHEAD
+    index = last if first is None else first.year * 12 + first.month - 1
+    months = []
+    while index <= last:
+        months.append(datetime(
+            index // 12, index % 12 + 1, 1, tzinfo=timezone.utc
+        ))
+        index += 1
+    return months
+
+
+def partition_scores(apps, schema_editor):
+    '''
+    Turns games_playerscore into a table partitioned by month of
+        score_date on PostgreSQL (11 and later), so score_date ranges only
+        scan the partitions they cover and games.partitions drops expired
+        months whole. The primary key of a partitioned table must include
+        the partition key, it becomes (id, score_date); ids still come
+        from the sequence alone. Rows outside the monthly partitions go to
+        games_playerscore_default. The table is rewritten, which takes an
+        exclusive lock for the duration of the copy.
+    '''
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    months = get_months(schema_editor)
+
+    def create_partitioned_table():
+        create_table(
+            schema_editor,
+            'id, score_date',
+            ' PARTITION BY RANGE (score_date)'
+        )
+        schema_editor.execute(
+            'CREATE TABLE games_playerscore_default '
+            'PARTITION OF games_playerscore DEFAULT'
+        )
+        for month in months:
+            end = month.replace(
+                year=month.year + month.month // 12,
+                month=month.month % 12 + 1
+            )
+            schema_editor.execute(
+                'CREATE TABLE games_playerscore_p{:%Y_%m} '
+                'PARTITION OF games_playerscore '
+                'FOR VALUES FROM (%s) TO (%s)'.format(month),
+                [month, end]
+            )
+
+    copy_scores(schema_editor, create_partitioned_table)
+
+
+def unpartition_scores(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    copy_scores(
+        schema_editor,
+        lambda: create_table(schema_editor, 'id')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0011_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score_count', models.PositiveIntegerField(default=0)),
+                ('score_total', models.BigIntegerField(default=0)),
+                ('best_score', models.IntegerField(null=True)),
+                ('last_played', models.DateTimeField(null=True)),
+                ('month', models.DateField()),
+                ('best_score_date', models.DateTimeField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_scores', to='games.Game')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_scores', to='games.Player')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='scorearchive',
+            index_together=set([('player', 'game'), ('game', 'best_score')]),
+        ),
+        migrations.RunPython(partition_scores, unpartition_scores),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 00:07
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0013_leaderboard_ranks_on_read'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=255, unique=True)),
+                ('version', models.BigIntegerField()),
+                ('written', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReplicaPin',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client', models.CharField(max_length=255, unique=True)),
+                ('expires', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -36,6 +36,10 @@ class Game(models.Model):
 
     class Meta:
         ordering = ('name',)
+        index_together = (
+            ('game_category', 'name'),
+            ('owner', 'name'),
+        )
 
     def __str__(self):
         return self.name
@@ -76,6 +80,10 @@ class PlayerScore(models.Model):
     PlayerScore.models
 
     Has two foreign keys to Player and Game models
+
+    On PostgreSQL the table is partitioned by month of score_date and
+        scores older than SCORE_RETENTION_MONTHS are rolled up into
+        ScoreArchive (see the partitions module).
     '''
     player = models.ForeignKey(
         Player,
@@ -88,3 +96,223 @@ class PlayerScore(models.Model):
 
     class Meta:
         ordering = ('-score',)
+
+
+class LeaderboardEntry(models.Model):
+    '''
+    LeaderboardEntry.models
+
+    Denormalized best score of a player in a game. Entries are maintained
+        by the leaderboard module on every PlayerScore write, so top-N and
+        rank-of lookups are answered from the (game, score) and
+        (game, player) indexes instead of sorting PlayerScore rows. Ranks
+        aren't stored, leaderboard.with_ranks counts the higher scores of
+        the game when entries are read.
+    '''
+    game = models.ForeignKey(
+        Game,
+        related_name='leaderboard',
+        on_delete=models.CASCADE
+    )
+    player = models.ForeignKey(
+        Player,
+        related_name='leaderboard_entries',
+        on_delete=models.CASCADE
+    )
+    score = models.IntegerField()
+    score_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-score', 'score_date')
+        unique_together = ('game', 'player')
+        index_together = (
+            ('game', 'score'),
+        )
+
+
+class ThrottleCounter(models.Model):
+    '''
+    ThrottleCounter.models
+
+    Number of requests made with a throttle key in a fixed time window.
+        Used by DatabaseThrottleStore to share request rates between
+        worker processes with atomic increments.
+    '''
+    key = models.CharField(max_length=255)
+    window = models.BigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('key', 'window')
+
+
+class CacheTag(models.Model):
+    '''
+    CacheTag.models
+
+    Version of a response cache tag, bumped with an atomic update on every
+        write behind the tag (see cache.invalidate). Kept out of the cache
+        itself, so culling never evicts a version and worker processes
+        never lose a concurrent bump.
+    '''
+    tag = models.CharField(max_length=255, unique=True)
+    version = models.BigIntegerField()
+    written = models.DateTimeField(null=True)
+
+
+class ReplicaPin(models.Model):
+    '''
+    ReplicaPin.models
+
+    Client whose reads stay on the primary database until expires, so it
+        reads its own writes (see routers.pin_to_primary).
+    '''
+    client = models.CharField(max_length=255, unique=True)
+    expires = models.DateTimeField(db_index=True)
+
+
+class ScoreSummary(models.Model):
+    '''
+    ScoreSummary.models
+
+    Common aggregates of a set of PlayerScore rows. Summaries are maintained
+        by the summaries module on every PlayerScore write, so the numbers
+        are read from a single row instead of scanning the scores.
+    '''
+    score_count = models.PositiveIntegerField(default=0)
+    score_total = models.BigIntegerField(default=0)
+    best_score = models.IntegerField(null=True)
+    last_played = models.DateTimeField(null=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def average_score(self):
+        if not self.score_count:
+            return None
+        return float(self.score_total) / self.score_count
+
+
+class PlayerGameSummary(ScoreSummary):
+    '''
+    PlayerGameSummary.ScoreSummary.models
+
+    Aggregates of the scores of a player in a game. Player and game
+        summaries are computed from these rows.
+    '''
+    player = models.ForeignKey(
+        Player,
+        related_name='game_summaries',
+        on_delete=models.CASCADE
+    )
+    game = models.ForeignKey(
+        Game,
+        related_name='player_summaries',
+        on_delete=models.CASCADE
+    )
+
+    class Meta:
+        unique_together = ('player', 'game')
+
+
+class PlayerSummary(ScoreSummary):
+    '''
+    PlayerSummary.ScoreSummary.models
+
+    Aggregates of all scores of a player.
+    '''
+    player = models.OneToOneField(
+        Player,
+        related_name='summary',
+        primary_key=True,
+        on_delete=models.CASCADE
+    )
+    games_played = models.PositiveIntegerField(default=0)
+
+
+class GameSummary(ScoreSummary):
+    '''
+    GameSummary.ScoreSummary.models
+
+    Aggregates of all scores of a game.
+    '''
+    game = models.OneToOneField(
+        Game,
+        related_name='summary',
+        primary_key=True,
+        on_delete=models.CASCADE
+    )
+    players_count = models.PositiveIntegerField(default=0)
+
+
+class ScoreArchive(ScoreSummary):
+    '''
+    ScoreArchive.ScoreSummary.models
+
+    Aggregates of the scores of a player in a game in a month whose
+        PlayerScore rows were dropped after the retention period (see the
+        partitions module). Summaries and leaderboards count archived
+        scores along with PlayerScore rows. Scores of a month that arrive
+        after it was archived add another row when they're archived.
+    '''
+    player = models.ForeignKey(
+        Player,
+        related_name='archived_scores',
+        on_delete=models.CASCADE
+    )
+    game = models.ForeignKey(
+        Game,
+        related_name='archived_scores',
+        on_delete=models.CASCADE
+    )
+    month = models.DateField()
+    best_score_date = models.DateTimeField()
+
+    class Meta:
+        index_together = (
+            ('player', 'game'),
+            ('game', 'best_score'),
+        )
+
+
+class ScoreBufferSegment(models.Model):
+    '''
+    ScoreBufferSegment.models
+
+    Segment of the write-behind score buffer whose scores were stored.
+        Recorded in the transaction inserting the scores, so a segment
+        flushed again after a crash isn't stored twice, and used to answer
+        status lookups of tracking ids (see the ingestion module).
+    '''
+    name = models.CharField(max_length=100, unique=True)
+    scores = models.PositiveIntegerField()
+    dropped = models.PositiveIntegerField(default=0)
+    stored = models.DateTimeField(auto_now_add=True)
+
+
+class Change(models.Model):
+    '''
+    Change.models
+
+    Create, update or delete of a GameCategory, Game, Player or PlayerScore
+        row, recorded by signal receivers of the games app. Rows are
+        inserted without seq, which is assigned in commit order once the
+        inserting transaction is committed (see the changes module), so
+        clients syncing with seq cursors don't skip changes of slow
+        transactions. Old changes are deleted by the prune_changes command.
+    '''
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTION_CHOICES = (
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    )
+    id = models.BigAutoField(primary_key=True)
+    seq = models.BigIntegerField(null=True, unique=True)
+    model = models.CharField(max_length=20)
+    object_id = models.IntegerField()
+    action = models.CharField(max_length=6, choices=ACTION_CHOICES)
+    created = models.DateTimeField(auto_now_add=True)
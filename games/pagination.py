@@ -1,5 +1,20 @@
+# python imports
+import hashlib
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+# django imports
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.db.models.sql.datastructures import EmptyResultSet
 # rest_framework import
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class LimitOffsetPaginationWithMaxLimit(LimitOffsetPagination):
@@ -8,3 +23,289 @@ class LimitOffsetPaginationWithMaxLimit(LimitOffsetPagination):
     Restricts a response with 10 objects.
     '''
     max_limit = 10
+
+
+class CachedCountMixin(object):
+    '''
+    Serves the count of a listing from the cache instead of running
+        COUNT(*) on every page.
+
+    Counts are cached per filter combination for count_cache_timeout
+        seconds. The key is the SQL of the unordered queryset selecting
+        only primary keys, so requests which select other columns or
+        relations (fields and expand parameters) share counts. Unfiltered
+        tables on PostgreSQL larger than estimate_threshold rows report the
+        planner estimate from pg_class.reltuples. Both cached and estimated
+        counts are flagged with count_approximate in the response, and next
+        links don't depend on the count.
+    '''
+    count_cache_alias = 'default'
+    count_cache_timeout = 60
+    count_cache_prefix = 'pagination-count'
+    estimate_threshold = 100000
+
+    def get_count_cache_key(self, queryset):
+        query = queryset.order_by().values('pk').query
+        sql, params = query.sql_with_params()
+        digest = hashlib.md5(
+            '{}|{}|{!r}'.format(queryset.model._meta.label, sql, params)
+            .encode('utf-8')
+        ).hexdigest()
+        return '{}:{}'.format(self.count_cache_prefix, digest)
+
+    def get_estimated_count(self, queryset):
+        '''
+        Returns the planner row estimate of an unfiltered table or None.
+        '''
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < self.estimate_threshold:
+            return None
+        return int(row[0])
+
+    def get_count(self, queryset):
+        '''
+        Returns a count and whether the count is approximate.
+        '''
+        estimate = self.get_estimated_count(queryset)
+        if estimate is not None:
+            return estimate, True
+        try:
+            key = self.get_count_cache_key(queryset)
+        except EmptyResultSet:
+            return 0, False
+        cache = caches[self.count_cache_alias]
+        count = cache.get(key)
+        if count is not None:
+            return count, True
+        count = queryset.count()
+        cache.set(key, count, self.count_cache_timeout)
+        return count, False
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Paginates by the values of the last row of a page instead of an offset,
+        so every page is an index range scan no matter how deep it is.
+
+    Ordering follows the OrderingFilter of the view (or the ordering of the
+        queryset, e.g. search relevance, or the default ordering of the
+        model) with the primary key appended as a tie-breaker. Cursors are
+        opaque base64 encoded values of the boundary row. The exact count
+        is skipped.
+    '''
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 10
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, queryset, view):
+        '''
+        Returns ordering terms with the primary key as a tie-breaker.
+        '''
+        ordering = None
+        for backend in getattr(view, 'filter_backends', ()):
+            if hasattr(backend, 'get_ordering'):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        if not ordering:
+            ordering = queryset.query.order_by or \
+                queryset.model._meta.ordering
+        ordering = [term for term in ordering if term.lstrip('-') != 'pk']
+        return tuple(ordering) + ('pk',)
+
+    def load_ordering_columns(self, queryset):
+        '''
+        Adds the ordering columns to a queryset restricted with only(), so
+            building cursors doesn't load deferred columns row by row.
+        '''
+        names, deferred = queryset.query.deferred_loading
+        if deferred or not names:
+            return queryset
+        return queryset.only(*(set(names) | set(
+            term.lstrip('-') for term in self.ordering
+            if term.lstrip('-') not in self.annotations
+        )))
+
+    def get_field(self, term):
+        '''
+        Returns the model field of an ordering term, or the output field of
+            an annotation, e.g. search_rank of filters.NameSearchFilter.
+        '''
+        name = term.lstrip('-')
+        if name == 'pk':
+            return self.model._meta.pk
+        if name in self.annotations:
+            return self.annotations[name].output_field
+        return self.model._meta.get_field(name)
+
+    def decode_cursor(self, request):
+        '''
+        Returns (reverse, position) of the cursor of a request, None without
+            cursor. Cursors which were tampered with or made for another
+            ordering are rejected with 404.
+        '''
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(
+                b64decode(encoded.encode('ascii')).decode('utf-8')
+            )
+            reverse, position = bool(cursor['r']), list(cursor['p'])
+            ordering = tuple(cursor['o'])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if ordering != self.ordering or len(position) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                self.get_field(term).to_python(value)
+                for term, value in zip(self.ordering, position)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+    def get_position(self, instance):
+        '''
+        Returns values of the ordering terms for an instance as strings,
+            annotations as they are.
+        '''
+        return [
+            getattr(instance, term.lstrip('-'))
+            if term.lstrip('-') in self.annotations else
+            self.get_field(term).value_to_string(instance)
+            for term in self.ordering
+        ]
+
+    def encode_cursor(self, instance, reverse):
+        cursor = json.dumps({
+            'r': int(reverse),
+            'o': self.ordering,
+            'p': self.get_position(instance)
+        })
+        encoded = b64encode(cursor.encode('utf-8')).decode('ascii')
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            encoded
+        )
+
+    def _keyset_filter(self, position, reverse):
+        '''
+        Builds a >= x & ((a > x) | (a = x & b > y) | ...) for the ordering
+            terms, flipping comparisons of descending terms and of backward
+            pages. The bound on the first term alone makes it an index
+            range condition; the disjunction only filters within the range.
+        '''
+        condition = None
+        equal = Q()
+        for term, value in zip(self.ordering, position):
+            name = term.lstrip('-')
+            descending = term.startswith('-') != reverse
+            lookup = '{}__{}'.format(name, 'lt' if descending else 'gt')
+            step = equal & Q(**{lookup: value})
+            if condition is None:
+                bound = Q(**{
+                    '{}__{}'.format(name, 'lte' if descending else 'gte'):
+                    value
+                })
+                condition = step
+            else:
+                condition |= step
+            equal &= Q(**{name: value})
+        return bound & condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.annotations = queryset.query.annotations
+        self.ordering = self.get_ordering(request, queryset, view)
+        queryset = self.load_ordering_columns(queryset)
+        cursor = self.decode_cursor(request)
+        reverse = False
+        if cursor is not None:
+            reverse, position = cursor
+            queryset = queryset.filter(self._keyset_filter(position, reverse))
+        if reverse:
+            ordering = [
+                term[1:] if term.startswith('-') else '-' + term
+                for term in self.ordering
+            ]
+        else:
+            ordering = self.ordering
+        # One extra row tells whether there is a page behind this one.
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class CountedKeysetPagination(CachedCountMixin, KeysetPagination):
+    '''
+    Keyset pagination reporting the count of the listing next to the
+        links, see CachedCountMixin. Paginates the listings of categories,
+        games, players and users, which are ordered by name (or other
+        columns of the OrderingFilter, or search relevance) and grow too
+        large for OFFSET scans.
+    '''
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count, self.count_approximate = self.get_count(queryset)
+        return super(CountedKeysetPagination, self).paginate_queryset(
+            queryset, request, view
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_approximate', self.count_approximate),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
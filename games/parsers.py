@@ -0,0 +1,72 @@
+# python imports
+import json
+# django imports
+from django.conf import settings
+from django.utils import six
+# rest_framework import
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+# local imports
+from .renderers import JSONRenderer
+# orjson is optional, the stdlib json module is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(value):
+    if orjson is None:
+        return json.loads(value)
+    return orjson.loads(value)
+
+
+class JSONParser(parsers.JSONParser):
+    '''
+    Parses JSON with orjson when it's installed and with the stdlib json
+        module otherwise.
+    '''
+    renderer_class = JSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super(JSONParser, self).parse(
+                stream, media_type, parser_context
+            )
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        data = stream.read()
+        try:
+            # orjson reads UTF-8 bytes directly
+            if encoding.lower().replace('-', '') != 'utf8':
+                data = data.decode(encoding)
+            return orjson.loads(data)
+        except ValueError as exc:
+            raise ParseError(
+                'JSON parse error - {}'.format(six.text_type(exc))
+            )
+
+
+class NDJSONParser(BaseParser):
+    '''
+    Parses newline delimited JSON into a list of objects, one per line.
+    Used for bulk ingestion where game servers stream scores line by line.
+    '''
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        items = []
+        for number, line in enumerate(stream, 1):
+            line = line.decode(encoding).strip()
+            if not line:
+                continue
+            try:
+                items.append(loads(line))
+            except ValueError as exc:
+                raise ParseError(
+                    'NDJSON parse error - line {}: {}'.format(number, exc)
+                )
+        return items
@@ -0,0 +1,213 @@
+# python imports
+from datetime import datetime
+from functools import partial
+# django imports
+from django.db import connections, transaction
+from django.utils import timezone
+# local imports
+from . import cache, changes
+from .models import Change, PlayerScore, ScoreArchive
+
+
+TABLE = PlayerScore._meta.db_table
+# Partition holding rows no monthly partition covers yet.
+DEFAULT_PARTITION = TABLE + '_default'
+
+
+def month_start(value):
+    '''
+    Returns midnight UTC of the first day of the month of a datetime.
+    '''
+    value = timezone.localtime(value, timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month, months):
+    years, index = divmod(month.month - 1 + months, 12)
+    return month.replace(year=month.year + years, month=index + 1)
+
+
+def get_partition_name(month):
+    return '{}_p{:%Y_%m}'.format(TABLE, month)
+
+
+def is_partitioned(using='default'):
+    '''
+    Tells whether PlayerScore is a partitioned table, which it is on
+        PostgreSQL 11 and later after migration 0012.
+    '''
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table '
+            'WHERE partrelid = %s::regclass',
+            [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def get_partitions(cursor):
+    '''
+    Returns the names of the partitions of PlayerScore.
+    '''
+    cursor.execute(
+        'SELECT c.relname FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = %s::regclass',
+        [TABLE]
+    )
+    return set(row[0] for row in cursor.fetchall())
+
+
+def create_partition(cursor, month):
+    '''
+    Creates the partition of a month. Rows of the month stored in the
+        default partition meanwhile are moved to it first, attaching would
+        fail otherwise; attaching adds the indexes and foreign keys of the
+        partitioned table.
+    '''
+    name = get_partition_name(month)
+    bounds = [month, add_months(month, 1)]
+    cursor.execute(
+        'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)'.format(
+            name=name, table=TABLE
+        )
+    )
+    cursor.execute(
+        'WITH moved AS (DELETE FROM {default} '
+        'WHERE score_date >= %s AND score_date < %s RETURNING *) '
+        'INSERT INTO {name} SELECT * FROM moved'.format(
+            default=DEFAULT_PARTITION, name=name
+        ),
+        bounds
+    )
+    cursor.execute(
+        'ALTER TABLE {table} ATTACH PARTITION {name} '
+        'FOR VALUES FROM (%s) TO (%s)'.format(table=TABLE, name=name),
+        bounds
+    )
+
+
+def ensure_partitions(first, last, using='default'):
+    '''
+    Creates the missing monthly partitions from month first to month last.
+        Returns the names of the partitions created.
+    '''
+    created = []
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            existing = get_partitions(cursor)
+            month = first
+            while month <= last:
+                if get_partition_name(month) not in existing:
+                    create_partition(cursor, month)
+                    created.append(get_partition_name(month))
+                month = add_months(month, 1)
+    return created
+
+
+def get_first_month(using='default'):
+    '''
+    Returns the month of the oldest PlayerScore, None without scores.
+    '''
+    first = PlayerScore.objects.using(using).order_by(
+        'score_date'
+    ).values_list('score_date', flat=True).first()
+    return first and month_start(first)
+
+
+def archive_month(month, using='default'):
+    '''
+    Rolls the scores of a month up into ScoreArchive rows, one per player
+        and game, and drops them: a partitioned table detaches and drops the
+        partition of the month, otherwise the rows are deleted. Summaries
+        and leaderboards don't change as they count archived scores, so the
+        rows are removed without signals; the deletes are recorded in the
+        change feed with a single insert and the responses of the players
+        and games of the month are invalidated once they're committed.
+        Returns the number of scores archived.
+    '''
+    connection = connections[using]
+    bounds = [
+        connection.ops.adapt_datetimefield_value(value)
+        for value in (month, add_months(month, 1))
+    ]
+    pairs = PlayerScore.objects.using(using).filter(
+        score_date__gte=month,
+        score_date__lt=add_months(month, 1)
+    ).order_by().values_list('player_id', 'game_id').distinct()
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT COUNT(*) FROM {table} '
+                'WHERE score_date >= %s AND score_date < %s'.format(
+                    table=TABLE
+                ),
+                bounds
+            )
+            archived = cursor.fetchone()[0]
+            if archived:
+                cursor.execute(
+                    'INSERT INTO {archive} (player_id, game_id, month, '
+                    'score_count, score_total, best_score, best_score_date, '
+                    'last_played) '
+                    'SELECT s.player_id, s.game_id, %s, a.score_count, '
+                    'a.score_total, a.best_score, MIN(s.score_date), '
+                    'a.last_played '
+                    'FROM {table} s JOIN (SELECT player_id, game_id, '
+                    'COUNT(*) AS score_count, SUM(score) AS score_total, '
+                    'MAX(score) AS best_score, MAX(score_date) AS last_played '
+                    'FROM {table} WHERE score_date >= %s AND score_date < %s '
+                    'GROUP BY player_id, game_id) a '
+                    'ON s.player_id = a.player_id AND s.game_id = a.game_id '
+                    'AND s.score = a.best_score '
+                    'WHERE s.score_date >= %s AND s.score_date < %s '
+                    'GROUP BY s.player_id, s.game_id, a.score_count, '
+                    'a.score_total, a.best_score, a.last_played'.format(
+                        archive=ScoreArchive._meta.db_table, table=TABLE
+                    ),
+                    [connection.ops.adapt_datefield_value(month.date())] +
+                    bounds + bounds
+                )
+                cursor.execute(
+                    'INSERT INTO {change} (model, object_id, action, '
+                    'created) SELECT %s, id, %s, %s FROM {table} '
+                    'WHERE score_date >= %s AND score_date < %s'.format(
+                        change=Change._meta.db_table, table=TABLE
+                    ),
+                    [
+                        PlayerScore._meta.model_name,
+                        Change.DELETE,
+                        connection.ops.adapt_datetimefield_value(
+                            timezone.now()
+                        ),
+                    ] + bounds
+                )
+                tags = set(['playerscore'])
+                for player_id, game_id in pairs:
+                    tags.add('player:{}'.format(player_id))
+                    tags.add('game:{}'.format(game_id))
+                    tags.add('leaderboard:{}'.format(game_id))
+            name = get_partition_name(month)
+            if is_partitioned(using) and name in get_partitions(cursor):
+                cursor.execute(
+                    'ALTER TABLE {table} DETACH PARTITION {name}'.format(
+                        table=TABLE, name=name
+                    )
+                )
+                cursor.execute('DROP TABLE {name}'.format(name=name))
+            # rows of the month in the default partition or an unpartitioned
+            # table
+            cursor.execute(
+                'DELETE FROM {table} '
+                'WHERE score_date >= %s AND score_date < %s'.format(
+                    table=TABLE
+                ),
+                bounds
+            )
+        if archived:
+            transaction.on_commit(partial(changes.sequence, using), using)
+            cache.invalidate(*tags)
+    return archived
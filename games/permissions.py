@@ -14,3 +14,16 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
             return True
         else:
             return obj.owner == request.user
+
+
+class IsAuthenticatedForBulkChanges(permissions.BasePermission):
+    '''
+    Allows PATCH and DELETE requests, which change or delete many objects
+        of a listing at once, only to authenticated users.
+    '''
+    bulk_methods = ('PATCH', 'DELETE')
+
+    def has_permission(self, request, view):
+        if request.method not in self.bulk_methods:
+            return True
+        return request.user and request.user.is_authenticated()
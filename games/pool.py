@@ -0,0 +1,213 @@
+# python imports
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    '''
+    Thread safe pool of DB-API connections shared by the threads of a
+        process.
+
+    At most max_size connections are open at once, acquire() waits up to
+        timeout seconds for one to be released when they're all in use.
+        Connections older than max_lifetime seconds are closed instead of
+        being reused and connections idle for more than check_after seconds
+        are checked with SELECT 1 before they're handed out. The most
+        recently released connection is reused first, so connections beyond
+        the load of the process stay idle until they expire.
+    '''
+    def __init__(self, connect, max_size=10, max_lifetime=1800, timeout=10,
+                 check_after=5):
+        self.connect = connect
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.check_after = check_after
+        self._condition = threading.Condition()
+        # (connection, opened at, released at), most recent last
+        self._idle = []
+        # id(connection): opened at
+        self._in_use = {}
+        self._size = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+        self.opened = 0
+        self.closed = 0
+        self.failed_checks = 0
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._condition:
+            self._size -= 1
+            self.closed += 1
+            self._condition.notify()
+
+    def _take(self, deadline):
+        '''
+        Returns an idle connection, or None after reserving room for a new
+            connection. Waits until deadline when the pool is full.
+        '''
+        with self._condition:
+            waiting = None
+            try:
+                while True:
+                    while self._idle:
+                        item = self._idle.pop()
+                        if time.time() - item[1] < self.max_lifetime:
+                            return item
+                        self._close(item[0])
+                    if self._size < self.max_size:
+                        self._size += 1
+                        return None
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            'No database connection was released within {} '
+                            'seconds, all {} are in use.'.format(
+                                self.timeout, self.max_size
+                            )
+                        )
+                    if waiting is None:
+                        waiting = time.time()
+                    self._condition.wait(remaining)
+            finally:
+                if waiting is not None:
+                    waited = time.time() - waiting
+                    self.waits += 1
+                    self.wait_time += waited
+                    self.max_wait_time = max(self.max_wait_time, waited)
+
+    def _check(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def acquire(self):
+        deadline = time.time() + self.timeout
+        while True:
+            item = self._take(deadline)
+            if item is None:
+                try:
+                    connection = self.connect()
+                except Exception:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+                opened = time.time()
+                break
+            connection, opened, released = item
+            if time.time() - released <= self.check_after or \
+                    self._check(connection):
+                break
+            self.failed_checks += 1
+            self._close(connection)
+        with self._condition:
+            self._in_use[id(connection)] = opened
+            self.checkouts += 1
+            if item is None:
+                self.opened += 1
+        return connection
+
+    def release(self, connection, reuse=True):
+        '''
+        Returns a connection to the pool. The connection is closed when
+            reuse is False, it's past max_lifetime or rolling back a
+            transaction left open fails.
+        '''
+        with self._condition:
+            opened = self._in_use.pop(id(connection))
+        if reuse and time.time() - opened < self.max_lifetime:
+            try:
+                connection.rollback()
+            except Exception:
+                reuse = False
+        else:
+            reuse = False
+        if not reuse:
+            self._close(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, opened, time.time()))
+            self._condition.notify()
+
+    def clear(self):
+        '''
+        Closes idle connections.
+        '''
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection, opened, released in idle:
+            self._close(connection)
+
+    def get_stats(self):
+        with self._condition:
+            in_use = len(self._in_use)
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': in_use,
+                'idle': len(self._idle),
+                'utilization': float(in_use) / self.max_size,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'max_wait_time': self.max_wait_time,
+                'timeouts': self.timeouts,
+                'opened': self.opened,
+                'closed': self.closed,
+                'failed_checks': self.failed_checks,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, database, connect, **options):
+    '''
+    Returns the pool of a database alias, creating it with connect and
+        options of ConnectionPool on first use. Test databases get pools
+        of their own because their name differs.
+    '''
+    key = (alias, database)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(connect, **options)
+        return _pools[key]
+
+
+def clear_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.clear()
+
+
+def get_stats():
+    '''
+    Returns {alias: {database: stats of its pool}}.
+    '''
+    with _pools_lock:
+        pools = sorted(_pools.items())
+    stats = {}
+    for (alias, database), pool in pools:
+        stats.setdefault(alias, {})[database] = pool.get_stats()
+    return stats
@@ -0,0 +1,409 @@
+# django imports
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Prefetch
+from django.db.models.query import QuerySet
+# rest_framework import
+from rest_framework import relations, serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def _concrete_field_names(model):
+    return set(field.name for field in model._meta.concrete_fields)
+
+
+def _display_field_name(attr):
+    '''
+    Returns the field name behind a get_<field>_display method or None.
+    '''
+    if attr.startswith('get_') and attr.endswith('_display'):
+        return attr[len('get_'):-len('_display')]
+    return None
+
+
+def first_rows_ordering(model):
+    '''
+    Returns the default ordering of a model with the primary key as a
+        tie-breaker, the order of capped relations and of the first page of
+        sub-collection endpoints.
+    '''
+    return [
+        term for term in model._meta.ordering if term.lstrip('-') != 'pk'
+    ] + ['pk']
+
+
+def supports_window_functions(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 25)
+    return False
+
+
+class CappedRelation(object):
+    '''
+    Reverse foreign key rendered by a capped field (see relations.py).
+        The first limit rows of every parent object of a page are loaded
+        with a single ROW_NUMBER() OVER (PARTITION BY ...) query and kept
+        on the parents, where relations.first_rows picks them up.
+
+    path is the select_related path from the root objects to the parents,
+        empty when the root objects are the parents.
+    '''
+    def __init__(self, path, model_field, plan, limit):
+        self.path = [name for name in path.split('__') if name]
+        self.accessor = model_field.get_accessor_name()
+        self.foreign_key = model_field.field
+        self.model = model_field.related_model
+        self.plan = plan
+        self.limit = limit
+
+    def get_parents(self, instances):
+        '''
+        Returns lists of parent objects by their primary key, a parent
+            reached from several root objects is a separate instance of
+            each.
+        '''
+        parents = {}
+        for instance in instances:
+            for name in self.path:
+                instance = getattr(instance, name)
+                if instance is None:
+                    break
+            else:
+                parents.setdefault(instance.pk, []).append(instance)
+        return parents
+
+    def get_condition(self, connection, count):
+        quote = connection.ops.quote_name
+        meta = self.model._meta
+        table = quote(meta.db_table)
+        pk = quote(meta.pk.column)
+        order = []
+        for term in first_rows_ordering(self.model):
+            name = term.lstrip('-')
+            field = meta.pk if name == 'pk' else meta.get_field(name)
+            order.append(
+                quote(field.column) + (' DESC' if term[0] == '-' else '')
+            )
+        return (
+            '{table}.{pk} IN (SELECT {pk} FROM (SELECT {pk}, ROW_NUMBER() '
+            'OVER (PARTITION BY {fk} ORDER BY {order}) AS row_number '
+            'FROM {table} WHERE {fk} IN ({parents})) numbered '
+            'WHERE row_number <= %s)'.format(
+                table=table,
+                pk=pk,
+                fk=quote(self.foreign_key.column),
+                order=', '.join(order),
+                parents=', '.join(['%s'] * count)
+            )
+        )
+
+    def load(self, instances):
+        parents = self.get_parents(instances)
+        if not parents:
+            return
+        db = next(iter(parents.values()))[0]._state.db
+        connection = connections[db]
+        if not supports_window_functions(connection):
+            # relations.first_rows reads them per parent
+            return
+        rows = self.plan.apply(
+            self.model._default_manager.using(db).all()
+        ).extra(
+            where=[self.get_condition(connection, len(parents))],
+            params=list(parents) + [self.limit]
+        ).order_by(*first_rows_ordering(self.model))
+        loaded = dict((pk, []) for pk in parents)
+        for row in rows:
+            loaded[getattr(row, self.foreign_key.attname)].append(row)
+        cache_name = self.foreign_key.get_cache_name()
+        for pk, rows in loaded.items():
+            for parent in parents[pk]:
+                # reverse foreign key managers set the parent on their rows
+                for row in rows:
+                    setattr(row, cache_name, parent)
+                parent.__dict__.setdefault('_first_rows', {})[
+                    self.accessor
+                ] = rows
+
+
+class QueryPlan(object):
+    '''
+    Describes the related objects and columns a serializer reads.
+
+    select holds paths for select_related, prefetch holds Prefetch objects
+        and only holds the column paths which have to be loaded. Paths of
+        nested plans are prefixed so that the plan can be applied to a
+        queryset of the root model in one go. capped holds CappedRelation
+        objects loaded for the objects of a page by load_capped.
+    '''
+    def __init__(self, model):
+        self.model = model
+        self.select = []
+        self.prefetch = []
+        self.capped = []
+        self.only = set([model._meta.pk.name])
+
+    def add_column(self, model, attr, prefix=''):
+        '''
+        Adds a column read by a serializer field. Attributes that are not
+            model fields make every column of the model required.
+        '''
+        if attr == 'pk':
+            attr = model._meta.pk.name
+        try:
+            model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            attr = _display_field_name(attr)
+            if attr is None:
+                self.only.update(
+                    prefix + name for name in _concrete_field_names(model)
+                )
+                return
+        self.only.add(prefix + attr)
+
+    def add_select(self, path):
+        if path not in self.select:
+            self.select.append(path)
+
+    def merge(self, plan, prefix):
+        '''
+        Merges a plan of a model reached through select_related.
+        '''
+        self.add_select(prefix[:-2])
+        for path in plan.select:
+            self.add_select(prefix + path)
+        for lookup in plan.prefetch:
+            lookup.add_prefix(prefix[:-2])
+            self.prefetch.append(lookup)
+        for capped in plan.capped:
+            capped.path = prefix[:-2].split('__') + capped.path
+            self.capped.append(capped)
+        self.only.update(prefix + name for name in plan.only)
+
+    def apply(self, queryset):
+        if self.select:
+            queryset = queryset.select_related(*self.select)
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch)
+        return queryset.only(*self.only)
+
+    def load_capped(self, instances):
+        for capped in self.capped:
+            capped.load(instances)
+
+
+def _related_field_columns(field, model):
+    '''
+    Returns the columns of the related model read by a RelatedField.
+        Hyperlinks carry str() of the object as their name, so they need
+        every column __str__ might read.
+    '''
+    if isinstance(field, relations.SlugRelatedField):
+        return set([field.slug_field])
+    if isinstance(field, relations.HyperlinkedRelatedField):
+        return _concrete_field_names(model)
+    return set()
+
+
+def _get_model_field(model, attr):
+    '''
+    Looks a serializer source up among the model fields, including reverse
+        relations accessed through their accessor name (e.g. scores).
+    '''
+    try:
+        return model._meta.get_field(attr)
+    except FieldDoesNotExist:
+        for field in model._meta.get_fields():
+            if field.auto_created and not field.concrete and \
+                    field.get_accessor_name() == attr:
+                return field
+        raise
+
+
+def build_query_plan(serializer, model=None):
+    '''
+    Walks the declared fields of a serializer and returns a QueryPlan with
+        the joins, prefetches and columns the serializer will read.
+    '''
+    model = model or serializer.Meta.model
+    plan = QueryPlan(model)
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            # The identity field builds a link from the instance itself.
+            plan.only.update(_related_field_columns(field, model))
+            continue
+        _plan_field(plan, field, model, list(field.source_attrs))
+    return plan
+
+
+def _plan_field(plan, field, model, attrs, prefix=''):
+    attr = attrs[0]
+    try:
+        model_field = _get_model_field(model, attr)
+    except FieldDoesNotExist:
+        plan.add_column(model, attr, prefix)
+        return
+    if not model_field.is_relation:
+        plan.add_column(model, attr, prefix)
+        return
+    related_model = model_field.related_model
+    if model_field.one_to_many or model_field.many_to_many:
+        max_inline = getattr(field, 'max_inline', None)
+        if max_inline is not None:
+            # Capped relations load their first rows for all objects of a
+            # page at once, or per object with a LIMIT query of their own,
+            # see relations.py.
+            if _is_cappable(model_field):
+                related_plan = build_related_plan(field, related_model)
+                related_plan.only.add(model_field.field.name)
+                plan.capped.append(CappedRelation(
+                    prefix, model_field, related_plan, max_inline
+                ))
+            return
+        plan.prefetch.append(
+            _many_prefetch(field, model_field, related_model, prefix)
+        )
+        return
+    if len(attrs) > 1:
+        # Dotted sources, e.g. owner.username, follow the relation.
+        plan.add_column(model, attr, prefix)
+        plan.add_select(prefix + attr)
+        _plan_field(
+            plan, field, related_model, attrs[1:], prefix + attr + '__'
+        )
+        return
+    plan.add_column(model, attr, prefix)
+    if isinstance(field, serializers.BaseSerializer):
+        plan.merge(
+            build_query_plan(field, related_model),
+            prefix + attr + '__'
+        )
+    elif isinstance(field, relations.RelatedField):
+        if field.use_pk_only_optimization():
+            return
+        plan.add_select(prefix + attr)
+        plan.only.update(
+            prefix + attr + '__' + name
+            for name in _related_field_columns(field, related_model)
+        )
+    else:
+        plan.add_select(prefix + attr)
+        plan.only.update(
+            prefix + attr + '__' + name
+            for name in _concrete_field_names(related_model)
+        )
+
+
+def _is_cappable(model_field):
+    '''
+    Tells whether CappedRelation loads a to-many relation: a reverse
+        foreign key to a model ordered by its own columns.
+    '''
+    if not model_field.one_to_many:
+        return False
+    meta = model_field.related_model._meta
+    for term in first_rows_ordering(model_field.related_model):
+        name = term.lstrip('-')
+        if name == 'pk':
+            continue
+        try:
+            if meta.get_field(name).is_relation:
+                return False
+        except FieldDoesNotExist:
+            return False
+    return True
+
+
+def build_related_plan(field, related_model):
+    '''
+    Returns a QueryPlan for the related objects rendered by a to-many
+        serializer field.
+    '''
+    if isinstance(field, serializers.ListSerializer):
+        return build_query_plan(field.child, related_model)
+    plan = QueryPlan(related_model)
+    if isinstance(field, relations.ManyRelatedField):
+        plan.only.update(
+            _related_field_columns(field.child_relation, related_model)
+        )
+    else:
+        plan.only.update(_concrete_field_names(related_model))
+    return plan
+
+
+def _many_prefetch(field, model_field, related_model, prefix):
+    '''
+    Builds a Prefetch object for a to-many relation. Reverse foreign keys
+        keep the column that links the related rows back to their parent.
+    '''
+    plan = build_related_plan(field, related_model)
+    if model_field.one_to_many:
+        plan.only.add(model_field.field.name)
+    if model_field.concrete:
+        accessor = model_field.name
+    else:
+        accessor = model_field.get_accessor_name()
+    lookup = Prefetch(
+        accessor,
+        queryset=plan.apply(related_model._default_manager.all())
+    )
+    if prefix:
+        lookup.add_prefix(prefix[:-2])
+    return lookup
+
+
+class EagerLoadingMixin(object):
+    '''
+    Builds the queryset of a generic view from the field tree of its
+        serializer, adding select_related and prefetch_related calls for
+        every relation the serializer reads so the number of queries per
+        request doesn't depend on the number of rows.
+
+    Plans are cached per serializer class and the values of the query
+        parameters which select serializer fields (see DynamicFieldsMixin),
+        because declared fields don't change between requests. At most
+        max_query_plans plans are kept, further plans are built per request.
+
+    Capped relations of the objects a read request serializes are loaded
+        with one query per relation, see CappedRelation.
+    '''
+    _query_plans = {}
+    max_query_plans = 1000
+    query_plan_params = ('fields', 'exclude', 'expand')
+
+    def get_query_plan_key(self):
+        params = self.request.query_params
+        return (self.get_serializer_class(), self.request.method) + tuple(
+            tuple(params.getlist(name)) for name in self.query_plan_params
+        )
+
+    def get_query_plan(self):
+        key = self.get_query_plan_key()
+        plan = self._query_plans.get(key)
+        if plan is None:
+            serializer = self.get_serializer_class()(
+                context=self.get_serializer_context()
+            )
+            plan = build_query_plan(serializer)
+            if len(self._query_plans) < self.max_query_plans:
+                self._query_plans[key] = plan
+        return plan
+
+    def get_queryset(self):
+        queryset = super(EagerLoadingMixin, self).get_queryset()
+        return self.get_query_plan().apply(queryset)
+
+    def get_serializer(self, *args, **kwargs):
+        if args and self.request.method in SAFE_METHODS:
+            instances = args[0]
+            if isinstance(instances, QuerySet):
+                # evaluated once, the serializer reads the same results
+                instances = list(instances)
+            elif not isinstance(instances, (list, tuple)):
+                instances = [instances]
+            self.get_query_plan().load_capped(instances)
+        return super(EagerLoadingMixin, self).get_serializer(*args, **kwargs)
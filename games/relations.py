@@ -0,0 +1,82 @@
+# django imports
+from django.db import models
+# rest_framework import
+from rest_framework import relations, serializers
+from rest_framework.fields import get_attribute
+# local imports
+from .querysets import build_related_plan, first_rows_ordering
+
+
+def first_rows(field, manager, limit):
+    '''
+    Returns the first limit rows of a related manager in its default
+        ordering, with the primary key as a tie-breaker so they match the
+        first page of the sub-collection endpoint. Rows loaded for the
+        whole page by EagerLoadingMixin are returned as they are, other
+        parents read theirs with a LIMIT query loading only the joins and
+        columns the field renders.
+    '''
+    loaded = getattr(manager.instance, '_first_rows', {})
+    accessor = field.source_attrs[-1]
+    if accessor in loaded:
+        return loaded[accessor]
+    model = manager.model
+    plan = getattr(field, '_first_rows_plan', None)
+    if plan is None:
+        plan = build_related_plan(field, model)
+        foreign_key = getattr(manager, 'field', None)
+        if foreign_key is not None:
+            # Reverse foreign key managers set the parent on every row they
+            # return, which reads the foreign key column.
+            plan.only.add(foreign_key.name)
+        field._first_rows_plan = plan
+    return plan.apply(manager.all()).order_by(
+        *first_rows_ordering(model)
+    )[:limit]
+
+
+class CappedListSerializer(serializers.ListSerializer):
+    '''
+    CappedListSerializer.relations
+
+    Renders at most max_inline objects of a nested to-many relation. The
+        rows are read with one ROW_NUMBER() query for all parent objects
+        of a page (see querysets.CappedRelation), or a LIMIT query per
+        parent, instead of a prefetch of the whole relation, so the size
+        and cost of a response don't grow with the history of the parents.
+        The remaining objects are served by a paginated sub-collection
+        endpoint.
+    '''
+    max_inline = 10
+
+    def __init__(self, *args, **kwargs):
+        self.max_inline = kwargs.pop('max_inline', self.max_inline)
+        super(CappedListSerializer, self).__init__(*args, **kwargs)
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = first_rows(self, data, self.max_inline)
+        return super(CappedListSerializer, self).to_representation(data)
+
+
+class CappedManyRelatedField(relations.ManyRelatedField):
+    '''
+    CappedManyRelatedField.relations
+
+    Many related field (e.g. a list of hyperlinks) rendering at most
+        max_inline related objects, see CappedListSerializer.
+    '''
+    max_inline = 10
+
+    def __init__(self, *args, **kwargs):
+        self.max_inline = kwargs.pop('max_inline', self.max_inline)
+        super(CappedManyRelatedField, self).__init__(*args, **kwargs)
+
+    def get_attribute(self, instance):
+        # Can't have any relationships if not created
+        if hasattr(instance, 'pk') and instance.pk is None:
+            return []
+        related = get_attribute(instance, self.source_attrs)
+        if isinstance(related, models.Manager):
+            return first_rows(self, related, self.max_inline)
+        return super(CappedManyRelatedField, self).get_attribute(instance)
@@ -0,0 +1,144 @@
+# python imports
+import csv
+import datetime
+import json
+# django imports
+from django.utils import six
+# rest_framework import
+from rest_framework import renderers
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+# orjson is optional, the stdlib json module is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def format_datetime(value):
+    '''
+    Formats a datetime like DateTimeField of rest_framework does with the
+        default ISO 8601 format.
+    '''
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+class DateTimeJSONEncoder(JSONEncoder):
+    '''
+    JSONEncoder of rest_framework which encodes datetimes the way
+        DateTimeField represents them, so serializers can hand datetime
+        objects over to the renderer.
+    '''
+    def default(self, obj):
+        if isinstance(obj, datetime.datetime):
+            return format_datetime(obj)
+        return super(DateTimeJSONEncoder, self).default(obj)
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    '''
+    Renders JSON with orjson when it's installed and with the stdlib json
+        module otherwise. Output is byte for byte the same as the one of
+        JSONRenderer of rest_framework.
+
+    Datetimes are encoded natively (see encodes_datetimes), so
+        PlainColumnsMixin skips DateTimeField for responses of this
+        renderer. Indented output, as used by the browsable API, and
+        ASCII-only output always use the stdlib json module.
+    '''
+    encoder_class = DateTimeJSONEncoder
+    encodes_datetimes = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or \
+                not self.compact or self.get_indent(
+                    accepted_media_type, renderer_context or {}
+                ) is not None:
+            return super(JSONRenderer, self).render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+            )
+        except TypeError:
+            # e.g. integers out of the 64 bit range
+            return super(JSONRenderer, self).render(
+                data, accepted_media_type, renderer_context
+            )
+        # Same escaping of line and paragraph separators as rest_framework,
+        # which keeps the output a strict javascript subset.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029'
+        )
+
+
+class _Echo(object):
+    '''
+    File-like object handing written CSV lines back to the caller.
+    '''
+    def write(self, value):
+        return value
+
+
+class NDJSONRenderer(BaseRenderer):
+    '''
+    Renders newline delimited JSON, one object per line.
+    stream method yields rows one by one for streaming responses.
+    '''
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def encode(self, value):
+        return (json.dumps(value, cls=JSONEncoder) + '\n').encode(self.charset)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, list):
+            return b''.join(self.encode(item) for item in data)
+        return self.encode(data)
+
+    def stream(self, names, rows):
+        for row in rows:
+            yield self.encode(dict(zip(names, row)))
+
+
+class CSVRenderer(BaseRenderer):
+    '''
+    Renders CSV with a header line of field names.
+    stream method yields rows one by one for streaming responses.
+    '''
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def encode_rows(self, names, rows):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(names)
+        for row in rows:
+            yield writer.writerow([
+                value.isoformat() if hasattr(value, 'isoformat') else value
+                for value in row
+            ])
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, list):
+            data = [data]
+        names = sorted(set(name for item in data for name in item))
+        rows = ([item.get(name) for name in names] for item in data)
+        return b''.join(self.stream(names, rows))
+
+    def stream(self, names, rows):
+        for line in self.encode_rows(names, rows):
+            if isinstance(line, six.text_type):
+                line = line.encode(self.charset)
+            yield line
@@ -0,0 +1,219 @@
+# python imports
+import itertools
+import threading
+import time
+from datetime import timedelta
+# django imports
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, IntegrityError,\
+    connections, transaction
+from django.utils import timezone
+# rest_framework import
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+# local imports
+from .models import CacheTag, ReplicaPin
+
+
+_state = threading.local()
+_lock = threading.Lock()
+_round_robin = itertools.count()
+# alias: time until which a replica which failed to connect is skipped
+_unavailable = {}
+# alias: number of requests of this process reading from a replica
+_in_flight = {}
+
+
+def get_replicas():
+    '''
+    Returns aliases of the read replicas listed in READ_REPLICAS setting.
+    '''
+    return list(getattr(settings, 'READ_REPLICAS', ()))
+
+
+def get_max_lag():
+    '''
+    Returns seconds after a write during which reads stay on the primary
+        database, which should cover the replication lag.
+    '''
+    return getattr(settings, 'READ_REPLICA_MAX_LAG', 5)
+
+
+def choose_replica():
+    '''
+    Returns the alias of a replica to read from, or None when no replica
+        is available. READ_REPLICA_SELECTION setting picks replicas in
+        'round-robin' order or the 'least-loaded' one, i.e. the one serving
+        the fewest requests of this process. Replicas which fail to connect
+        are skipped for READ_REPLICA_RETRY seconds.
+    '''
+    now = time.time()
+    replicas = [
+        alias for alias in get_replicas()
+        if _unavailable.get(alias, 0) <= now
+    ]
+    if not replicas:
+        return None
+    selection = getattr(settings, 'READ_REPLICA_SELECTION', 'round-robin')
+    if selection == 'least-loaded':
+        replicas.sort(key=lambda alias: _in_flight.get(alias, 0))
+    else:
+        start = next(_round_robin) % len(replicas)
+        replicas = replicas[start:] + replicas[:start]
+    for alias in replicas:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            _unavailable[alias] = now + getattr(
+                settings, 'READ_REPLICA_RETRY', 30
+            )
+            continue
+        return alias
+    return None
+
+
+def use_replica(alias):
+    '''
+    Routes reads of the current thread to a replica until release().
+    '''
+    release()
+    with _lock:
+        _in_flight[alias] = _in_flight.get(alias, 0) + 1
+    _state.replica = alias
+
+
+def release():
+    '''
+    Routes reads of the current thread back to the primary database.
+    '''
+    alias = getattr(_state, 'replica', None)
+    if alias is None:
+        return
+    _state.replica = None
+    with _lock:
+        _in_flight[alias] -= 1
+
+
+def _pin_client(request):
+    if request.user.is_authenticated():
+        return 'user:{}'.format(request.user.pk)
+    return 'anon:{}'.format(BaseThrottle().get_ident(request))
+
+
+def pin_to_primary(request):
+    '''
+    Sends reads of the client making a request to the primary database
+        for the next get_max_lag() seconds, so it reads its own writes.
+        Clients are identified like throttles identify them. Pins are
+        rows of the ReplicaPin table, which every worker process reads;
+        expired pins are deleted whenever a new pin is inserted.
+    '''
+    client = _pin_client(request)
+    now = timezone.now()
+    expires = now + timedelta(seconds=get_max_lag())
+    pins = ReplicaPin.objects.filter(client=client)
+    if pins.update(expires=expires):
+        return
+    try:
+        with transaction.atomic():
+            ReplicaPin.objects.create(client=client, expires=expires)
+    except IntegrityError:
+        pins.update(expires=expires)
+        return
+    ReplicaPin.objects.filter(expires__lte=now).delete()
+
+
+def is_pinned(request):
+    return ReplicaPin.objects.filter(
+        client=_pin_client(request),
+        expires__gt=timezone.now()
+    ).exists()
+
+
+def recently_written(tags):
+    '''
+    Returns whether any of the response cache tags was bumped in the last
+        get_max_lag() seconds. Views read such data from the primary
+        database, otherwise a replica behind the primary would put a stale
+        response in the cache under the new tag versions.
+    '''
+    if not tags:
+        return False
+    return CacheTag.objects.filter(
+        tag__in=tags,
+        written__gt=timezone.now() - timedelta(seconds=get_max_lag())
+    ).exists()
+
+
+class ReplicaRouter(object):
+    '''
+    Database router sending reads to the replica chosen for the current
+        request by ReplicaRoutingMixin and everything else to the primary
+        (default) database. Reads inside a transaction of the primary
+        database stay on it, and so do reads of DatabaseCache entries,
+        cache tags and pins: tag versions read from a lagging replica
+        would serve stale responses.
+    '''
+    primary_models = (CacheTag, ReplicaPin)
+
+    def db_for_read(self, model, **hints):
+        alias = getattr(_state, 'replica', None)
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label == 'django_cache' or \
+                model in self.primary_models:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = [DEFAULT_DB_ALIAS] + get_replicas()
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaRoutingMixin(object):
+    '''
+    Serves GET, HEAD and OPTIONS requests of a view from a read replica
+        (see ReplicaRouter), unless:
+        - the client wrote through the API in the last get_max_lag()
+          seconds (read-your-writes),
+        - data behind the cache tags of the view was written in that time,
+        - no replica is available.
+    Authentication, permissions and throttles are checked on the primary
+        database before the replica is chosen.
+    '''
+    def reads_from_replica(self, request):
+        if request.method not in SAFE_METHODS or not get_replicas():
+            return False
+        if is_pinned(request):
+            return False
+        get_cache_tags = getattr(self, 'get_cache_tags', None)
+        if get_cache_tags is not None and recently_written(get_cache_tags()):
+            return False
+        return True
+
+    def initial(self, request, *args, **kwargs):
+        super(ReplicaRoutingMixin, self).initial(request, *args, **kwargs)
+        if self.reads_from_replica(request):
+            alias = choose_replica()
+            if alias is not None:
+                use_replica(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in SAFE_METHODS and get_replicas():
+            pin_to_primary(request)
+        return super(ReplicaRoutingMixin, self).finalize_response(
+            request, response, *args, **kwargs
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super(ReplicaRoutingMixin, self).dispatch(
+                request, *args, **kwargs
+            )
+        finally:
+            release()
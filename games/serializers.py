@@ -1,31 +1,234 @@
+# python imports
+from collections import OrderedDict
 # django imports
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import six
+from django.utils.encoding import smart_text
 # rest_framework import
-from rest_framework import serializers
+from rest_framework import ISO_8601, permissions, serializers
+from rest_framework.fields import SkipField
+from rest_framework.settings import api_settings
 # local imports
-from .models import Game, GameCategory, Player, PlayerScore
-from . import views
+from .models import Game, GameCategory, GameSummary, LeaderboardEntry,\
+    Player, PlayerScore, PlayerSummary
+from .hyperlinks import HyperlinkedIdentityField, HyperlinkedModelSerializer,\
+    HyperlinkedRelatedField
+from .instrumentation import TimedSerializerMixin
+from .relations import CappedListSerializer, CappedManyRelatedField
+from .signals import scores_bulk_created
 
 
-class GameCategorySerializer(serializers.HyperlinkedModelSerializer):
+FIELD_PARAMS = ('fields', 'exclude', 'expand')
+
+
+def parse_field_paths(value):
+    '''
+    Parses a comma separated list of dotted field paths into a tree, e.g.
+        'name,scores.score' into {'name': {}, 'scores': {'score': {}}}.
+    '''
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def get_field_spec(request):
+    '''
+    Returns (fields, exclude, expand) trees of the query parameters of a
+        read request. Fields is None when every field is requested.
+    '''
+    if request is None or request.method not in permissions.SAFE_METHODS:
+        return None
+    params = request.query_params
+    if not any(name in params for name in FIELD_PARAMS):
+        return None
+    trees = dict(
+        (name, parse_field_paths(','.join(params.getlist(name))))
+        for name in FIELD_PARAMS
+    )
+    if 'fields' not in params:
+        trees['fields'] = None
+    return (trees['fields'], trees['exclude'], trees['expand'])
+
+
+class DynamicFieldsMixin(object):
+    '''
+    DynamicFieldsMixin.serializers
+
+    Lets clients shape read responses with the fields, exclude and expand
+        query parameters. Fields lists the fields to return, exclude the
+        fields to leave out and expand the relations of
+        Meta.expandable_fields to embed instead of showing their name.
+        Dotted paths reach nested serializers, e.g. fields=name,scores.score.
+
+    Fields are dropped before the serializer reads anything, so
+        EagerLoadingMixin builds query plans without the joins, prefetches
+        and columns of fields nobody asked for. Unknown names are ignored.
+    '''
+    def get_field_spec(self):
+        spec = getattr(self, '_field_spec', None)
+        if spec is None:
+            spec = get_field_spec(self.context.get('request'))
+        return spec
+
+    def get_fields(self):
+        fields = super(DynamicFieldsMixin, self).get_fields()
+        spec = self.get_field_spec()
+        if spec is None:
+            return fields
+        only, exclude, expand = spec
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name in expand:
+            if name in expandable and name in fields:
+                fields[name] = expandable[name](read_only=True)
+        fields = OrderedDict(
+            (name, field) for name, field in fields.items()
+            if (only is None or name in only) and exclude.get(name) != {}
+        )
+        for name, field in fields.items():
+            nested = getattr(field, 'child', field)
+            if not isinstance(nested, DynamicFieldsMixin):
+                continue
+            nested_only = None
+            if only is not None:
+                # A path without nested names selects the whole relation.
+                nested_only = only.get(name) or None
+            nested._field_spec = (
+                nested_only,
+                exclude.get(name, {}),
+                expand.get(name, {})
+            )
+        return fields
+
+
+class PlainColumnsMixin(object):
+    '''
+    PlainColumnsMixin.serializers
+
+    Renders fields which output a model column unchanged by reading the
+        attribute directly, skipping Field.get_attribute and
+        Field.to_representation. Plain columns are boolean, char, integer
+        and read only fields of a non-relation model field, plus datetime
+        fields when the renderer encodes datetimes itself (see
+        renderers.JSONRenderer). Other fields are rendered as usual.
+    '''
+    plain_columns = True
+    plain_field_classes = (
+        serializers.BooleanField,
+        serializers.CharField,
+        serializers.IntegerField,
+        serializers.ReadOnlyField,
+    )
+
+    def renders_datetimes(self):
+        request = self.context.get('request')
+        renderer = getattr(request, 'accepted_renderer', None)
+        return getattr(renderer, 'encodes_datetimes', False)
+
+    def is_plain_datetime(self, field):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        return type(field) is serializers.DateTimeField and \
+            output_format is not None and \
+            output_format.lower() == ISO_8601
+
+    def get_column_attrs(self):
+        '''
+        Returns {field name: model attribute} of the plain columns.
+        '''
+        columns = getattr(self, '_column_attrs', None)
+        if columns is not None:
+            return columns
+        columns = {}
+        model = getattr(getattr(self, 'Meta', None), 'model', None)
+        if self.plain_columns and model is not None:
+            attrs = set(['pk']) | set(
+                field.name for field in model._meta.concrete_fields
+                if not field.is_relation
+            )
+            datetimes = self.renders_datetimes()
+            for field in self._readable_fields:
+                if len(field.source_attrs) != 1 or \
+                        field.source_attrs[0] not in attrs:
+                    continue
+                if type(field) in self.plain_field_classes or \
+                        datetimes and self.is_plain_datetime(field):
+                    columns[field.field_name] = field.source_attrs[0]
+        self._column_attrs = columns
+        return columns
+
+    def to_representation(self, instance):
+        columns = self.get_column_attrs()
+        if not columns:
+            return super(PlainColumnsMixin, self).to_representation(instance)
+        ret = OrderedDict()
+        for field in self._readable_fields:
+            name = field.field_name
+            if name in columns:
+                ret[name] = getattr(instance, columns[name])
+                continue
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                continue
+            if attribute is None:
+                ret[name] = None
+            else:
+                ret[name] = field.to_representation(attribute)
+        return ret
+
+
+class GameCategorySerializer(TimedSerializerMixin, DynamicFieldsMixin,
+                             PlainColumnsMixin, HyperlinkedModelSerializer):
     '''
     GameCategorySerializer.serializers
 
     Serializes instances of the GameCategory model of the games app.
-    Games field used to display list of objects of Game model.
+    Games field used to display list of objects of Game model, capped to
+        the first games. Games_url field links to all games of the
+        category.
     '''
-    games = serializers.HyperlinkedRelatedField(
-        many=True,
-        read_only=True,
-        view_name='game-detail'
+    games = CappedManyRelatedField(
+        child_relation=HyperlinkedRelatedField(
+            read_only=True,
+            view_name='game-detail'
+        ),
+        read_only=True
+    )
+    games_url = HyperlinkedIdentityField(
+        view_name='gamecategory-game-list'
     )
 
     class Meta:
         model = GameCategory
-        fields = ('url', 'pk', 'name', 'games')
+        fields = ('url', 'pk', 'name', 'games', 'games_url')
+
 
+class GameSummarySerializer(TimedSerializerMixin, DynamicFieldsMixin,
+                            PlainColumnsMixin, serializers.ModelSerializer):
+    '''
+    GameSummarySerializer.serializers
 
-class GameSerializer(serializers.HyperlinkedModelSerializer):
+    Serializes precomputed score aggregates of a game.
+    '''
+    average_score = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = GameSummary
+        fields = (
+            'score_count',
+            'best_score',
+            'average_score',
+            'players_count',
+            'last_played'
+        )
+
+
+class GameSerializer(TimedSerializerMixin, DynamicFieldsMixin,
+                     PlainColumnsMixin, HyperlinkedModelSerializer):
     '''
     GameSerializer.serializers
 
@@ -34,12 +237,15 @@ class GameSerializer(serializers.HyperlinkedModelSerializer):
         GameCategory model. Instances of Game model have many to one
         relationship with instances of GameCategory model.
     Owner field displays name of an user created a game.
+    Stats field displays score aggregates of the game, null until the
+        first score is recorded.
     '''
     owner = serializers.ReadOnlyField(source='owner.username')
     game_category = serializers.SlugRelatedField(
         queryset=GameCategory.objects.all(),
         slug_field='name'
     )
+    stats = GameSummarySerializer(source='summary', read_only=True)
 
     class Meta:
         model = Game
@@ -50,11 +256,27 @@ class GameSerializer(serializers.HyperlinkedModelSerializer):
             'game_category',
             'name',
             'release_date',
-            'played'
+            'played',
+            'stats'
+        )
+        expandable_fields = {'game_category': GameCategorySerializer}
+
+
+class ScoreGameSerializer(GameSerializer):
+    '''
+    ScoreGameSerializer.GameSerializer.serializers
+
+    Game details embedded in the scores of a player. Leaves out the game
+        stats, which change with the scores of every other player.
+    '''
+    class Meta(GameSerializer.Meta):
+        fields = tuple(
+            name for name in GameSerializer.Meta.fields if name != 'stats'
         )
 
 
-class ScoreSerializer(serializers.HyperlinkedModelSerializer):
+class ScoreSerializer(TimedSerializerMixin, DynamicFieldsMixin,
+                      PlainColumnsMixin, HyperlinkedModelSerializer):
     '''
     ScoreSerializer.GameSerializer.serializers
 
@@ -63,27 +285,55 @@ class ScoreSerializer(serializers.HyperlinkedModelSerializer):
 
     Game field used to display all details about the related game object.
     '''
-    game = GameSerializer()
+    game = ScoreGameSerializer()
 
     class Meta:
         model = PlayerScore
         fields = ('url', 'pk', 'score', 'score_date', 'game')
 
 
-class PlayerSerializer(serializers.HyperlinkedModelSerializer):
+class PlayerSummarySerializer(TimedSerializerMixin, DynamicFieldsMixin,
+                              PlainColumnsMixin, serializers.ModelSerializer):
+    '''
+    PlayerSummarySerializer.serializers
+
+    Serializes precomputed score aggregates of a player.
+    '''
+    average_score = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = PlayerSummary
+        fields = (
+            'score_count',
+            'best_score',
+            'average_score',
+            'games_played',
+            'last_played'
+        )
+
+
+class PlayerSerializer(TimedSerializerMixin, DynamicFieldsMixin,
+                       PlainColumnsMixin, HyperlinkedModelSerializer):
     '''
     PlayerSerializer.ScoreSerializer.GameSerializer.serializers
 
     Serializes instances of the Player model.
-    Scores field used to display all details about the related scores objects.
-    (see above)
+    Scores field used to display all details about the related scores objects
+        (see above), capped to the best scores. Scores_url field links to
+        all scores of the player.
+    Stats field displays score aggregates of the player, null until the
+        first score is recorded.
     '''
-    scores = ScoreSerializer(many=True, read_only=True)
+    scores = CappedListSerializer(child=ScoreSerializer(), read_only=True)
+    scores_url = HyperlinkedIdentityField(
+        view_name='player-score-list'
+    )
     gender = serializers.ChoiceField(choices=Player.GENDER_CHOICES)
     gender_description = serializers.CharField(
         source='get_gender_display',
         read_only=True
     )
+    stats = PlayerSummarySerializer(source='summary', read_only=True)
 
     class Meta:
         model = Player
@@ -92,21 +342,117 @@ class PlayerSerializer(serializers.HyperlinkedModelSerializer):
             'name',
             'gender',
             'gender_description',
-            'scores'
+            'scores',
+            'scores_url',
+            'stats'
         )
 
 
-class PlayerScoreSerializer(serializers.HyperlinkedModelSerializer):
+class PreloadedSlugRelatedField(serializers.SlugRelatedField):
+    '''
+    PreloadedSlugRelatedField.serializers
+
+    Resolves slugs from objects preloaded into the serializer context by a
+        bulk serializer instead of querying once per value. Falls back to
+        SlugRelatedField lookups when nothing was preloaded.
+    '''
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded', {}).get(self.field_name)
+        if preloaded is None:
+            return super(PreloadedSlugRelatedField, self).to_internal_value(
+                data
+            )
+        try:
+            return preloaded[data]
+        except KeyError:
+            self.fail(
+                'does_not_exist',
+                slug_name=self.slug_field,
+                value=smart_text(data)
+            )
+        except TypeError:
+            self.fail('invalid')
+
+
+class PlayerScoreListSerializer(serializers.ListSerializer):
+    '''
+    PlayerScoreListSerializer.PlayerScoreSerializer.serializers
+
+    Validates and writes many scores at once. Player and game names of all
+        items are resolved with one query each, invalid items are reported
+        with their index instead of rejecting the whole batch, and valid
+        items are inserted with bulk_create in one transaction.
+    '''
+    def preload(self, data):
+        preloaded = {}
+        for name, field in self.child.fields.items():
+            if not isinstance(field, PreloadedSlugRelatedField):
+                continue
+            slugs = set(
+                item[name] for item in data
+                if isinstance(item, dict) and
+                isinstance(item.get(name), six.string_types)
+            )
+            queryset = field.get_queryset().filter(
+                **{field.slug_field + '__in': slugs}
+            ).only('pk', field.slug_field)
+            preloaded[name] = dict(
+                (getattr(obj, field.slug_field), obj) for obj in queryset
+            )
+        self.context['preloaded'] = preloaded
+
+    def validate_items(self):
+        '''
+        Returns validated data of valid items and errors of invalid items.
+        '''
+        data = self.initial_data
+        if not isinstance(data, list):
+            raise serializers.ValidationError(
+                self.error_messages['not_a_list'].format(
+                    input_type=type(data).__name__
+                )
+            )
+        self.preload(data)
+        valid, errors = [], []
+        for index, item in enumerate(data):
+            try:
+                valid.append((index, self.child.run_validation(item)))
+            except serializers.ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+        return valid, errors
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        with transaction.atomic():
+            instances = model.objects.bulk_create(
+                [model(**attrs) for attrs in validated_data],
+                batch_size=500
+            )
+            scores_bulk_created.send(sender=model, instances=instances)
+        return instances
+
+    def update(self, instances, validated_data):
+        '''
+        Updates instances with validated data of the same position.
+        '''
+        with transaction.atomic():
+            for instance, attrs in zip(instances, validated_data):
+                self.child.update(instance, attrs)
+        return instances
+
+
+class PlayerScoreSerializer(TimedSerializerMixin, DynamicFieldsMixin,
+                            PlainColumnsMixin, HyperlinkedModelSerializer):
     '''
     PlayerScoreSerializer.serializers
 
     Used to serialize instances of the PlayerScore model.
     '''
-    player = serializers.SlugRelatedField(
+    player = PreloadedSlugRelatedField(
         queryset=Player.objects.all(),
         slug_field='name'
     )
-    game = serializers.SlugRelatedField(
+    game = PreloadedSlugRelatedField(
         queryset=Game.objects.all(),
         slug_field='name'
     )
@@ -114,9 +460,15 @@ class PlayerScoreSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = PlayerScore
         fields = ('url', 'pk', 'score', 'score_date', 'player', 'game')
+        list_serializer_class = PlayerScoreListSerializer
+        expandable_fields = {
+            'player': PlayerSerializer,
+            'game': GameSerializer
+        }
 
 
-class UserGameSerializer(serializers.HyperlinkedModelSerializer):
+class UserGameSerializer(TimedSerializerMixin, DynamicFieldsMixin,
+                         PlainColumnsMixin, HyperlinkedModelSerializer):
     '''
     UserGameSerializer.serializers
 
@@ -127,15 +479,42 @@ class UserGameSerializer(serializers.HyperlinkedModelSerializer):
         fields = ('url', 'name')
 
 
-class UserSerializer(serializers.HyperlinkedModelSerializer):
+class UserSerializer(TimedSerializerMixin, DynamicFieldsMixin,
+                     PlainColumnsMixin, HyperlinkedModelSerializer):
     '''
     UserSerializer.UserGameSerializer.serializers
 
     Used to serialize an user object. Game field adds a list of created games
-        to the user object.
+        to the user object, capped to the first games. Games_url field links
+        to all games of the user.
     '''
-    games = UserGameSerializer(many=True, read_only=True)
+    games = CappedListSerializer(child=UserGameSerializer(), read_only=True)
+    games_url = HyperlinkedIdentityField(
+        view_name='user-game-list'
+    )
 
     class Meta:
         model = User
-        fields = ('url', 'pk', 'username', 'games')
+        fields = ('url', 'pk', 'username', 'games', 'games_url')
+
+
+class LeaderboardEntrySerializer(TimedSerializerMixin, DynamicFieldsMixin,
+                                 PlainColumnsMixin,
+                                 serializers.ModelSerializer):
+    '''
+    LeaderboardEntrySerializer.serializers
+
+    Used to serialize the rank of a player in a game leaderboard. Rank is
+        read from the rank attribute leaderboard.with_ranks adds.
+    '''
+    rank = serializers.IntegerField(read_only=True)
+    player = serializers.SlugRelatedField(read_only=True, slug_field='name')
+    game = serializers.SlugRelatedField(read_only=True, slug_field='name')
+
+    class Meta:
+        model = LeaderboardEntry
+        fields = ('rank', 'player', 'game', 'score', 'score_date')
+        expandable_fields = {
+            'player': PlayerSerializer,
+            'game': GameSerializer
+        }
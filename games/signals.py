@@ -0,0 +1,242 @@
+# python imports
+import threading
+# django imports
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete,\
+    pre_save
+from django.dispatch import Signal, receiver
+# local imports
+from . import cache, changes, leaderboard, summaries
+from .models import Change, Game, GameCategory, Player, PlayerGameSummary,\
+    PlayerScore
+
+
+# Sent after PlayerScore rows are written with bulk_create, which doesn't
+# send post_save for the created instances.
+scores_bulk_created = Signal(providing_args=['instances'])
+
+# Games and players being deleted by the current thread, see start_cascade.
+_cascades = threading.local()
+
+
+@receiver(pre_save, sender=PlayerScore)
+def remember_leaderboard_key(sender, instance, **kwargs):
+    '''
+    Stores the game and player a PlayerScore belonged to before an update,
+        so the leaderboard the score moves out of is refreshed as well.
+    '''
+    instance._leaderboard_key = None
+    if instance.pk is not None:
+        instance._leaderboard_key = PlayerScore.objects.filter(
+            pk=instance.pk
+        ).values_list('game_id', 'player_id').first()
+
+
+@receiver(post_save, sender=PlayerScore)
+def update_leaderboard(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        leaderboard.record_score(instance)
+        return
+    key = (instance.game_id, instance.player_id)
+    previous_key = getattr(instance, '_leaderboard_key', None)
+    if previous_key is not None and previous_key != key:
+        leaderboard.refresh_entry(*previous_key)
+    leaderboard.refresh_entry(*key)
+
+
+def _is_cascaded(instance):
+    '''
+    Tells whether a PlayerScore is deleted along with its game or player.
+    '''
+    deleting = getattr(_cascades, 'deleting', {})
+    return instance.game_id in deleting.get(Game, ()) or \
+        instance.player_id in deleting.get(Player, ())
+
+
+@receiver(post_delete, sender=PlayerScore)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    if _is_cascaded(instance):
+        return
+    leaderboard.refresh_entry(instance.game_id, instance.player_id)
+
+
+@receiver(pre_delete, sender=Game)
+@receiver(pre_delete, sender=Player)
+def start_cascade(sender, instance, **kwargs):
+    '''
+    Marks a game or player whose scores are about to be deleted with it.
+        Their leaderboard entries and summaries are deleted by the cascade
+        as well, so the receivers of the PlayerScore deletes skip them
+        instead of recomputing them once per score; the summaries of the
+        players of a game (or the games of a player) are refreshed once
+        when the delete is done, see finish_cascade.
+    '''
+    if sender is Game:
+        related = PlayerGameSummary.objects.filter(
+            game_id=instance.pk
+        ).values_list('player_id', flat=True)
+    else:
+        related = PlayerGameSummary.objects.filter(
+            player_id=instance.pk
+        ).values_list('game_id', flat=True)
+    if not hasattr(_cascades, 'deleting'):
+        _cascades.deleting, _cascades.related = {}, {}
+    _cascades.deleting.setdefault(sender, set()).add(instance.pk)
+    _cascades.related[(sender, instance.pk)] = list(related)
+
+
+@receiver(post_delete, sender=Game)
+@receiver(post_delete, sender=Player)
+def finish_cascade(sender, instance, **kwargs):
+    if not hasattr(_cascades, 'deleting'):
+        return
+    _cascades.deleting.get(sender, set()).discard(instance.pk)
+    related = _cascades.related.pop((sender, instance.pk), ())
+    with transaction.atomic():
+        for pk in sorted(related):
+            if sender is Game:
+                summaries.refresh_player(pk)
+            else:
+                summaries.refresh_game(pk)
+
+
+@receiver(post_save, sender=PlayerScore)
+def update_summaries(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        summaries.add_scores([instance])
+        return
+    keys = set([(instance.player_id, instance.game_id)])
+    previous_key = getattr(instance, '_leaderboard_key', None)
+    if previous_key is not None:
+        game_id, player_id = previous_key
+        keys.add((player_id, game_id))
+    summaries.refresh(keys)
+
+
+@receiver(post_delete, sender=PlayerScore)
+def remove_from_summaries(sender, instance, **kwargs):
+    if _is_cascaded(instance):
+        return
+    summaries.refresh([(instance.player_id, instance.game_id)])
+
+
+def _invalidate_responses(tag, instance):
+    cache.invalidate(tag, '{}:{}'.format(tag, instance.pk))
+
+
+@receiver(post_save, sender=GameCategory)
+@receiver(post_delete, sender=GameCategory)
+def invalidate_game_category_responses(sender, instance, **kwargs):
+    _invalidate_responses('gamecategory', instance)
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def invalidate_game_responses(sender, instance, **kwargs):
+    _invalidate_responses('game', instance)
+
+
+@receiver(post_save, sender=Player)
+@receiver(post_delete, sender=Player)
+def invalidate_player_responses(sender, instance, **kwargs):
+    _invalidate_responses('player', instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_responses(sender, instance, **kwargs):
+    _invalidate_responses('user', instance)
+
+
+@receiver(post_save, sender=PlayerScore)
+@receiver(post_delete, sender=PlayerScore)
+def invalidate_player_score_responses(sender, instance, **kwargs):
+    '''
+    Scores are embedded in the detail of their player, ranked in the
+        leaderboard of their game and counted in the stats of both, so
+        only those are evicted besides the score listings.
+    '''
+    tags = set(['playerscore', 'playerscore:{}'.format(instance.pk)])
+    keys = set([(instance.game_id, instance.player_id)])
+    previous_key = getattr(instance, '_leaderboard_key', None)
+    if previous_key is not None:
+        keys.add(previous_key)
+    for game_id, player_id in keys:
+        tags.add('player:{}'.format(player_id))
+        tags.add('game:{}'.format(game_id))
+        tags.add('leaderboard:{}'.format(game_id))
+    cache.invalidate(*tags)
+
+
+@receiver(scores_bulk_created, sender=PlayerScore)
+def update_leaderboards_in_bulk(sender, instances, **kwargs):
+    '''
+    Records the best new score of every player per game. Games with many
+        changed players are rebuilt at once instead of refreshed per player.
+    '''
+    best = {}
+    for instance in instances:
+        key = (instance.game_id, instance.player_id)
+        if key not in best or instance.score > best[key].score:
+            best[key] = instance
+    games = {}
+    for (game_id, player_id), instance in best.items():
+        games.setdefault(game_id, []).append(instance)
+    for game_id, game_instances in games.items():
+        if len(game_instances) > leaderboard.REBUILD_THRESHOLD:
+            leaderboard.rebuild(game_id)
+            continue
+        for instance in game_instances:
+            leaderboard.record_score(instance)
+
+
+@receiver(scores_bulk_created, sender=PlayerScore)
+def update_summaries_in_bulk(sender, instances, **kwargs):
+    summaries.add_scores(instances)
+
+
+@receiver(scores_bulk_created, sender=PlayerScore)
+def invalidate_bulk_player_score_responses(sender, instances, **kwargs):
+    tags = set(['playerscore'])
+    for instance in instances:
+        tags.add('player:{}'.format(instance.player_id))
+        tags.add('game:{}'.format(instance.game_id))
+        tags.add('leaderboard:{}'.format(instance.game_id))
+    cache.invalidate(*tags)
+
+
+@receiver(post_save, sender=GameCategory)
+@receiver(post_save, sender=Game)
+@receiver(post_save, sender=Player)
+@receiver(post_save, sender=PlayerScore)
+def record_save(sender, instance, created, **kwargs):
+    changes.record(instance, Change.CREATE if created else Change.UPDATE)
+
+
+@receiver(post_delete, sender=GameCategory)
+@receiver(post_delete, sender=Game)
+@receiver(post_delete, sender=Player)
+@receiver(post_delete, sender=PlayerScore)
+def record_delete(sender, instance, **kwargs):
+    changes.record(instance, Change.DELETE)
+
+
+@receiver(scores_bulk_created, sender=PlayerScore)
+def record_bulk_create(sender, instances, **kwargs):
+    '''
+    Backends which don't return the ids of bulk inserts (SQLite) leave pk
+        unset. The signal is sent in the inserting transaction, which holds
+        the write lock of such a database, so the newest rows are the
+        inserted ones.
+    '''
+    pks = [instance.pk for instance in instances]
+    if None in pks:
+        pks = PlayerScore.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        )[:len(instances)]
+    changes.record_many(PlayerScore, pks, Change.CREATE)
@@ -0,0 +1,320 @@
+# django imports
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Greatest
+# local imports
+from .models import GameSummary, PlayerGameSummary, PlayerScore,\
+    PlayerSummary, ScoreArchive
+
+
+def _score_stats(scores):
+    '''
+    Returns aggregates of PlayerScore instances keyed on (player, game).
+    '''
+    stats = {}
+    for score in scores:
+        key = (score.player_id, score.game_id)
+        count, total, best, last = stats.get(
+            key, (0, 0, score.score, score.score_date)
+        )
+        stats[key] = (
+            count + 1,
+            total + score.score,
+            max(best, score.score),
+            max(last, score.score_date)
+        )
+    return stats
+
+
+def _combine(first, second):
+    if first is None:
+        return second
+    return (
+        first[0] + second[0],
+        first[1] + second[1],
+        max(first[2], second[2]),
+        max(first[3], second[3])
+    )
+
+
+def _accumulate(totals, key, stats, new):
+    '''
+    Sums aggregates and the number of new (player, game) summaries per
+        player or game.
+    '''
+    previous, previous_new = totals.get(key, (None, 0))
+    totals[key] = (_combine(previous, stats), previous_new + new)
+
+
+def _add_stats(model, lookup, stats, **counters):
+    '''
+    Adds aggregates of new scores to an existing summary row with a single
+        UPDATE. Returns False when the row doesn't exist yet.
+    '''
+    count, total, best, last = stats
+    changes = dict(
+        (name, F(name) + value) for name, value in counters.items()
+    )
+    changes.update(
+        score_count=F('score_count') + count,
+        score_total=F('score_total') + total,
+        best_score=Greatest(
+            'best_score',
+            Value(best, output_field=models.IntegerField())
+        ),
+        last_played=Greatest(
+            'last_played',
+            Value(last, output_field=models.DateTimeField())
+        )
+    )
+    return model.objects.filter(**lookup).update(**changes) > 0
+
+
+def _lock(model, lookup):
+    '''
+    Locks a summary row until the end of the transaction, so concurrent
+        writers adding to it wait until it's recomputed.
+    '''
+    list(model.objects.select_for_update().filter(**lookup).values('pk'))
+
+
+def _store(model, lookup, values):
+    '''
+    Saves recomputed aggregates of a summary row, deleting the row when
+        no scores are left.
+    '''
+    if not values['score_count']:
+        model.objects.filter(**lookup).delete()
+        return
+    model.objects.update_or_create(defaults=values, **lookup)
+
+
+def _create(model, lookup, values):
+    '''
+    Inserts a missing summary row computed from the rows this transaction
+        sees. Returns False when a concurrent writer inserted it first; its
+        row misses only the scores of this transaction, which are then
+        added to it incrementally.
+    '''
+    try:
+        with transaction.atomic():
+            model.objects.create(**dict(lookup, **values))
+    except IntegrityError:
+        return False
+    return True
+
+
+def _merge_aggregates(values, archived):
+    '''
+    Adds aggregates of archived scores to those of PlayerScore rows, either
+        may be empty (None sums and maxima).
+    '''
+    values = dict(values)
+    for name in ('score_count', 'score_total'):
+        values[name] = (values[name] or 0) + (archived[name] or 0)
+    for name in ('best_score', 'last_played'):
+        present = [
+            value for value in (values[name], archived[name])
+            if value is not None
+        ]
+        values[name] = max(present) if present else None
+    return values
+
+
+def _archive_aggregates():
+    return dict(
+        score_count=Sum('score_count'),
+        score_total=Sum('score_total'),
+        best_score=Max('best_score'),
+        last_played=Max('last_played')
+    )
+
+
+def _player_game_values(player_id, game_id):
+    values = PlayerScore.objects.filter(
+        player_id=player_id,
+        game_id=game_id
+    ).aggregate(
+        score_count=Count('pk'),
+        score_total=Sum('score'),
+        best_score=Max('score'),
+        last_played=Max('score_date')
+    )
+    archived = ScoreArchive.objects.filter(
+        player_id=player_id,
+        game_id=game_id
+    ).aggregate(**_archive_aggregates())
+    if archived['score_count']:
+        values = _merge_aggregates(values, archived)
+    return values
+
+
+def _summary_aggregates(**lookup):
+    return PlayerGameSummary.objects.filter(**lookup).aggregate(
+        score_count=Sum('score_count'),
+        score_total=Sum('score_total'),
+        best_score=Max('best_score'),
+        last_played=Max('last_played'),
+        summaries=Count('pk')
+    )
+
+
+def _player_values(player_id):
+    values = _summary_aggregates(player_id=player_id)
+    values['games_played'] = values.pop('summaries')
+    return values
+
+
+def _game_values(game_id):
+    values = _summary_aggregates(game_id=game_id)
+    values['players_count'] = values.pop('summaries')
+    return values
+
+
+def refresh_player_game(player_id, game_id):
+    '''
+    Recomputes the summary of a player in a game from its PlayerScore rows
+        and archived scores.
+    '''
+    lookup = {'player_id': player_id, 'game_id': game_id}
+    _lock(PlayerGameSummary, lookup)
+    _store(
+        PlayerGameSummary,
+        lookup,
+        _player_game_values(player_id, game_id)
+    )
+
+
+def refresh_player(player_id):
+    '''
+    Recomputes the summary of a player from its per game summaries.
+    '''
+    lookup = {'player_id': player_id}
+    _lock(PlayerSummary, lookup)
+    _store(PlayerSummary, lookup, _player_values(player_id))
+
+
+def refresh_game(game_id):
+    '''
+    Recomputes the summary of a game from its per player summaries.
+    '''
+    lookup = {'game_id': game_id}
+    _lock(GameSummary, lookup)
+    _store(GameSummary, lookup, _game_values(game_id))
+
+
+def add_scores(scores):
+    '''
+    Updates summaries for newly created PlayerScore instances. Existing
+        summaries are changed in place with one UPDATE per row, so
+        concurrent writers don't overwrite each other's counts. Missing
+        rows are computed from the scores and summaries this transaction
+        sees and inserted; when a concurrent writer inserts the same row
+        first, the new scores are added to its row instead (see _create).
+        Rows are written in key order, so writers wait for each other
+        instead of deadlocking.
+    '''
+    players, games = {}, {}
+    with transaction.atomic():
+        for (player_id, game_id), stats in sorted(
+                _score_stats(scores).items()):
+            lookup = {'player_id': player_id, 'game_id': game_id}
+            new = 0
+            if not _add_stats(PlayerGameSummary, lookup, stats):
+                if _create(PlayerGameSummary, lookup,
+                           _player_game_values(player_id, game_id)):
+                    new = 1
+                else:
+                    _add_stats(PlayerGameSummary, lookup, stats)
+            _accumulate(players, player_id, stats, new)
+            _accumulate(games, game_id, stats, new)
+        for player_id, (stats, new) in sorted(players.items()):
+            lookup = {'player_id': player_id}
+            if not _add_stats(PlayerSummary, lookup, stats,
+                              games_played=new):
+                if not _create(PlayerSummary, lookup,
+                               _player_values(player_id)):
+                    _add_stats(PlayerSummary, lookup, stats,
+                               games_played=new)
+        for game_id, (stats, new) in sorted(games.items()):
+            lookup = {'game_id': game_id}
+            if not _add_stats(GameSummary, lookup, stats,
+                              players_count=new):
+                if not _create(GameSummary, lookup, _game_values(game_id)):
+                    _add_stats(GameSummary, lookup, stats,
+                               players_count=new)
+
+
+def refresh(keys):
+    '''
+    Recomputes summaries of (player, game) pairs whose scores were changed
+        or deleted. Best scores and last played dates can't be taken back
+        incrementally, so the affected rows are aggregated again.
+    '''
+    keys = sorted(set(keys))
+    with transaction.atomic():
+        for player_id, game_id in keys:
+            refresh_player_game(player_id, game_id)
+        for player_id in sorted(set(player_id for player_id, _ in keys)):
+            refresh_player(player_id)
+        for game_id in sorted(set(game_id for _, game_id in keys)):
+            refresh_game(game_id)
+
+
+def rebuild():
+    '''
+    Rebuilds every summary from PlayerScore rows and archived scores with
+        grouped aggregate queries. Archived aggregates are read per (player,
+        game) first and merged into the PlayerScore ones.
+    '''
+    with transaction.atomic():
+        PlayerGameSummary.objects.all().delete()
+        PlayerSummary.objects.all().delete()
+        GameSummary.objects.all().delete()
+        pairs = PlayerScore.objects.order_by().values(
+            'player_id', 'game_id'
+        ).annotate(
+            score_count=Count('pk'),
+            score_total=Sum('score'),
+            best_score=Max('score'),
+            last_played=Max('score_date')
+        )
+        archived = dict(
+            ((row['player_id'], row['game_id']), row)
+            for row in ScoreArchive.objects.order_by().values(
+                'player_id', 'game_id'
+            ).annotate(**_archive_aggregates()).iterator()
+        )
+        _bulk_create(PlayerGameSummary, _merge_archived(pairs, archived))
+        for model, key, counter in (
+                (PlayerSummary, 'player_id', 'games_played'),
+                (GameSummary, 'game_id', 'players_count')):
+            rows = PlayerGameSummary.objects.order_by().values(key).annotate(
+                score_count=Sum('score_count'),
+                score_total=Sum('score_total'),
+                best_score=Max('best_score'),
+                last_played=Max('last_played'),
+                **{counter: Count('pk')}
+            )
+            _bulk_create(model, rows.iterator())
+
+
+def _merge_archived(pairs, archived):
+    for row in pairs.iterator():
+        key = (row['player_id'], row['game_id'])
+        if key in archived:
+            row = _merge_aggregates(row, archived.pop(key))
+        yield row
+    for row in archived.values():
+        yield row
+
+
+def _bulk_create(model, rows, batch_size=1000):
+    batch = []
+    for row in rows:
+        batch.append(model(**row))
+        if len(batch) == batch_size:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
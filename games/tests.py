@@ -1,3 +1,1741 @@
-from django.test import TestCase
+# python imports
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+from base64 import b64decode, b64encode
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+# django imports
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.urlresolvers import reverse, set_script_prefix
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.six.moves.urllib.parse import parse_qs, urlparse
+# rest_framework import
+from rest_framework import renderers, throttling
+from rest_framework.exceptions import ParseError
+from rest_framework.reverse import reverse as drf_reverse
+from rest_framework.test import APIClient, APIRequestFactory
+# local imports
+from . import cache, changes, hyperlinks, ingestion, instrumentation,\
+    leaderboard, partitions, pool, routers, summaries
+from . import parsers as games_parsers
+from . import renderers as games_renderers
+from . import throttling as games_throttling
+from .asgi import ASGIHandler
+from .authentication import CachedBasicAuthentication
+from .cache import CachedResponseMixin
+from .models import CacheTag, Change, Game, GameCategory, GameSummary,\
+    LeaderboardEntry, Player, PlayerGameSummary, PlayerScore, PlayerSummary,\
+    ReplicaPin, ScoreArchive, ScoreBufferSegment, ThrottleCounter
+from .pagination import KeysetPagination
+from .renderers import format_datetime
+from .views import PlayerScoreExport, PlayerScoreList
 
-# Create your tests here.
+
+class APITestCase(TestCase):
+    '''
+    Creates a category, games and players and turns throttles off, their
+        rates are far below what a test sends. Writes of a test invalidate
+        cached responses only after run_commit_hooks.
+    '''
+    players_count = 3
+    games_count = 2
+
+    def setUp(self):
+        caches['default'].clear()
+        patcher = mock.patch.object(
+            throttling.SimpleRateThrottle,
+            'THROTTLE_RATES',
+            dict(
+                (scope, None)
+                for scope in throttling.SimpleRateThrottle.THROTTLE_RATES
+            )
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.now = timezone.now()
+        self.user = User.objects.create_user('owner', password='password')
+        self.category = GameCategory.objects.create(name='Arcade')
+        self.games = [
+            self.create_game('Game {}'.format(index))
+            for index in range(self.games_count)
+        ]
+        self.players = [
+            Player.objects.create(name='Player {}'.format(index))
+            for index in range(self.players_count)
+        ]
+        self.run_commit_hooks()
+
+    def create_game(self, name):
+        return Game.objects.create(
+            owner=self.user,
+            name=name,
+            release_date=self.now,
+            game_category=self.category
+        )
+
+    def create_score(self, player, game, score, days_ago=0):
+        return PlayerScore.objects.create(
+            player=player,
+            game=game,
+            score=score,
+            score_date=self.now - timedelta(days=days_ago)
+        )
+
+    def get_json(self, url, data=None, **extra):
+        return self.client.get(
+            url, data, HTTP_ACCEPT='application/json', **extra
+        )
+
+    def read(self, response):
+        '''
+        Returns the JSON body of a response, also of cached responses which
+            aren't rendered by a view.
+        '''
+        return json.loads(response.content.decode('utf-8'))
+
+    def send_json(self, method, url, data):
+        return getattr(self.client, method)(
+            url,
+            json.dumps(data),
+            content_type='application/json',
+            HTTP_ACCEPT='application/json'
+        )
+
+    def run_commit_hooks(self):
+        '''
+        Runs on_commit callbacks registered so far, the transaction of a
+            test is never committed.
+        '''
+        callbacks = connection.run_on_commit
+        connection.run_on_commit = []
+        for sids, func in callbacks:
+            func()
+
+    def get_uncached(self, url, data=None):
+        '''
+        Returns the JSON body and SQL of the queries of an uncached GET
+            request.
+        '''
+        formats = CachedResponseMixin.uncached_formats + ('json',)
+        with mock.patch.object(
+                CachedResponseMixin, 'uncached_formats', formats):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get_json(url, data)
+        self.assertEqual(response.status_code, 200)
+        return self.read(response), [query['sql'] for query in queries]
+
+    def get_query_count(self, url, data=None):
+        '''
+        Returns the number of queries of an uncached GET request.
+        '''
+        return len(self.get_uncached(url, data)[1])
+
+
+class QueryPlanTests(APITestCase):
+
+    def add_rows(self, count):
+        for index in range(count):
+            player = Player.objects.create(name='Extra {}'.format(index))
+            game = self.create_game('Extra {}'.format(index))
+            self.create_score(player, game, index)
+
+    def test_query_count_does_not_depend_on_rows(self):
+        urls = [
+            (reverse('game-list'), {'limit': 10}),
+            (reverse('playerscore-list'), {'limit': 10}),
+            (reverse('game-detail', kwargs={'pk': self.games[0].pk}), None),
+        ]
+        self.create_score(self.players[0], self.games[0], 1)
+        counts = [self.get_query_count(url, data) for url, data in urls]
+        self.add_rows(10)
+        caches['default'].clear()
+        self.assertEqual(
+            [self.get_query_count(url, data) for url, data in urls], counts
+        )
+
+
+class LeaderboardTests(APITestCase):
+
+    def get_ranks(self, game):
+        entries = leaderboard.with_ranks(
+            LeaderboardEntry.objects.filter(game=game)
+        ).order_by('rank', 'player_id')
+        return [
+            (entry.player_id, entry.score, entry.rank) for entry in entries
+        ]
+
+    def assertRanks(self, game, expected):
+        ranks = self.get_ranks(game)
+        self.assertEqual(ranks, [
+            (player.pk, score, rank) for player, score, rank in expected
+        ])
+        leaderboard.rebuild(game.pk)
+        self.assertEqual(self.get_ranks(game), ranks)
+
+    def test_ranks_shift_on_writes(self):
+        game, other_game = self.games
+        first, second, third = self.players
+        self.create_score(first, game, 30)
+        self.create_score(second, game, 20)
+        low = self.create_score(third, game, 10)
+        self.assertRanks(game, [(first, 30, 1), (second, 20, 2),
+                                (third, 10, 3)])
+        best = self.create_score(third, game, 40)
+        self.assertRanks(game, [(third, 40, 1), (first, 30, 2),
+                                (second, 20, 3)])
+        # not a best score
+        self.create_score(first, game, 5)
+        self.assertRanks(game, [(third, 40, 1), (first, 30, 2),
+                                (second, 20, 3)])
+        # equal scores share a rank, the next one is skipped
+        best.score = 30
+        best.save()
+        self.assertRanks(game, [(first, 30, 1), (third, 30, 1),
+                                (second, 20, 3)])
+        best.delete()
+        self.assertRanks(game, [(first, 30, 1), (second, 20, 2),
+                                (third, 10, 3)])
+        low.game = other_game
+        low.save()
+        self.assertRanks(game, [(first, 30, 1), (second, 20, 2)])
+        self.assertRanks(other_game, [(third, 10, 1)])
+        second.delete()
+        self.assertRanks(game, [(first, 30, 1)])
+
+    def test_earlier_equal_score_replaces_the_best_score(self):
+        game, player = self.games[0], self.players[0]
+        self.create_score(player, game, 30, days_ago=1)
+        self.create_score(player, game, 30, days_ago=5)
+        self.create_score(player, game, 30, days_ago=3)
+        entry = LeaderboardEntry.objects.get(game=game, player=player)
+        self.assertEqual(entry.score_date, self.now - timedelta(days=5))
+
+    def test_writes_only_change_the_entry_of_their_player(self):
+        game = self.games[0]
+        for index, player in enumerate(self.players):
+            self.create_score(player, game, index * 10)
+        before = dict(LeaderboardEntry.objects.filter(
+            game=game
+        ).values_list('player_id', 'score'))
+        with CaptureQueriesContext(connection) as queries:
+            self.create_score(self.players[0], game, 100)
+        updates = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('UPDATE "games_leaderboardentry"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertIn(str(self.players[0].pk), updates[0])
+        after = dict(LeaderboardEntry.objects.filter(
+            game=game
+        ).values_list('player_id', 'score'))
+        before[self.players[0].pk] = 100
+        self.assertEqual(after, before)
+
+    def test_leaderboard_views(self):
+        game = self.games[0]
+        for days_ago, (player, score) in enumerate(
+                zip(self.players, (20, 30, 20))):
+            # earlier scores come first among equal ones
+            self.create_score(player, game, score, days_ago=3 - days_ago)
+        data = self.read(self.get_json(
+            reverse('game-leaderboard', kwargs={'pk': game.pk})
+        ))
+        self.assertEqual(
+            [(entry['player'], entry['rank']) for entry in data],
+            [('Player 1', 1), ('Player 0', 2), ('Player 2', 2)]
+        )
+        data = self.read(self.get_json(reverse(
+            'game-leaderboard-player-rank',
+            kwargs={'pk': game.pk, 'player_pk': self.players[2].pk}
+        )))
+        self.assertEqual((data['rank'], data['score']), (2, 20))
+
+    def test_deleting_a_game_skips_per_score_refreshes(self):
+        game, other_game = self.games
+        player = self.players[0]
+        for score in range(5):
+            self.create_score(player, game, score)
+        self.create_score(player, other_game, 50)
+        with mock.patch.object(
+                leaderboard, 'refresh_entry') as refresh_entry:
+            game.delete()
+        refresh_entry.assert_not_called()
+        self.assertFalse(LeaderboardEntry.objects.filter(game=game).exists())
+        summary = PlayerSummary.objects.get(player=player)
+        self.assertEqual(
+            (summary.score_count, summary.games_played, summary.best_score),
+            (1, 1, 50)
+        )
+
+    def test_deleting_a_player_refreshes_game_summaries_once(self):
+        game = self.games[0]
+        for player in self.players:
+            self.create_score(player, game, 10)
+            self.create_score(player, game, 20)
+        with mock.patch.object(
+                summaries, 'refresh_game',
+                wraps=summaries.refresh_game) as refresh_game:
+            self.players[0].delete()
+        refresh_game.assert_called_once_with(game.pk)
+        summary = GameSummary.objects.get(game=game)
+        self.assertEqual((summary.score_count, summary.players_count), (4, 2))
+        self.assertRanks(game, [(self.players[1], 20, 1),
+                                (self.players[2], 20, 1)])
+
+
+class KeysetPaginationTests(APITestCase):
+
+    def setUp(self):
+        super(KeysetPaginationTests, self).setUp()
+        for index in range(23):
+            self.create_score(
+                self.players[index % 3],
+                self.games[index % 2],
+                index % 5,
+                days_ago=index
+            )
+        self.url = reverse('playerscore-list')
+
+    def walk(self, url, link):
+        '''
+        Follows next or previous links from url, returns (url, pks) pages.
+        '''
+        pages = []
+        while url:
+            response = self.get_json(url)
+            self.assertEqual(response.status_code, 200)
+            data = self.read(response)
+            pages.append((url, [item['pk'] for item in data['results']]))
+            url = data[link]
+        return pages
+
+    def get_cursor(self, link):
+        return parse_qs(urlparse(link).query)['cursor'][0]
+
+    def test_pages_cover_every_score_once(self):
+        for ordering in ('-score', 'score', 'score_date', '-score_date'):
+            pages = self.walk(
+                '{}?limit=4&ordering={}'.format(self.url, ordering), 'next'
+            )
+            pks = [pk for url, page in pages for pk in page]
+            self.assertEqual(len(pks), 23)
+            self.assertEqual(len(set(pks)), 23)
+            last_url, last_page = pages[-1]
+            previous = self.read(self.get_json(last_url))['previous']
+            backward = self.walk(previous, 'previous')
+            self.assertEqual(
+                [pk for url, page in reversed(backward) for pk in page],
+                pks[:-len(last_page)]
+            )
+
+    def test_tampered_cursor_is_not_found(self):
+        response = self.get_json(self.url, {'limit': 4})
+        cursor = json.loads(b64decode(
+            self.get_cursor(self.read(response)['next']).encode('ascii')
+        ).decode('utf-8'))
+        for position in (['abc', '1'], [{}, '1'], [None, '1'], ['1'],
+                         ['1', '2', '3'], 'abc'):
+            tampered = b64encode(json.dumps(
+                dict(cursor, p=position)
+            ).encode('utf-8')).decode('ascii')
+            response = self.get_json(self.url, {'cursor': tampered})
+            self.assertEqual(response.status_code, 404, position)
+        for tampered in ('not base64!', b64encode(b'[]').decode('ascii')):
+            response = self.get_json(self.url, {'cursor': tampered})
+            self.assertEqual(response.status_code, 404, tampered)
+
+    def test_cursor_of_another_ordering_is_not_found(self):
+        response = self.get_json(self.url, {'limit': 4})
+        cursor = self.get_cursor(self.read(response)['next'])
+        response = self.get_json(
+            self.url, {'cursor': cursor, 'ordering': 'score_date'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_filter_bounds_the_first_ordering_column(self):
+        pagination = KeysetPagination()
+        pagination.ordering = ('-score', 'pk')
+        condition = pagination._keyset_filter([3, 7], reverse=False)
+        self.assertIn(('score__lte', 3), condition.children)
+        pagination.ordering = ('score_date', 'pk')
+        condition = pagination._keyset_filter([self.now, 7], reverse=True)
+        self.assertIn(('score_date__lte', self.now), condition.children)
+        condition = pagination._keyset_filter([self.now, 7], reverse=False)
+        self.assertIn(('score_date__gte', self.now), condition.children)
+
+
+class NameListingPaginationTests(APITestCase):
+
+    def setUp(self):
+        super(NameListingPaginationTests, self).setUp()
+        for name in ('Walker', 'Walker 2', 'Skywalker', 'Sleepwalker',
+                     'Walker 3', 'Nobody', 'Walker 4', 'Moonwalker'):
+            Player.objects.create(name=name)
+
+    def walk(self, url, data):
+        names = []
+        response = self.get_json(url, data)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            page = self.read(response)
+            names.extend(player['name'] for player in page['results'])
+            if page['next'] is None:
+                return page, names
+            response = self.get_json(page['next'])
+
+    def test_listings_use_cursors(self):
+        User.objects.create_user('player')
+        GameCategory.objects.create(name='Racing')
+        for url in (reverse('player-list'), reverse('game-list'),
+                    reverse('gamecategory-list'), reverse('user-list')):
+            page = self.read(self.get_json(url, {'limit': 1}))
+            self.assertIn('cursor=', page['next'])
+            self.assertIn('count', page)
+
+    def test_walk_in_name_order(self):
+        names = sorted(Player.objects.values_list('name', flat=True))
+        url = reverse('player-list')
+        page, walked = self.walk(url, {'limit': 3})
+        self.assertEqual(walked, names)
+        self.assertEqual(page['count'], len(names))
+        page, walked = self.walk(url, {'limit': 3, 'ordering': '-name'})
+        self.assertEqual(walked, names[::-1])
+
+    def test_walk_in_search_relevance_order(self):
+        page, walked = self.walk(reverse('player-list'), {
+            'limit': 2, 'search': 'walker', 'search_mode': 'fuzzy'
+        })
+        # exact, prefix, then substring matches, in pk order
+        self.assertEqual(walked, [
+            'Walker', 'Walker 2', 'Walker 3', 'Walker 4', 'Skywalker',
+            'Sleepwalker', 'Moonwalker'
+        ])
+        self.assertEqual(page['count'], 7)
+
+
+class CountTests(APITestCase):
+
+    def get_count(self, url, data=None):
+        '''
+        Returns count and count_approximate of a listing and whether the
+            request ran COUNT(*).
+        '''
+        with CaptureQueriesContext(connection) as queries:
+            page = self.read(self.get_json(url, data))
+        counted = any(
+            'COUNT(*)' in query['sql'] and 'games_cache' not in query['sql']
+            for query in queries
+        )
+        return page['count'], page['count_approximate'], counted
+
+    def test_counts_are_cached_per_filter(self):
+        url = reverse('player-list')
+        self.assertEqual(self.get_count(url), (3, False, True))
+        for data in ({'fields': 'name'}, {'expand': 'scores'},
+                     {'ordering': '-name', 'limit': 1}):
+            self.assertEqual(self.get_count(url, data), (3, True, False))
+        self.assertEqual(
+            self.get_count(url, {'name': 'Player 1'}), (1, False, True)
+        )
+        self.assertEqual(
+            self.get_count(url, {'name': 'Player 1', 'fields': 'url'}),
+            (1, True, False)
+        )
+
+    def test_empty_filter_is_not_counted(self):
+        url = reverse('game-list')
+        self.assertEqual(
+            self.get_count(url, {'game_category': 0}), (0, False, False)
+        )
+
+
+class AuthenticationCacheTests(APITestCase):
+
+    def post_game(self, name, password='password'):
+        credentials = b64encode(
+            'owner:{}'.format(password).encode('utf-8')
+        ).decode('ascii')
+        return self.client.post(
+            reverse('game-list'),
+            json.dumps({
+                'name': name,
+                'release_date': self.now.isoformat(),
+                'game_category': self.category.name
+            }),
+            content_type='application/json',
+            HTTP_ACCEPT='application/json',
+            HTTP_AUTHORIZATION='Basic {}'.format(credentials)
+        )
+
+    def get_stats(self):
+        return CachedBasicAuthentication.get_stats()
+
+    def test_repeated_credentials_hit_the_cache(self):
+        before = self.get_stats()
+        for index in range(3):
+            response = self.post_game('New {}'.format(index))
+            self.assertEqual(response.status_code, 201)
+        after = self.get_stats()
+        self.assertEqual(after['hits'] - before['hits'], 2)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+
+    def test_password_change_invalidates_the_cache(self):
+        self.assertEqual(self.post_game('Before').status_code, 201)
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertEqual(self.post_game('Stale').status_code, 401)
+        self.assertEqual(
+            self.post_game('After', 'changed').status_code, 201
+        )
+
+    def test_counters_are_exported(self):
+        self.post_game('Missed')
+        self.post_game('Hit')
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        stats = self.get_stats()
+        content = response.content.decode('utf-8')
+        for result, name in (('hit', 'hits'), ('miss', 'misses')):
+            self.assertIn(
+                'games_basic_auth_cache_total{{result="{}"}} {}'.format(
+                    result, stats[name]
+                ),
+                content
+            )
+
+
+class ThrottleTests(TestCase):
+    '''
+    Sends requests through anon throttles of 3 requests per minute, each
+        throttle stands for a worker process.
+    '''
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            throttling.SimpleRateThrottle,
+            'THROTTLE_RATES',
+            {'anon': '3/min'}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request = APIRequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+        self.request.user = AnonymousUser()
+
+    def allow(self, seconds):
+        throttle = games_throttling.AnonRateThrottle()
+        throttle.timer = lambda: seconds
+        return throttle.allow_request(self.request, None), throttle.wait()
+
+    def test_limit_is_shared_across_throttles(self):
+        for seconds in (600, 610, 620):
+            self.assertTrue(self.allow(seconds)[0])
+        allowed, wait = self.allow(630)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 30)
+
+    def test_previous_window_is_weighted_by_its_overlap(self):
+        for seconds in (630, 640, 650):
+            self.allow(seconds)
+        # 3 previous requests weigh 3 at the start of the next window
+        allowed, wait = self.allow(660)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 20)
+        # and 1 two thirds into it, which leaves room for two requests
+        self.assertTrue(self.allow(700)[0])
+        self.assertTrue(self.allow(701)[0])
+        self.assertFalse(self.allow(702)[0])
+
+    def test_rejected_requests_do_not_count(self):
+        for seconds in range(600, 610):
+            self.allow(seconds)
+        self.assertEqual(
+            ThrottleCounter.objects.get(window=10).count, 3
+        )
+
+    def test_old_windows_are_deleted(self):
+        for seconds in (600, 660, 720):
+            self.allow(seconds)
+        self.assertEqual(
+            sorted(ThrottleCounter.objects.values_list('window', flat=True)),
+            [11, 12]
+        )
+
+
+class ResponseCacheTests(APITestCase):
+
+    def get_names(self, url):
+        results = self.read(self.get_json(url))['results']
+        return [result['name'] for result in results]
+
+    def test_writes_invalidate_cached_responses_once_committed(self):
+        url = reverse('gamecategory-detail', kwargs={'pk': self.category.pk})
+        self.assertEqual(self.read(self.get_json(url))['name'], 'Arcade')
+        # an update without signals leaves the cached response
+        GameCategory.objects.filter(pk=self.category.pk).update(
+            name='Puzzle'
+        )
+        self.assertEqual(self.read(self.get_json(url))['name'], 'Arcade')
+        self.category.name = 'Racing'
+        self.category.save()
+        self.assertEqual(self.read(self.get_json(url))['name'], 'Arcade')
+        self.run_commit_hooks()
+        self.assertEqual(self.read(self.get_json(url))['name'], 'Racing')
+
+        url = reverse('player-list')
+        self.assertNotIn('Player 3', self.get_names(url))
+        Player.objects.create(name='Player 3')
+        self.run_commit_hooks()
+        self.assertIn('Player 3', self.get_names(url))
+
+    def test_rolled_back_writes_keep_cached_responses(self):
+        url = reverse('player-detail', kwargs={'pk': self.players[0].pk})
+        version = cache.get_tag_versions(['player:{}'.format(
+            self.players[0].pk
+        )])
+        self.get_json(url)
+        try:
+            with transaction.atomic():
+                self.players[0].name = 'Renamed'
+                self.players[0].save()
+                raise ValueError
+        except ValueError:
+            pass
+        self.run_commit_hooks()
+        self.assertEqual(
+            cache.get_tag_versions(
+                ['player:{}'.format(self.players[0].pk)]
+            ),
+            version
+        )
+        self.assertEqual(self.read(self.get_json(url))['name'], 'Player 0')
+
+    def test_tags_of_a_transaction_are_bumped_at_once(self):
+        tags = ['game', 'player', 'player:1']
+        versions = cache.get_tag_versions(tags)
+        with transaction.atomic():
+            cache.invalidate('game', 'player')
+            cache.invalidate('player', 'player:1')
+        with CaptureQueriesContext(connection) as queries:
+            self.run_commit_hooks()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            cache.get_tag_versions(tags),
+            [version + 1 for version in versions]
+        )
+
+    def test_game_listings_ignore_score_writes(self):
+        url = reverse('game-list')
+        self.assertEqual(self.get_names(url), ['Game 0', 'Game 1'])
+        self.create_score(self.players[0], self.games[0], 10)
+        self.run_commit_hooks()
+        with CaptureQueriesContext(connection) as queries:
+            self.get_json(url)
+        self.assertFalse(any(
+            query['sql'].startswith('SELECT "games_game"')
+            for query in queries
+        ))
+        self.games[0].name = 'Renamed'
+        self.games[0].save()
+        self.run_commit_hooks()
+        self.assertEqual(self.get_names(url), ['Game 1', 'Renamed'])
+
+    def test_conditional_requests(self):
+        url = reverse('player-detail', kwargs={'pk': self.players[0].pk})
+        response = self.get_json(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.get_json(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        self.players[0].name = 'Renamed'
+        self.players[0].save()
+        self.run_commit_hooks()
+        response = self.get_json(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.read(response)['name'], 'Renamed')
+
+    def test_pins_expire(self):
+        request = APIRequestFactory().post('/', REMOTE_ADDR='10.0.0.1')
+        request.user = AnonymousUser()
+        with self.settings(READ_REPLICA_MAX_LAG=5):
+            routers.pin_to_primary(request)
+            self.assertTrue(routers.is_pinned(request))
+            ReplicaPin.objects.update(expires=self.now)
+            self.assertFalse(routers.is_pinned(request))
+            routers.pin_to_primary(request)
+            self.assertTrue(routers.is_pinned(request))
+        self.assertEqual(ReplicaPin.objects.count(), 1)
+
+
+class BulkScoreTests(APITestCase):
+
+    def setUp(self):
+        super(BulkScoreTests, self).setUp()
+        self.url = reverse('playerscore-list')
+        self.client.force_authenticate(self.user)
+
+    def get_item(self, player=None, score=10):
+        return {
+            'player': player or self.players[0].name,
+            'game': self.games[0].name,
+            'score': score,
+            'score_date': self.now.isoformat(),
+        }
+
+    def test_create_reports_invalid_items_by_index(self):
+        response = self.send_json('post', self.url, [
+            self.get_item(score=10),
+            self.get_item(score='many'),
+            self.get_item(player='Nobody'),
+            self.get_item(score=20),
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        errors = response.data['errors']
+        self.assertEqual([error['index'] for error in errors], [1, 2])
+        self.assertIn('score', errors[0]['errors'])
+        self.assertIn('player', errors[1]['errors'])
+        self.assertEqual(
+            sorted(PlayerScore.objects.values_list('score', flat=True)),
+            [10, 20]
+        )
+
+    def test_create_without_valid_items(self):
+        response = self.send_json('post', self.url, [
+            self.get_item(score='many'),
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], 0)
+        self.assertFalse(PlayerScore.objects.exists())
+
+    def test_update_reports_invalid_items_by_index(self):
+        first = self.create_score(self.players[0], self.games[0], 10)
+        second = self.create_score(self.players[1], self.games[0], 20)
+        response = self.send_json('patch', self.url, [
+            {'pk': first.pk, 'score': 50},
+            {'pk': second.pk + 1000, 'score': 1},
+            {'pk': second.pk, 'score': 'many'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(
+            [error['index'] for error in response.data['errors']], [1, 2]
+        )
+        self.assertEqual(
+            response.data['errors'][0]['errors'], {'pk': ['Not found.']}
+        )
+        self.assertEqual(PlayerScore.objects.get(pk=first.pk).score, 50)
+        self.assertEqual(PlayerScore.objects.get(pk=second.pk).score, 20)
+        entry = leaderboard.with_ranks(LeaderboardEntry.objects).get(
+            player=self.players[0]
+        )
+        self.assertEqual(entry.rank, 1)
+
+    def test_delete(self):
+        first = self.create_score(self.players[0], self.games[0], 10)
+        self.create_score(self.players[1], self.games[0], 20)
+        response = self.send_json('delete', self.url, ['x'])
+        self.assertEqual(response.status_code, 400)
+        response = self.send_json('delete', self.url, [first.pk])
+        self.assertEqual(response.data['deleted'], 1)
+        self.assertEqual(PlayerScore.objects.count(), 1)
+        self.assertFalse(PlayerGameSummary.objects.filter(
+            player=self.players[0]
+        ).exists())
+
+    def test_changes_require_authentication(self):
+        score = self.create_score(self.players[0], self.games[0], 10)
+        self.client.force_authenticate(None)
+        response = self.send_json('patch', self.url, [
+            {'pk': score.pk, 'score': 50},
+        ])
+        self.assertEqual(response.status_code, 401)
+        response = self.send_json('delete', self.url, [score.pk])
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(PlayerScore.objects.get(pk=score.pk).score, 10)
+        response = self.send_json('post', self.url, [self.get_item()])
+        self.assertEqual(response.status_code, 201)
+
+    def test_size_is_capped(self):
+        with mock.patch.object(PlayerScoreList, 'max_bulk_size', 2):
+            response = self.send_json('delete', self.url, [1, 2, 3])
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportTests(APITestCase):
+
+    def setUp(self):
+        super(ExportTests, self).setUp()
+        self.url = reverse('playerscore-export')
+        self.scores = [
+            self.create_score(player, game, score)
+            for score, (player, game) in enumerate(
+                (player, game)
+                for player in self.players
+                for game in self.games
+            )
+        ]
+
+    def export(self, data, **extra):
+        response = self.client.get(self.url, data, **extra)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_export_is_filtered(self):
+        with mock.patch.object(PlayerScoreExport, 'chunk_size', 2):
+            with CaptureQueriesContext(connection) as queries:
+                content = self.export({'format': 'ndjson', 'min_score': 2})
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['score'] for row in rows], [2, 3, 4, 5])
+        self.assertEqual(rows[0]['player'], 'Player 1')
+        self.assertEqual(rows[0]['game'], 'Game 0')
+        # two full chunks and an empty one
+        self.assertEqual(len([
+            query for query in queries
+            if 'FROM "games_playerscore"' in query['sql']
+        ]), 3)
+
+    def test_csv_export(self):
+        content = self.export({}, HTTP_ACCEPT='text/csv')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'pk,score,score_date,player,game')
+        self.assertEqual(len(lines), len(self.scores) + 1)
+        self.assertTrue(
+            lines[1].startswith('{},0,'.format(self.scores[0].pk))
+        )
+
+
+class NameFilterTests(APITestCase):
+
+    def setUp(self):
+        super(NameFilterTests, self).setUp()
+        self.url = reverse('playerscore-list')
+        for player in self.players:
+            for score, game in enumerate(self.games):
+                self.create_score(player, game, score)
+
+    def get_scores(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.read(self.get_json(self.url, data))['results']
+        return results, [query['sql'] for query in queries]
+
+    def count_name_queries(self, queries):
+        return len([
+            query for query in queries
+            if query.startswith('SELECT "games_player"."name"') or
+            'DISTINCT' in query
+        ])
+
+    def test_names_are_filtered_without_loading_choices(self):
+        results, queries = self.get_scores({'player_name': 'Player 1'})
+        self.assertEqual(len(results), 2)
+        self.assertEqual(set(result['player'] for result in results),
+                         set(['Player 1']))
+        self.assertEqual(self.count_name_queries(queries), 0)
+        results, queries = self.get_scores(
+            {'player_name_prefix': 'Player', 'game_name': 'Game 1'}
+        )
+        self.assertEqual(len(results), 3)
+
+    def test_form_choices_are_cached_until_a_player_is_written(self):
+        def get_form():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url, HTTP_ACCEPT='text/html')
+            self.assertEqual(response.status_code, 200)
+            return response.content.decode('utf-8'), [
+                query['sql'] for query in queries
+            ]
+
+        content, queries = get_form()
+        self.assertIn('<option value="Player 2">', content)
+        self.assertEqual(self.count_name_queries(queries), 1)
+        content, queries = get_form()
+        self.assertEqual(self.count_name_queries(queries), 0)
+        Player.objects.create(name='Player 3')
+        self.run_commit_hooks()
+        content, queries = get_form()
+        self.assertIn('<option value="Player 3">', content)
+        self.assertEqual(self.count_name_queries(queries), 1)
+
+
+class ScoreIndexTests(TestCase):
+
+    def get_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' '.join(str(row[-1]) for row in cursor.fetchall())
+
+    def test_filters_and_ordering_read_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('plans are checked on SQLite')
+        scores = PlayerScore.objects.all()
+        for queryset, index in (
+                (scores.order_by('-score', 'pk'),
+                 'games_playerscore_score_id'),
+                (scores.filter(game_id=1).order_by('-score', 'pk'),
+                 'games_playerscore_game_score_id'),
+                (scores.filter(player_id=1).order_by('-score_date'),
+                 'games_playerscore_player_date')):
+            plan = self.get_plan(queryset[:10])
+            self.assertIn(index, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+
+class SummaryTests(APITestCase):
+
+    def get_snapshot(self):
+        return (
+            sorted(PlayerGameSummary.objects.values_list(
+                'player_id', 'game_id', 'score_count', 'score_total',
+                'best_score', 'last_played'
+            )),
+            sorted(PlayerSummary.objects.values_list(
+                'player_id', 'score_count', 'score_total', 'best_score',
+                'last_played', 'games_played'
+            )),
+            sorted(GameSummary.objects.values_list(
+                'game_id', 'score_count', 'score_total', 'best_score',
+                'last_played', 'players_count'
+            )),
+        )
+
+    def assertMatchesRebuild(self):
+        snapshot = self.get_snapshot()
+        summaries.rebuild()
+        self.assertEqual(self.get_snapshot(), snapshot)
+
+    def test_incremental_summaries_match_rebuild(self):
+        generator = random.Random(7)
+        url = reverse('playerscore-list')
+        for step in range(80):
+            scores = list(PlayerScore.objects.order_by('pk'))
+            action = generator.random()
+            if action < 0.45 or not scores:
+                self.create_score(
+                    generator.choice(self.players),
+                    generator.choice(self.games),
+                    generator.randint(0, 100),
+                    days_ago=generator.randint(0, 30)
+                )
+            elif action < 0.65:
+                score = generator.choice(scores)
+                score.score = generator.randint(0, 100)
+                score.game = generator.choice(self.games)
+                score.save()
+            elif action < 0.85:
+                generator.choice(scores).delete()
+            else:
+                response = self.send_json('post', url, [{
+                    'player': generator.choice(self.players).name,
+                    'game': generator.choice(self.games).name,
+                    'score': generator.randint(0, 100),
+                    'score_date': self.now.isoformat(),
+                } for index in range(3)])
+                self.assertEqual(response.status_code, 201)
+        self.assertMatchesRebuild()
+
+    def test_concurrent_creation_of_a_summary_row(self):
+        game, player = self.games[0], self.players[0]
+        # a concurrent writer inserted the row after this transaction's
+        # UPDATE missed it
+        self.create_score(player, game, 5)
+        add_stats = summaries._add_stats
+        missed = set()
+
+        def missing_once(model, lookup, stats, **counters):
+            key = (model, tuple(sorted(lookup.items())))
+            if key not in missed:
+                missed.add(key)
+                return False
+            return add_stats(model, lookup, stats, **counters)
+
+        with mock.patch.object(summaries, '_add_stats', missing_once):
+            self.create_score(player, game, 9)
+        summary = PlayerGameSummary.objects.get(player=player, game=game)
+        self.assertEqual((summary.score_count, summary.best_score), (2, 9))
+        self.assertEqual(GameSummary.objects.get(game=game).players_count, 1)
+        self.assertMatchesRebuild()
+
+    def test_stats_views(self):
+        self.create_score(self.players[0], self.games[0], 10, days_ago=2)
+        self.create_score(self.players[0], self.games[1], 30, days_ago=1)
+        self.create_score(self.players[1], self.games[0], 20)
+        self.run_commit_hooks()
+        url = reverse('player-stats', kwargs={'pk': self.players[0].pk})
+        stats = self.read(self.get_json(url))
+        self.assertEqual(
+            (stats['games_played'], stats['score_count'],
+             stats['best_score'], stats['average_score']),
+            (2, 2, 30, 20.0)
+        )
+        url = reverse('game-stats', kwargs={'pk': self.games[0].pk})
+        stats = self.read(self.get_json(url))
+        self.assertEqual(
+            (stats['players_count'], stats['best_score']), (2, 20)
+        )
+
+
+class FieldSelectionTests(APITestCase):
+
+    def setUp(self):
+        super(FieldSelectionTests, self).setUp()
+        for player in self.players:
+            self.create_score(player, self.games[0], 10)
+
+    def test_unselected_relations_are_not_queried(self):
+        url = reverse('player-list')
+        page, queries = self.get_uncached(url, {'fields': 'name'})
+        self.assertEqual(page['results'], [
+            {'name': 'Player 0'}, {'name': 'Player 1'}, {'name': 'Player 2'}
+        ])
+        self.assertFalse(any('games_playerscore' in sql for sql in queries))
+        self.assertFalse(any('"created"' in sql for sql in queries))
+        page, queries = self.get_uncached(url, {'exclude': 'scores,stats'})
+        self.assertNotIn('scores', page['results'][0])
+        self.assertIn('gender', page['results'][0])
+        self.assertFalse(any('games_playerscore' in sql for sql in queries))
+
+    def test_nested_fields(self):
+        page, queries = self.get_uncached(
+            reverse('player-list'), {'fields': 'name,scores.score'}
+        )
+        self.assertEqual(page['results'][0]['scores'], [{'score': 10}])
+
+    def test_expanded_relations(self):
+        url = reverse('playerscore-list')
+        page, queries = self.get_uncached(url, {
+            'expand': 'game,game.game_category',
+            'fields': 'score,game.name,game.game_category.name'
+        })
+        self.assertEqual(page['results'][0], {
+            'score': 10,
+            'game': {'name': 'Game 0', 'game_category': {'name': 'Arcade'}}
+        })
+        self.assertEqual(len(queries), 1)
+        page, queries = self.get_uncached(url, {'fields': 'score,game'})
+        self.assertEqual(page['results'][0], {'score': 10, 'game': 'Game 0'})
+
+
+class CappedRelationTests(APITestCase):
+
+    players_count = 12
+
+    def setUp(self):
+        super(CappedRelationTests, self).setUp()
+        for index in range(12):
+            self.create_game('Extra {}'.format(index))
+        games = list(Game.objects.order_by('pk'))
+        for index, player in enumerate(self.players):
+            for score, game in enumerate(games[:index + 1]):
+                self.create_score(player, game, score)
+        User.objects.create_user('other', password='password')
+
+    def get_query_counts(self, url, data=None):
+        counts = []
+        for limit in (2, 10):
+            caches['default'].clear()
+            counts.append(self.get_query_count(
+                url, dict(data or {}, limit=limit)
+            ))
+        return counts
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        game = self.games[0]
+        for url, data in (
+                (reverse('player-list'), None),
+                (reverse('player-list'), {'fields': 'name,scores.score'}),
+                (reverse('user-list'), None),
+                (reverse('gamecategory-list'), None),
+                (reverse('game-list'), {'expand': 'game_category'}),
+                (reverse('game-leaderboard', kwargs={'pk': game.pk}),
+                 {'expand': 'player'})):
+            first, second = self.get_query_counts(url, data)
+            self.assertEqual(first, second, url)
+
+    def test_first_rows_of_every_parent(self):
+        page, queries = self.get_uncached(
+            reverse('player-list'), {'limit': 12, 'fields': 'name,scores.pk'}
+        )
+        self.assertEqual(len(queries), 3)
+        for result in page['results']:
+            player = Player.objects.get(name=result['name'])
+            expected = list(PlayerScore.objects.filter(
+                player=player
+            ).order_by('-score', 'score_date', 'pk').values_list(
+                'pk', flat=True
+            )[:10])
+            self.assertEqual(
+                [score['pk'] for score in result['scores']], expected
+            )
+
+    def test_detail_matches_the_sub_collection(self):
+        player = self.players[-1]
+        detail = self.read(self.get_json(
+            reverse('player-detail', kwargs={'pk': player.pk})
+        ))
+        self.assertEqual(len(detail['scores']), 10)
+        page = self.read(self.get_json(detail['scores_url'], {'limit': 10}))
+        self.assertEqual(
+            [score['pk'] for score in detail['scores']],
+            [score['pk'] for score in page['results']]
+        )
+
+
+class HyperlinkTests(TestCase):
+
+    def test_templates_match_reverse(self):
+        request = APIRequestFactory().get('/', HTTP_HOST='example.com')
+        templates = hyperlinks.get_url_templates()
+        self.assertIn('player-detail', templates)
+        self.assertIn('gamecategory-game-list', templates)
+        for view_name in templates:
+            for pk in (1, 42, 1000000):
+                self.assertEqual(
+                    hyperlinks.build_url(view_name, pk, request),
+                    drf_reverse(view_name, kwargs={'pk': pk},
+                                request=request)
+                )
+
+    def test_format_override_falls_back_to_reverse(self):
+        request = APIRequestFactory().get('/', {'format': 'json'})
+        self.assertEqual(
+            hyperlinks.build_url('player-detail', 5, request),
+            'http://testserver/players/5/?format=json'
+        )
+
+    def test_script_prefix(self):
+        request = APIRequestFactory().get('/')
+        set_script_prefix('/api/')
+        self.addCleanup(set_script_prefix, '/')
+        self.assertEqual(
+            hyperlinks.build_url('game-detail', 7, request),
+            'http://testserver/api/games/7/'
+        )
+
+
+class JSONRenderingTests(TestCase):
+
+    def get_data(self):
+        moment = timezone.now().replace(microsecond=123456)
+        return {
+            'name': 'Zo\xeb\u2028\U0001f3ae',
+            'score_date': moment,
+            'average': 1.5,
+            'results': [{'pk': 1, 'played': True, 'stats': None}],
+        }, format_datetime(moment)
+
+    def test_output_matches_rest_framework(self):
+        data, moment = self.get_data()
+        expected = renderers.JSONRenderer().render(
+            dict(data, score_date=moment)
+        )
+        for encoder in (games_renderers.orjson, None):
+            with mock.patch.object(games_renderers, 'orjson', encoder):
+                self.assertEqual(
+                    games_renderers.JSONRenderer().render(data), expected
+                )
+
+    def test_parser(self):
+        body = '{"name": "Zoë", "score": 10}'.encode('utf-8')
+        for decoder in (games_parsers.orjson, None):
+            with mock.patch.object(games_parsers, 'orjson', decoder):
+                parser = games_parsers.JSONParser()
+                self.assertEqual(
+                    parser.parse(BytesIO(body)),
+                    {'name': 'Zoë', 'score': 10}
+                )
+                with self.assertRaises(ParseError):
+                    parser.parse(BytesIO(b'{"name": '))
+
+
+class ReplicaRoutingTests(APITestCase):
+
+    def setUp(self):
+        super(ReplicaRoutingTests, self).setUp()
+        self.addCleanup(routers._unavailable.clear)
+        self.addCleanup(routers._in_flight.clear)
+        self.addCleanup(routers.release)
+
+    def get_connections(self, failing=()):
+        def connection(alias):
+            mocked = mock.Mock(in_atomic_block=False)
+            if alias in failing:
+                mocked.ensure_connection.side_effect = DatabaseError
+            return mocked
+        return dict(
+            (alias, connection(alias))
+            for alias in ('default', 'replica', 'replica2')
+        )
+
+    @override_settings(READ_REPLICAS=['replica', 'replica2'])
+    def test_round_robin_skips_failing_replicas(self):
+        with mock.patch.object(routers, 'connections', self.get_connections()):
+            chosen = set(routers.choose_replica() for index in range(4))
+        self.assertEqual(chosen, set(['replica', 'replica2']))
+        connections = self.get_connections(failing=['replica2'])
+        with mock.patch.object(routers, 'connections', connections):
+            chosen = set(routers.choose_replica() for index in range(4))
+        self.assertEqual(chosen, set(['replica']))
+        self.assertIn('replica2', routers._unavailable)
+        connections = self.get_connections(failing=['replica'])
+        with mock.patch.object(routers, 'connections', connections):
+            self.assertIsNone(routers.choose_replica())
+
+    @override_settings(
+        READ_REPLICAS=['replica', 'replica2'],
+        READ_REPLICA_SELECTION='least-loaded'
+    )
+    def test_least_loaded_selection(self):
+        with mock.patch.object(routers, 'connections', self.get_connections()):
+            routers._in_flight.update({'replica': 3, 'replica2': 1})
+            self.assertEqual(routers.choose_replica(), 'replica2')
+            routers._in_flight.update({'replica': 0})
+            self.assertEqual(routers.choose_replica(), 'replica')
+
+    @override_settings(READ_REPLICAS=['replica'])
+    def test_router_keeps_cache_tags_on_the_primary(self):
+        router = routers.ReplicaRouter()
+        routers.use_replica('replica')
+        with mock.patch.object(routers, 'connections', self.get_connections()):
+            self.assertEqual(router.db_for_read(Game), 'replica')
+            self.assertEqual(router.db_for_read(CacheTag), 'default')
+            self.assertEqual(router.db_for_read(ReplicaPin), 'default')
+            self.assertEqual(router.db_for_write(Game), 'default')
+        # inside a transaction of the primary database
+        self.assertEqual(router.db_for_read(Game), 'default')
+        routers.release()
+        self.assertEqual(routers._in_flight, {'replica': 0})
+
+    @override_settings(READ_REPLICAS=['replica'])
+    def test_writes_keep_reads_on_the_primary(self):
+        url = reverse('gamecategory-list')
+        with mock.patch.object(routers, 'choose_replica') as choose:
+            choose.return_value = None
+            self.get_json(reverse('user-list'))
+            self.assertEqual(choose.call_count, 1)
+            response = self.send_json('post', url, {'name': 'Puzzle'})
+            self.assertEqual(response.status_code, 201)
+            self.run_commit_hooks()
+            # the client is pinned
+            self.get_json(reverse('user-list'), {'page': 2})
+            self.assertEqual(choose.call_count, 1)
+            ReplicaPin.objects.all().delete()
+            # game categories were just written
+            self.get_json(url)
+            self.assertEqual(choose.call_count, 1)
+            self.get_json(reverse('user-list'), {'page': 3})
+            self.assertEqual(choose.call_count, 2)
+
+
+class ConnectionPoolTests(TestCase):
+
+    def get_pool(self, **options):
+        def connect():
+            connection = mock.Mock()
+            connections.append(connection)
+            return connection
+        connections = []
+        return pool.ConnectionPool(connect, **options), connections
+
+    def test_released_connections_are_reused(self):
+        connection_pool, connections = self.get_pool(max_size=2)
+        first = connection_pool.acquire()
+        second = connection_pool.acquire()
+        connection_pool.release(first)
+        connection_pool.release(second)
+        # the most recently released connection comes first
+        self.assertIs(connection_pool.acquire(), second)
+        self.assertEqual(len(connections), 2)
+        first.rollback.assert_called_once_with()
+        stats = connection_pool.get_stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['in_use'], 1)
+        self.assertEqual(stats['idle'], 1)
+        self.assertEqual(stats['checkouts'], 3)
+        self.assertEqual(stats['opened'], 2)
+
+    def test_full_pool_waits_for_a_release(self):
+        connection_pool, connections = self.get_pool(max_size=1, timeout=0)
+        connection = connection_pool.acquire()
+        with self.assertRaises(pool.PoolTimeout):
+            connection_pool.acquire()
+        self.assertEqual(connection_pool.get_stats()['timeouts'], 1)
+        connection_pool.timeout = 5
+        timer = threading.Timer(0.05, connection_pool.release, [connection])
+        timer.start()
+        self.addCleanup(timer.join)
+        self.assertIs(connection_pool.acquire(), connection)
+        stats = connection_pool.get_stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreater(stats['max_wait_time'], 0)
+
+    def test_broken_and_expired_connections_are_replaced(self):
+        connection_pool, connections = self.get_pool(check_after=0)
+        connection = connection_pool.acquire()
+        connection_pool.release(connection)
+        connection.cursor.side_effect = Exception
+        replacement = connection_pool.acquire()
+        self.assertIsNot(replacement, connection)
+        connection.close.assert_called_once_with()
+        connection_pool.release(replacement, reuse=False)
+        replacement.close.assert_called_once_with()
+        connection_pool.max_lifetime = 0
+        connection_pool.release(connection_pool.acquire())
+        stats = connection_pool.get_stats()
+        self.assertEqual(stats['failed_checks'], 1)
+        self.assertEqual(stats['opened'], 3)
+        self.assertEqual(stats['closed'], 3)
+        self.assertEqual(stats['size'], 0)
+
+
+class InstrumentationTests(APITestCase):
+    labels = (('view', 'player-list'), ('method', 'GET'))
+
+    def get_count(self, histogram):
+        counts, total = histogram.values.get(self.labels, ([], 0))
+        return sum(counts), total
+
+    @override_settings(INSTRUMENTATION_ENABLED=True)
+    def test_requests_are_timed(self):
+        requests, queries = self.get_count(instrumentation.DB_QUERIES)
+        response = self.get_json(reverse('player-list'))
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        for phase in ('db', 'serialize', 'render', 'total'):
+            self.assertIn('{};dur='.format(phase), timing)
+        count = int(re.search(r'"(\d+) queries"', timing).group(1))
+        self.assertGreater(count, 0)
+        self.assertEqual(
+            self.get_count(instrumentation.DB_QUERIES),
+            (requests + 1, queries + count)
+        )
+
+    def test_disabled_by_default(self):
+        response = self.get_json(reverse('player-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(
+        INSTRUMENTATION_ENABLED=True,
+        INSTRUMENTATION_N_PLUS_ONE_THRESHOLD=0
+    )
+    def test_repeated_queries_are_logged(self):
+        before = instrumentation.REPEATED_QUERIES.values[self.labels]
+        with self.assertLogs('games.instrumentation', 'WARNING') as logs:
+            self.get_json(reverse('player-list'))
+        self.assertIn('Possible N+1 queries: GET /players/', logs.output[0])
+        self.assertEqual(
+            instrumentation.REPEATED_QUERIES.values[self.labels],
+            before + 1
+        )
+
+    @override_settings(INSTRUMENTATION_ENABLED=True)
+    def test_metrics_are_exposed_to_staff(self):
+        self.get_json(reverse('player-list'))
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode('utf-8')
+        self.assertIn(
+            '# TYPE games_request_duration_seconds histogram', content
+        )
+        self.assertIn(
+            'games_request_duration_seconds_count'
+            '{view="player-list",method="GET"} ',
+            content
+        )
+
+
+class BenchmarkCommandTests(TestCase):
+
+    def test_benchmark_api(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'baseline.json')
+        options = {'repeat': 1, 'warmup': 0, 'stdout': StringIO()}
+        call_command(
+            'benchmark_api', seed=True, categories=1, games=2, players=3,
+            scores=20, save=path, **options
+        )
+        with open(path) as f:
+            scenarios = json.load(f)['scenarios']
+        for name in ('change-list since', 'playerscore-pending', 'metrics',
+                     'database-metrics', 'playerscore-list bulk create'):
+            self.assertIn(name, scenarios)
+        options['stdout'] = StringIO()
+        call_command(
+            'benchmark_api', compare=path, only='^player-detail$',
+            tolerance=1e9, **options
+        )
+        self.assertIn('player-detail', options['stdout'].getvalue())
+
+
+class NameSearchTests(APITestCase):
+    players_count = 0
+
+    def setUp(self):
+        super(NameSearchTests, self).setUp()
+        for name in ('Alice', 'alicia', 'Al Pacino', 'Bob', 'Xal', 'Zo\xeb'):
+            Player.objects.create(name=name)
+
+    def search(self, term, **data):
+        data['search'] = term
+        body, queries = self.get_uncached(reverse('player-list'), data)
+        return [player['name'] for player in body['results']], queries
+
+    def test_prefix(self):
+        names, queries = self.search('al')
+        self.assertEqual(sorted(names), ['Al Pacino', 'Alice', 'alicia'])
+        if connection.vendor == 'sqlite':
+            # a range on the indexed expression instead of LIKE
+            self.assertTrue(any('UPPER' in query for query in queries))
+            self.assertFalse(any('LIKE' in query for query in queries))
+        # the whole value is one prefix
+        self.assertEqual(self.search('AL P')[0], ['Al Pacino'])
+        self.assertEqual(self.search('zo\xeb')[0], ['Zo\xeb'])
+        body = self.get_uncached(reverse('player-list'), {'search': ' '})[0]
+        self.assertEqual(body['count'], 6)
+
+    def test_fuzzy(self):
+        names = self.search('al', search_mode='fuzzy')[0]
+        if connection.vendor == 'postgresql':
+            self.assertIn('Al Pacino', names)
+            return
+        # exact, prefix and substring matches
+        self.assertEqual(sorted(names[:3]), ['Al Pacino', 'Alice', 'alicia'])
+        self.assertEqual(names[3:], ['Xal'])
+        self.assertEqual(
+            self.search('al', search_mode='fuzzy', ordering='name')[0],
+            ['Al Pacino', 'Alice', 'Xal', 'alicia']
+        )
+        self.assertEqual(
+            self.search('bob', search_mode='fuzzy')[0], ['Bob']
+        )
+
+
+class ScoreBufferTests(APITestCase):
+
+    def setUp(self):
+        super(ScoreBufferTests, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(
+            SCORE_BUFFER_ENABLED=True,
+            SCORE_BUFFER_DIR=self.directory,
+            SCORE_BUFFER_FLUSH_INTERVAL=3600
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def post_score(self, player, score):
+        return self.send_json('post', reverse('playerscore-list'), {
+            'player': player.name,
+            'game': self.games[0].name,
+            'score': score,
+            'score_date': self.now.isoformat(),
+        })
+
+    def get_status(self, url):
+        return self.read(self.get_json(url))['status']
+
+    def test_accepted_scores_are_stored_on_flush(self):
+        response = self.post_score(self.players[0], 10)
+        self.assertEqual(response.status_code, 202)
+        url = self.read(response)['url']
+        self.assertEqual(self.get_status(url), 'pending')
+        self.assertFalse(PlayerScore.objects.exists())
+        self.post_score(self.players[1], 20)
+        self.players[1].delete()
+        ingestion.get_buffer().flush(force=True)
+        self.assertEqual(self.get_status(url), 'stored')
+        self.assertEqual(
+            list(PlayerScore.objects.values_list('score', flat=True)), [10]
+        )
+        self.assertEqual(
+            LeaderboardEntry.objects.get(player=self.players[0]).score, 10
+        )
+        segment = ScoreBufferSegment.objects.get()
+        self.assertEqual((segment.scores, segment.dropped), (1, 1))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_segments_left_by_a_crash_are_recovered(self):
+        score = {
+            'player': self.players[0].pk,
+            'game': self.games[0].pk,
+            'score': 10,
+            'score_date': self.now.isoformat(),
+        }
+        with mock.patch.object(ingestion.ScoreBuffer, 'start'):
+            buffer = ingestion.ScoreBuffer(self.directory, flush_size=2)
+            ids = buffer.append([score, score]) + buffer.append([score])
+        # segments are locked while their process runs
+        self.assertEqual(ingestion.recover(self.directory), 0)
+        for segment in buffer._closed + [buffer._active]:
+            # a write torn by the crash
+            segment.file.write(b'{"player": ')
+            segment.file.close()
+        self.assertEqual(ingestion.recover(self.directory), 2)
+        self.assertEqual(PlayerScore.objects.count(), 3)
+        self.assertEqual(os.listdir(self.directory), [])
+        for tracking_id in ids:
+            self.assertEqual(ingestion.get_status(tracking_id), 'stored')
+        # a segment is stored once
+        name = ingestion.parse_tracking_id(ids[0])[0]
+        self.assertIsNone(ingestion.store_segment(name, [score]))
+
+
+class ASGIHandlerTests(TestCase):
+
+    def setUp(self):
+        self.environs = []
+        self.handler = ASGIHandler(self.application, threads=2)
+        self.addCleanup(self.handler.executor.shutdown)
+
+    def application(self, environ, start_response):
+        environ['body'] = environ['wsgi.input'].read()
+        self.environs.append(environ)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'first', b'', b'second']
+
+    def call(self, scope, messages):
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        loop.run_until_complete(self.handler(scope, receive, send))
+        return sent
+
+    def test_request(self):
+        sent = self.call({
+            'type': 'http',
+            'method': 'POST',
+            'path': '/players/',
+            'query_string': b'search=al',
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'accept', b'text/html'),
+                (b'accept', b'application/json'),
+            ],
+        }, [
+            {'type': 'http.request', 'body': b'{"name": ', 'more_body': True},
+            {'type': 'http.request', 'body': b'"Al"}'},
+        ])
+        environ = self.environs[0]
+        self.assertEqual(environ['PATH_INFO'], '/players/')
+        self.assertEqual(environ['QUERY_STRING'], 'search=al')
+        self.assertEqual(environ['CONTENT_TYPE'], 'application/json')
+        self.assertEqual(environ['CONTENT_LENGTH'], '14')
+        self.assertEqual(
+            environ['HTTP_ACCEPT'], 'text/html,application/json'
+        )
+        self.assertEqual(environ['body'], b'{"name": "Al"}')
+        self.assertEqual(sent[0], {
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/plain')],
+        })
+        # chunks are streamed, the last one ends the body
+        self.assertEqual(
+            [(message['body'], message['more_body']) for message in sent[1:]],
+            [(b'first', True), (b'second', False)]
+        )
+
+    def test_disconnect_and_lifespan(self):
+        sent = self.call(
+            {'type': 'http', 'method': 'POST', 'path': '/players/'},
+            [{'type': 'http.disconnect'}]
+        )
+        self.assertEqual((sent, self.environs), ([], []))
+        sent = self.call({'type': 'lifespan'}, [
+            {'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}
+        ])
+        self.assertEqual(
+            [message['type'] for message in sent],
+            ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+        )
+
+
+class ChangeFeedTests(APITestCase):
+
+    def setUp(self):
+        super(ChangeFeedTests, self).setUp()
+        self.url = reverse('change-list')
+        self.head = self.read(self.get_json(self.url))['last_seq']
+
+    def get_changes(self, **data):
+        data.setdefault('since', self.head)
+        return self.read(self.get_json(self.url, data))
+
+    def test_changes_in_order(self):
+        player = Player.objects.create(name='Player 3')
+        score = self.create_score(player, self.games[0], 10)
+        score_pk = score.pk
+        score.score = 20
+        score.save()
+        score.delete()
+        self.run_commit_hooks()
+        data = self.get_changes()
+        recorded = data['changes']
+        self.assertEqual(
+            [(change['model'], change['id'], change['action'])
+             for change in recorded],
+            [
+                ('player', player.pk, Change.CREATE),
+                ('playerscore', score_pk, Change.CREATE),
+                ('playerscore', score_pk, Change.UPDATE),
+                ('playerscore', score_pk, Change.DELETE),
+            ]
+        )
+        seqs = [change['seq'] for change in recorded]
+        self.assertEqual(seqs, list(range(self.head + 1, self.head + 5)))
+        self.assertEqual(data['last_seq'], seqs[-1])
+        self.assertEqual(recorded[0]['data']['name'], 'Player 3')
+        self.assertIsNone(recorded[-1]['data'])
+
+        page = self.get_changes(limit=3)
+        self.assertTrue(page['more'])
+        rest = self.read(self.get_json(page['next']))
+        self.assertEqual(page['changes'] + rest['changes'], recorded)
+
+        data = self.get_changes(models='player')
+        self.assertEqual(
+            [change['id'] for change in data['changes']], [player.pk]
+        )
+
+    def test_changes_are_numbered_once_per_transaction(self):
+        Player.objects.create(name='Player 3')
+        Player.objects.create(name='Player 4')
+        self.assertEqual(Change.objects.filter(seq=None).count(), 2)
+        self.assertEqual(len([
+            func for sids, func in connection.run_on_commit
+            if func is changes.sequence
+        ]), 1)
+        self.run_commit_hooks()
+        self.assertFalse(Change.objects.filter(seq=None).exists())
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.get_changes()['changes']), 2)
+        self.assertFalse(any(
+            query['sql'].startswith('UPDATE') for query in queries
+        ))
+        # changes a crashed process didn't number are numbered when read
+        Player.objects.create(name='Player 5')
+        self.assertEqual(len(self.get_changes()['changes']), 3)
+
+    def test_wait_polls_for_changes(self):
+        def sleep(seconds):
+            Player.objects.create(name='Player 3')
+            self.run_commit_hooks()
+
+        with mock.patch('games.views.time.sleep', side_effect=sleep) as slept:
+            data = self.get_changes(wait=600)
+        slept.assert_called_once_with(1.0)
+        self.assertEqual(len(data['changes']), 1)
+        with override_settings(CHANGE_FEED_MAX_WAIT=0):
+            with mock.patch('games.views.time.sleep') as slept:
+                data = self.get_changes(since=data['last_seq'], wait=600)
+        self.assertEqual(data['changes'], [])
+        self.assertFalse(slept.called)
+
+    def test_prune(self):
+        for index in range(3, 6):
+            Player.objects.create(name='Player {}'.format(index))
+        self.run_commit_hooks()
+        head = self.head + 3
+        Change.objects.update(created=self.now - timedelta(days=31))
+        out = StringIO()
+        call_command('prune_changes', stdout=out)
+        self.assertEqual(out.getvalue(), 'Deleted {} changes\n'.format(
+            head - 1
+        ))
+        self.assertEqual(
+            list(Change.objects.values_list('seq', flat=True)), [head]
+        )
+        response = self.get_json(self.url, {'since': self.head})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_changes(since=head)['changes'], [])
+        Player.objects.create(name='Player 6')
+        self.run_commit_hooks()
+        self.assertEqual(
+            [change['seq'] for change in self.get_changes(since=head - 1)[
+                'changes']],
+            [head, head + 1]
+        )
+
+    def test_unknown_models(self):
+        response = self.get_json(
+            self.url, {'since': self.head, 'models': 'game,nothing'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchiveTests(APITestCase):
+
+    def test_archive_month(self):
+        old = self.create_score(self.players[0], self.games[0], 50, 800)
+        self.create_score(self.players[0], self.games[0], 30, 800)
+        self.create_score(self.players[1], self.games[1], 10)
+        self.run_commit_hooks()
+        head = changes.get_head()
+        url = reverse('playerscore-list')
+        self.assertEqual(len(self.read(self.get_json(url))['results']), 3)
+        summary = PlayerSummary.objects.values().get(player=self.players[0])
+        tags = [
+            'playerscore',
+            'player:{}'.format(self.players[0].pk),
+            'game:{}'.format(self.games[0].pk),
+            'leaderboard:{}'.format(self.games[0].pk),
+            'player:{}'.format(self.players[1].pk),
+        ]
+        versions = cache.get_tag_versions(tags)
+        month = partitions.month_start(old.score_date)
+        self.assertEqual(partitions.archive_month(month), 2)
+        self.run_commit_hooks()
+        archive = ScoreArchive.objects.get()
+        self.assertEqual(
+            (archive.score_count, archive.score_total, archive.best_score),
+            (2, 80, 50)
+        )
+        self.assertEqual(
+            PlayerSummary.objects.values().get(player=self.players[0]),
+            summary
+        )
+        # responses of the players and games of the month are invalidated
+        bumped = [
+            before != after for before, after in
+            zip(versions, cache.get_tag_versions(tags))
+        ]
+        self.assertEqual(bumped, [True, True, True, True, False])
+        self.assertEqual(len(self.read(self.get_json(url))['results']), 1)
+        feed = changes.get_changes(head, 10)
+        self.assertEqual(
+            [(change.model, change.action) for change in feed],
+            [('playerscore', Change.DELETE)] * 2
+        )
+        self.assertIn(old.pk, [change.object_id for change in feed])
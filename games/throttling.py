@@ -0,0 +1,195 @@
+# python imports
+import hashlib
+# django imports
+from django.core.cache import caches
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+# rest_framework import
+from rest_framework import throttling
+# local imports
+from .models import ThrottleCounter
+
+
+class DatabaseThrottleStore(object):
+    '''
+    Keeps throttle counters in the ThrottleCounter table of a database, so
+        every worker process sees the same counts without any service
+        besides the database itself.
+
+    Each key holds at most two rows (the current and the previous window),
+        older windows are deleted when a new window starts.
+    '''
+    def __init__(self, using='default'):
+        self.using = using
+
+    def incr(self, key, window, delta=1):
+        '''
+        Atomically adds delta to the counter of a window and returns the
+            new value.
+        '''
+        connection = connections[self.using]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'INSERT INTO {table} (key, "window", count) '
+                    'VALUES (%s, %s, %s) '
+                    'ON CONFLICT (key, "window") DO UPDATE '
+                    'SET count = {table}.count + %s '
+                    'RETURNING count, xmax = 0'.format(
+                        table=ThrottleCounter._meta.db_table
+                    ),
+                    [key, window, max(delta, 0), delta]
+                )
+                count, inserted = cursor.fetchone()
+        else:
+            count, inserted = self._incr_orm(key, window, delta)
+        if inserted:
+            self.objects.filter(key=key, window__lt=window - 1).delete()
+        return count
+
+    @property
+    def objects(self):
+        return ThrottleCounter.objects.using(self.using)
+
+    def _incr_orm(self, key, window, delta):
+        counters = self.objects.filter(key=key, window=window)
+        with transaction.atomic(using=self.using):
+            inserted = False
+            if not counters.update(count=F('count') + delta):
+                try:
+                    with transaction.atomic(using=self.using):
+                        self.objects.create(
+                            key=key,
+                            window=window,
+                            count=max(delta, 0)
+                        )
+                    inserted = True
+                except IntegrityError:
+                    counters.update(count=F('count') + delta)
+            count = counters.values_list('count', flat=True).first()
+        return count, inserted
+
+    def get(self, key, window):
+        count = self.objects.filter(
+            key=key,
+            window=window
+        ).values_list('count', flat=True).first()
+        return count or 0
+
+
+class CacheThrottleStore(object):
+    '''
+    Keeps throttle counters in a cache. Only correct across processes with
+        a shared cache that increments atomically (memcached, redis).
+    '''
+    def __init__(self, alias='default', timeout=None):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def _key(self, key, window):
+        return '{}:{}'.format(key, window)
+
+    def incr(self, key, window, delta=1):
+        cache_key = self._key(key, window)
+        if delta > 0 and self.cache.add(cache_key, delta, self.timeout):
+            return delta
+        try:
+            return self.cache.incr(cache_key, delta)
+        except ValueError:
+            self.cache.set(cache_key, max(delta, 0), self.timeout)
+            return max(delta, 0)
+
+    def get(self, key, window):
+        return self.cache.get(self._key(key, window), 0)
+
+
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    '''
+    Throttles with a sliding window counter instead of a list of request
+        timestamps.
+
+    Requests are counted in fixed windows of the throttle duration. The
+        rate of the sliding window is estimated as the count of the
+        current window plus the count of the previous window weighted by
+        the part of it that still overlaps the sliding window. That takes
+        one atomic increment and one read per request and two counters per
+        key whatever the rate is.
+    '''
+    store_class = DatabaseThrottleStore
+    max_key_length = 255
+
+    def __init__(self):
+        super(SlidingWindowRateThrottle, self).__init__()
+        self.store = self.store_class()
+
+    def get_store_key(self):
+        if len(self.key) <= self.max_key_length:
+            return self.key
+        return hashlib.sha256(self.key.encode('utf-8')).hexdigest()
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        store_key = self.get_store_key()
+        self.now = self.timer()
+        window, elapsed = divmod(self.now, self.duration)
+        window = int(window)
+        self.elapsed = elapsed / float(self.duration)
+        self.current = self.store.incr(store_key, window)
+        self.previous = self.store.get(store_key, window - 1)
+        if self.get_rate_estimate() > self.num_requests:
+            # rejected requests don't count against the limit
+            self.store.incr(store_key, window, -1)
+            self.current -= 1
+            return self.throttle_failure()
+        return True
+
+    def get_rate_estimate(self):
+        return self.previous * (1 - self.elapsed) + self.current
+
+    def wait(self):
+        '''
+        Returns seconds until the estimated rate falls below the limit.
+        '''
+        available = self.num_requests - self.current - 1
+        if available < 0:
+            # the current window alone is over the limit
+            return (1 - self.elapsed) * self.duration
+        if not self.previous:
+            return 0
+        # previous * (1 - elapsed) has to drop to the available requests
+        return max(
+            0,
+            (1 - available / float(self.previous) - self.elapsed) *
+            self.duration
+        )
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle,
+                       SlidingWindowRateThrottle):
+    '''
+    Limits the rate of API calls that may be made by anonymous users.
+    '''
+
+
+class UserRateThrottle(throttling.UserRateThrottle,
+                       SlidingWindowRateThrottle):
+    '''
+    Limits the rate of API calls that may be made by a given user.
+    '''
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle,
+                         SlidingWindowRateThrottle):
+    '''
+    Limits the rate of API calls by different amounts for various parts of
+        the API (see throttle_scope of the views).
+    '''
+    def __init__(self):
+        # The rate is determined by the view, see ScopedRateThrottle.
+        self.store = self.store_class()
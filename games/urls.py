@@ -15,6 +15,11 @@ urlpatterns = [
         views.GameCategoryDetail.as_view(),
         name=views.GameCategoryDetail.name
     ),
+    url(
+        r'^game-categories/(?P<pk>[0-9]+)/games/$',
+        views.GameCategoryGameList.as_view(),
+        name=views.GameCategoryGameList.name
+    ),
     url(
         r'^games/$',
         views.GameList.as_view(),
@@ -25,6 +30,22 @@ urlpatterns = [
         views.GameDetail.as_view(),
         name=views.GameDetail.name
     ),
+    url(
+        r'^games/(?P<pk>[0-9]+)/stats/$',
+        views.GameStats.as_view(),
+        name=views.GameStats.name
+    ),
+    url(
+        r'^games/(?P<pk>[0-9]+)/leaderboard/$',
+        views.GameLeaderboard.as_view(),
+        name=views.GameLeaderboard.name
+    ),
+    url(
+        r'^games/(?P<pk>[0-9]+)/leaderboard/players/(?P<player_pk>[0-9]+)/'
+        r'rank/$',
+        views.GameLeaderboardPlayerRank.as_view(),
+        name=views.GameLeaderboardPlayerRank.name
+    ),
     url(
         r'^players/$',
         views.PlayerList.as_view(),
@@ -35,11 +56,31 @@ urlpatterns = [
         views.PlayerDetail.as_view(),
         name=views.PlayerDetail.name
     ),
+    url(
+        r'^players/(?P<pk>[0-9]+)/scores/$',
+        views.PlayerScoreSubList.as_view(),
+        name=views.PlayerScoreSubList.name
+    ),
+    url(
+        r'^players/(?P<pk>[0-9]+)/stats/$',
+        views.PlayerStats.as_view(),
+        name=views.PlayerStats.name
+    ),
     url(
         r'^player-scores/$',
         views.PlayerScoreList.as_view(),
         name=views.PlayerScoreList.name
     ),
+    url(
+        r'^player-scores/export/$',
+        views.PlayerScoreExport.as_view(),
+        name=views.PlayerScoreExport.name
+    ),
+    url(
+        r'^player-scores/pending/(?P<tracking_id>[0-9a-f:-]+)/$',
+        views.PlayerScorePending.as_view(),
+        name=views.PlayerScorePending.name
+    ),
     url(
         r'^player-scores/(?P<pk>[0-9]+)/$',
         views.PlayerScoreDetail.as_view(),
@@ -55,5 +96,25 @@ urlpatterns = [
         views.UserDetail.as_view(),
         name=views.UserDetail.name
     ),
+    url(
+        r'^users/(?P<pk>[0-9]+)/games/$',
+        views.UserGameList.as_view(),
+        name=views.UserGameList.name
+    ),
+    url(
+        r'^changes/$',
+        views.ChangeList.as_view(),
+        name=views.ChangeList.name
+    ),
+    url(
+        r'^metrics/$',
+        views.PrometheusMetrics.as_view(),
+        name=views.PrometheusMetrics.name
+    ),
+    url(
+        r'^metrics/database/$',
+        views.DatabaseMetrics.as_view(),
+        name=views.DatabaseMetrics.name
+    ),
     url(r'^$', views.ApiRoot.as_view(), name=views.ApiRoot.name),
 ]
@@ -1,19 +1,39 @@
+# python imports
+import time
 # django imports
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.http import HttpResponse
+from django.db import connections
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 # django_filter imports
-from django_filters import NumberFilter, DateTimeFilter, AllValuesFilter
+from django_filters import CharFilter, NumberFilter, DateTimeFilter
 # rest_framework import
-from rest_framework import filters, generics, permissions
+from rest_framework import filters, generics, permissions, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
-from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 # local imports
-from .models import Game, GameCategory, Player, PlayerScore
+from . import changes, ingestion, instrumentation, leaderboard, pool
+from .filters import NameFilter
+from .models import Game, GameCategory, GameSummary, LeaderboardEntry,\
+                    Player, PlayerScore, PlayerSummary
+from .pagination import KeysetPagination
+from .parsers import NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer
 from .serializers import GameSerializer, GameCategorySerializer,\
-                    PlayerSerializer, PlayerScoreSerializer, UserSerializer
-from .permissions import IsOwnerOrReadOnly
+                    GameSummarySerializer, LeaderboardEntrySerializer,\
+                    PlayerSerializer, PlayerScoreSerializer,\
+                    PlayerSummarySerializer, ScoreSerializer,\
+                    UserGameSerializer, UserSerializer
+from .permissions import IsAuthenticatedForBulkChanges, IsOwnerOrReadOnly
+from .cache import CachedResponseMixin
+from .querysets import EagerLoadingMixin
+from .routers import ReplicaRoutingMixin
+from .throttling import ScopedRateThrottle
 
 
 class PlayerScoreFilter(filters.FilterSet):
@@ -24,8 +44,13 @@ class PlayerScoreFilter(filters.FilterSet):
     max_score = NumberFilter(name='score', lookup_expr='lte')
     from_score_date = DateTimeFilter(name='score_date', lookup_expr='gte')
     to_score_date = DateTimeFilter(name='score_date', lookup_expr='lte')
-    player_name = AllValuesFilter(name='player__name')
-    game_name = AllValuesFilter(name='game__name')
+    player_name = NameFilter(name='player__name', choices_model=Player)
+    game_name = NameFilter(name='game__name', choices_model=Game)
+    player_name_prefix = CharFilter(
+        name='player__name',
+        lookup_expr='startswith'
+    )
+    game_name_prefix = CharFilter(name='game__name', lookup_expr='startswith')
 
     class Meta:
         model = PlayerScore
@@ -36,12 +61,51 @@ class PlayerScoreFilter(filters.FilterSet):
             # player__name will be accessed as player_name
             'player_name',
             # game__name will be accessed as game_name
-            'game_name'
+            'game_name',
+            'player_name_prefix',
+            'game_name_prefix'
         )
 
 
+class SummaryMixin(object):
+    '''
+    Retrieves the precomputed summary of the object named by the pk URL
+        keyword argument. Objects without scores have no summary row yet
+        and get an unsaved summary with empty aggregates.
+    '''
+    summary_of = None
+    lookup_url_kwarg = 'pk'
+
+    def get_object(self):
+        try:
+            return super(SummaryMixin, self).get_object()
+        except Http404:
+            instance = get_object_or_404(self.summary_of, pk=self.kwargs['pk'])
+            return self.get_queryset().model(**{self.lookup_field: instance})
+
+
+class SubCollectionMixin(object):
+    '''
+    Lists the related objects of the object named by the pk URL keyword
+        argument with keyset pagination. Serves the sub-collections linked
+        next to capped nested relations (see relations.py).
+    '''
+    parent_model = None
+    parent_lookup = None
+    pagination_class = KeysetPagination
+    filter_backends = ()
+
+    def get_queryset(self):
+        parent_pk = self.kwargs['pk']
+        if not self.parent_model.objects.filter(pk=parent_pk).exists():
+            raise Http404
+        queryset = super(SubCollectionMixin, self).get_queryset()
+        return queryset.filter(**{self.parent_lookup: parent_pk})
+
+
 # http://localhost:8000/game-categories/
-class GameCategoryList(generics.ListCreateAPIView):
+class GameCategoryList(ReplicaRoutingMixin, CachedResponseMixin,
+                       EagerLoadingMixin, generics.ListCreateAPIView):
     '''
     View allows GET request retrieves a listing of GameCategory model objects
         and POST request creates an instance of GameCategory model.
@@ -51,6 +115,7 @@ class GameCategoryList(generics.ListCreateAPIView):
     queryset = GameCategory.objects.all()
     serializer_class = GameCategorySerializer
     name = 'gamecategory-list'
+    cache_tags = ('gamecategory', 'game')
     throttle_scope = 'game-categories'
     throttle_classes = (ScopedRateThrottle,)
     filter_fields = ('name',)
@@ -59,7 +124,9 @@ class GameCategoryList(generics.ListCreateAPIView):
 
 
 # http://localhost:8000/game-categories/<pk>/
-class GameCategoryDetail(generics.RetrieveUpdateDestroyAPIView):
+class GameCategoryDetail(ReplicaRoutingMixin, CachedResponseMixin,
+                         EagerLoadingMixin,
+                         generics.RetrieveUpdateDestroyAPIView):
     '''
     View allows GET, PUT, PATCH and DELETE requests to retrieve, update and
         delete a specific instance of GameCategory model.
@@ -69,12 +136,34 @@ class GameCategoryDetail(generics.RetrieveUpdateDestroyAPIView):
     queryset = GameCategory.objects.all()
     serializer_class = GameCategorySerializer
     name = 'gamecategory-detail'
+    cache_tags = ('game',)
+    cache_object_tag = 'gamecategory'
     throttle_scope = 'game-categories'
     throttle_classes = (ScopedRateThrottle,)
 
 
+# http://localhost:8000/game-categories/<pk>/games/
+class GameCategoryGameList(ReplicaRoutingMixin, SubCollectionMixin,
+                           CachedResponseMixin, EagerLoadingMixin,
+                           generics.ListAPIView):
+    '''
+    View retrieves all games of a specific GameCategory model object.
+    '''
+    queryset = Game.objects.all()
+    serializer_class = GameSerializer
+    name = 'gamecategory-game-list'
+    cache_tags = ('game', 'user')
+    cache_object_tag = 'gamecategory'
+    # stats of the games aren't tagged, score writes would evict every
+    # game listing otherwise
+    cache_timeout = 60
+    parent_model = GameCategory
+    parent_lookup = 'game_category_id'
+
+
 # http://localhost:8000/games/
-class GameList(generics.ListCreateAPIView):
+class GameList(ReplicaRoutingMixin, CachedResponseMixin, EagerLoadingMixin,
+               generics.ListCreateAPIView):
     '''
     View allows GET request retrieves a listing of Game model objects and
         POST request creates an instance of Game model.
@@ -84,6 +173,10 @@ class GameList(generics.ListCreateAPIView):
     queryset = Game.objects.all()
     serializer_class = GameSerializer
     name = 'game-list'
+    cache_tags = ('game', 'gamecategory', 'user')
+    # stats of the games aren't tagged, score writes would evict every
+    # game listing otherwise
+    cache_timeout = 60
     permission_classes = (
         permissions.IsAuthenticatedOrReadOnly,
         IsOwnerOrReadOnly,
@@ -103,7 +196,8 @@ class GameList(generics.ListCreateAPIView):
 
 
 # http://localhost:8000/games/<pk>/
-class GameDetail(generics.RetrieveUpdateDestroyAPIView):
+class GameDetail(ReplicaRoutingMixin, CachedResponseMixin, EagerLoadingMixin,
+                 generics.RetrieveUpdateDestroyAPIView):
     '''
     View allows GET, PUT, PATCH and DELETE requests to retrieve, update and
         delete a specific instance of Game model.
@@ -111,14 +205,86 @@ class GameDetail(generics.RetrieveUpdateDestroyAPIView):
     queryset = Game.objects.all()
     serializer_class = GameSerializer
     name = 'game-detail'
+    cache_tags = ('gamecategory', 'user')
+    cache_object_tag = 'game'
     permission_classes = (
         permissions.IsAuthenticatedOrReadOnly,
         IsOwnerOrReadOnly,
     )
 
 
+# http://localhost:8000/games/<pk>/stats/
+class GameStats(ReplicaRoutingMixin, SummaryMixin, CachedResponseMixin,
+                EagerLoadingMixin, generics.RetrieveAPIView):
+    '''
+    View retrieves precomputed score aggregates of a specific game.
+    '''
+    queryset = GameSummary.objects.all()
+    serializer_class = GameSummarySerializer
+    name = 'game-stats'
+    cache_object_tag = 'game'
+    summary_of = Game
+    lookup_field = 'game'
+
+
+# http://localhost:8000/games/<pk>/leaderboard/
+class GameLeaderboard(ReplicaRoutingMixin, CachedResponseMixin,
+                      EagerLoadingMixin, generics.ListAPIView):
+    '''
+    View retrieves the top players of a game from the precomputed
+        leaderboard. Top query parameter sets a number of returned entries.
+    '''
+    queryset = LeaderboardEntry.objects.all()
+    serializer_class = LeaderboardEntrySerializer
+    name = 'game-leaderboard'
+    cache_tags = ('player', 'game')
+    cache_object_tag = 'leaderboard'
+    pagination_class = None
+    filter_backends = ()
+    default_top = 10
+    max_top = 100
+
+    def get_top(self):
+        try:
+            top = int(self.request.query_params.get('top', self.default_top))
+        except ValueError:
+            return self.default_top
+        return max(1, min(top, self.max_top))
+
+    def get_queryset(self):
+        game_pk = self.kwargs['pk']
+        if not Game.objects.filter(pk=game_pk).exists():
+            raise Http404
+        queryset = super(GameLeaderboard, self).get_queryset()
+        return leaderboard.with_ranks(
+            queryset.filter(game_id=game_pk)
+        )[:self.get_top()]
+
+
+# http://localhost:8000/games/<pk>/leaderboard/players/<player_pk>/rank/
+class GameLeaderboardPlayerRank(ReplicaRoutingMixin, CachedResponseMixin,
+                                EagerLoadingMixin, generics.RetrieveAPIView):
+    '''
+    View retrieves the rank of a specific player in a game leaderboard.
+    '''
+    queryset = LeaderboardEntry.objects.all()
+    serializer_class = LeaderboardEntrySerializer
+    name = 'game-leaderboard-player-rank'
+    cache_tags = ('player', 'game')
+    cache_object_tag = 'leaderboard'
+    lookup_field = 'game'
+    lookup_url_kwarg = 'pk'
+
+    def get_queryset(self):
+        queryset = super(GameLeaderboardPlayerRank, self).get_queryset()
+        return leaderboard.with_ranks(
+            queryset.filter(player_id=self.kwargs['player_pk'])
+        )
+
+
 # http://localhost:8000/players/
-class PlayerList(generics.ListCreateAPIView):
+class PlayerList(ReplicaRoutingMixin, CachedResponseMixin, EagerLoadingMixin,
+                 generics.ListCreateAPIView):
     '''
     View allows GET request retrieves a listing of Player model objects and
         POST request creates an instance of Player model.
@@ -126,13 +292,15 @@ class PlayerList(generics.ListCreateAPIView):
     queryset = Player.objects.all()
     serializer_class = PlayerSerializer
     name = 'player-list'
+    cache_tags = ('player', 'playerscore', 'game', 'gamecategory', 'user')
     filter_fields = ('name', 'gender')
     search_fields = ('^name',)
     ordering_fields = ('name',)
 
 
 # http://localhost:8000/players/<pk>/
-class PlayerDetail(generics.RetrieveUpdateDestroyAPIView):
+class PlayerDetail(ReplicaRoutingMixin, CachedResponseMixin, EagerLoadingMixin,
+                   generics.RetrieveUpdateDestroyAPIView):
     '''
     View allows GET, PUT, PATCH and DELETE requests to retrieve, update and
         delete a specific instance of Player model.
@@ -140,23 +308,239 @@ class PlayerDetail(generics.RetrieveUpdateDestroyAPIView):
     queryset = Player.objects.all()
     serializer_class = PlayerSerializer
     name = 'player-detail'
+    cache_tags = ('game', 'gamecategory', 'user')
+    cache_object_tag = 'player'
+
+
+# http://localhost:8000/players/<pk>/scores/
+class PlayerScoreSubList(ReplicaRoutingMixin, SubCollectionMixin,
+                         CachedResponseMixin, EagerLoadingMixin,
+                         generics.ListAPIView):
+    '''
+    View retrieves all scores of a specific Player model object, best
+        scores first.
+    '''
+    queryset = PlayerScore.objects.all()
+    serializer_class = ScoreSerializer
+    name = 'player-score-list'
+    cache_tags = ('game', 'gamecategory', 'user')
+    cache_object_tag = 'player'
+    parent_model = Player
+    parent_lookup = 'player_id'
+
+
+# http://localhost:8000/players/<pk>/stats/
+class PlayerStats(ReplicaRoutingMixin, SummaryMixin, CachedResponseMixin,
+                  EagerLoadingMixin, generics.RetrieveAPIView):
+    '''
+    View retrieves precomputed score aggregates of a specific player.
+    '''
+    queryset = PlayerSummary.objects.all()
+    serializer_class = PlayerSummarySerializer
+    name = 'player-stats'
+    cache_object_tag = 'player'
+    summary_of = Player
+    lookup_field = 'player'
 
 
 # http://localhost:8000/player-scores/
-class PlayerScoreList(generics.ListCreateAPIView):
+class PlayerScoreList(ReplicaRoutingMixin, CachedResponseMixin,
+                      EagerLoadingMixin, generics.ListCreateAPIView):
     '''
     View allows GET request retrieves a listing of PlayerScore model objects
         and POST request creates an instance of PlayerScore model.
+    Listing is paginated with keyset cursors because the table is too large
+        for offset pagination.
+
+    With SCORE_BUFFER_ENABLED setting, POST request of a single score is
+        answered with 202 and a tracking id once the score is buffered (see
+        ingestion.ScoreBuffer), it's stored with the next batch.
+    POST request with a JSON array or NDJSON body creates many scores at
+        once, PATCH request with an array of objects containing pk updates
+        many scores and DELETE request with an array of pks deletes them,
+        both only for authenticated users. Bulk requests take at most
+        max_bulk_size items and their responses report errors of invalid
+        items by their index.
     '''
     queryset = PlayerScore.objects.all()
     serializer_class = PlayerScoreSerializer
     name = 'playerscore-list'
+    cache_tags = ('playerscore', 'player', 'game')
+    pagination_class = KeysetPagination
+    parser_classes = tuple(api_settings.DEFAULT_PARSER_CLASSES) + (
+        NDJSONParser,
+    )
     filter_class = PlayerScoreFilter
     ordering_fields = ('score', 'score_date')
+    permission_classes = (IsAuthenticatedForBulkChanges,)
+    max_bulk_size = 1000
+
+    def get_bulk_data(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError('Expected a list of items.')
+        if len(request.data) > self.max_bulk_size:
+            raise ValidationError(
+                'Expected at most {} items.'.format(self.max_bulk_size)
+            )
+        return request.data
+
+    def create_buffered(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        tracking_id = ingestion.get_buffer().append([{
+            'player': data['player'].pk,
+            'game': data['game'].pk,
+            'score': data['score'],
+            'score_date': data['score_date'].isoformat(),
+        }])[0]
+        url = reverse(
+            PlayerScorePending.name,
+            kwargs={'tracking_id': tracking_id},
+            request=request
+        )
+        return Response(
+            {'id': tracking_id, 'status': 'pending', 'url': url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': url}
+        )
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            if ingestion.is_enabled():
+                return self.create_buffered(request)
+            return super(PlayerScoreList, self).create(
+                request, *args, **kwargs
+            )
+        serializer = self.get_serializer(
+            data=self.get_bulk_data(request),
+            many=True
+        )
+        valid, errors = serializer.validate_items()
+        if not valid:
+            return Response(
+                {'created': 0, 'errors': errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        instances = serializer.create([attrs for index, attrs in valid])
+        return Response(
+            {'created': len(instances), 'errors': errors},
+            status=status.HTTP_201_CREATED
+        )
+
+    def patch(self, request, *args, **kwargs):
+        data = self.get_bulk_data(request)
+        pks = [item.get('pk') for item in data if isinstance(item, dict)]
+        instances = PlayerScore.objects.in_bulk(
+            [pk for pk in pks if isinstance(pk, int)]
+        )
+        serializer = self.get_serializer(data=data, many=True, partial=True)
+        valid, errors = serializer.validate_items()
+        updates = []
+        for index, attrs in valid:
+            instance = instances.get(data[index].get('pk'))
+            if instance is None:
+                errors.append({
+                    'index': index,
+                    'errors': {'pk': ['Not found.']}
+                })
+                continue
+            updates.append((instance, attrs))
+        serializer.update(
+            [instance for instance, attrs in updates],
+            [attrs for instance, attrs in updates]
+        )
+        errors.sort(key=lambda error: error['index'])
+        return Response(
+            {'updated': len(updates), 'errors': errors},
+            status=status.HTTP_200_OK if updates else
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    def delete(self, request, *args, **kwargs):
+        pks = self.get_bulk_data(request)
+        if not all(isinstance(pk, int) for pk in pks):
+            raise ValidationError('Expected a list of pks.')
+        deleted, counts = PlayerScore.objects.filter(pk__in=pks).delete()
+        return Response({
+            'deleted': counts.get(PlayerScore._meta.label, 0)
+        })
+
+
+# http://localhost:8000/player-scores/pending/<tracking id>/
+class PlayerScorePending(generics.GenericAPIView):
+    '''
+    View reports whether a score accepted by the write-behind buffer was
+        stored yet. Reads the primary database, a replica may not have the
+        segment record yet when the buffer file is already gone.
+    '''
+    name = 'playerscore-pending'
+
+    def get(self, request, tracking_id, *args, **kwargs):
+        state = ingestion.get_status(tracking_id)
+        if state is None:
+            raise Http404
+        return Response({'id': tracking_id, 'status': state})
+
+
+# http://localhost:8000/player-scores/export/
+class PlayerScoreExport(ReplicaRoutingMixin, generics.GenericAPIView):
+    '''
+    View streams all PlayerScore model objects matching PlayerScoreFilter
+        parameters as NDJSON or CSV (see format query parameter).
+    Rows are read in primary key ranges of chunk_size rows and written to
+        the response as they are read, so memory use doesn't depend on the
+        number of exported rows.
+    '''
+    queryset = PlayerScore.objects.all()
+    name = 'playerscore-export'
+    renderer_classes = (NDJSONRenderer, CSVRenderer)
+    filter_class = PlayerScoreFilter
+    export_fields = (
+        ('pk', 'pk'),
+        ('score', 'score'),
+        ('score_date', 'score_date'),
+        ('player', 'player__name'),
+        ('game', 'game__name'),
+    )
+    chunk_size = 2000
+
+    def iter_rows(self, queryset):
+        queryset = queryset.order_by('pk').values_list(
+            *[source for name, source in self.export_fields]
+        )
+        chunk = queryset
+        while True:
+            rows = list(chunk[:self.chunk_size])
+            if not rows:
+                return
+            for row in rows:
+                yield row
+            chunk = queryset.filter(pk__gt=rows[-1][0])
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # rows are read after dispatch returns, keep the replica chosen
+        # for the request
+        queryset = queryset.using(queryset.db)
+        renderer = request.accepted_renderer
+        rows = renderer.stream(
+            [name for name, source in self.export_fields],
+            self.iter_rows(queryset)
+        )
+        return StreamingHttpResponse(
+            rows,
+            content_type='{}; charset={}'.format(
+                renderer.media_type,
+                renderer.charset
+            )
+        )
 
 
 # http://localhost:8000/player-scores/<pk>/
-class PlayerScoreDetail(generics.RetrieveUpdateDestroyAPIView):
+class PlayerScoreDetail(ReplicaRoutingMixin, CachedResponseMixin,
+                        EagerLoadingMixin,
+                        generics.RetrieveUpdateDestroyAPIView):
     '''
     View allows GET, PUT, PATCH and DELETE requests to retrieve, update and
         delete a specific instance of PlayerScore model.
@@ -164,26 +548,190 @@ class PlayerScoreDetail(generics.RetrieveUpdateDestroyAPIView):
     queryset = PlayerScore.objects.all()
     serializer_class = PlayerScoreSerializer
     name = 'playerscore-detail'
+    cache_tags = ('player', 'game')
+    cache_object_tag = 'playerscore'
 
 
 # http://localhost:8000/users/
-class UserList(generics.ListAPIView):
+class UserList(ReplicaRoutingMixin, CachedResponseMixin, EagerLoadingMixin,
+               generics.ListAPIView):
     '''
     View retrieves a list of users.
     '''
     queryset = User.objects.all()
     serializer_class = UserSerializer
     name = 'user-list'
+    cache_tags = ('user', 'game')
 
 
 # http://localhost:8000/users/<pk>/
-class UserDetail(generics.RetrieveAPIView):
+class UserDetail(ReplicaRoutingMixin, CachedResponseMixin, EagerLoadingMixin,
+                 generics.RetrieveAPIView):
     '''
     View retrieves details about a specific user.
     '''
     queryset = User.objects.all()
     serializer_class = UserSerializer
     name = 'user-detail'
+    cache_tags = ('game',)
+    cache_object_tag = 'user'
+
+
+# http://localhost:8000/users/<pk>/games/
+class UserGameList(ReplicaRoutingMixin, SubCollectionMixin,
+                   CachedResponseMixin, EagerLoadingMixin,
+                   generics.ListAPIView):
+    '''
+    View retrieves all games created by a specific user.
+    '''
+    queryset = Game.objects.all()
+    serializer_class = UserGameSerializer
+    name = 'user-game-list'
+    cache_tags = ('game',)
+    cache_object_tag = 'user'
+    parent_model = User
+    parent_lookup = 'owner_id'
+
+
+# http://localhost:8000/changes/
+class ChangeList(generics.GenericAPIView):
+    '''
+    View returns the changes of game categories, games, players and scores
+        after the seq given by since query parameter, oldest first, with
+        the current column values of created and updated rows. Rows created
+        before the change log aren't in it: without since, the view returns
+        the latest seq, clients then fetch the collections once and request
+        changes since that seq.
+    limit query parameter caps the number of changes (100 by default, at
+        most 1000), models selects models, e.g. models=game,player. With
+        wait, a request finding no changes waits up to that many seconds
+        (at most CHANGE_FEED_MAX_WAIT) for one, polling every
+        poll_interval seconds; the request holds its worker thread
+        meanwhile. A since older than the changes left by prune_changes is
+        rejected, clients then start over.
+    Changes are numbered after their transaction commits, they're read
+        from the primary database so they're there as soon as numbered.
+    '''
+    name = 'change-list'
+    default_limit = 100
+    max_limit = 1000
+    poll_interval = 1.0
+
+    def get_int_param(self, request, name, default, maximum=None):
+        value = request.query_params.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            value = -1
+        if value < 0:
+            raise ValidationError({name: ['Expected a whole number.']})
+        if maximum is not None:
+            value = min(value, maximum)
+        return value
+
+    def get_models(self, request):
+        value = request.query_params.get('models')
+        if value is None:
+            return None
+        models = [name for name in value.split(',') if name]
+        unknown = sorted(set(models) - set(changes.MODELS))
+        if unknown:
+            raise ValidationError({
+                'models': ['Unknown models: {}.'.format(', '.join(unknown))]
+            })
+        return models
+
+    def get(self, request, *args, **kwargs):
+        if 'since' not in request.query_params:
+            return Response({'last_seq': changes.get_head(), 'changes': []})
+        since = self.get_int_param(request, 'since', 0)
+        limit = max(self.get_int_param(
+            request, 'limit', self.default_limit, self.max_limit
+        ), 1)
+        wait = self.get_int_param(
+            request, 'wait', 0,
+            getattr(settings, 'CHANGE_FEED_MAX_WAIT', 10)
+        )
+        models = self.get_models(request)
+        if changes.is_pruned(since):
+            raise ValidationError({'since': [
+                'Changes after this seq were pruned, fetch the collections '
+                'again and request changes since the latest seq.'
+            ]})
+        deadline = time.time() + wait
+        while True:
+            page = changes.get_changes(since, limit, models)
+            if page or time.time() >= deadline:
+                break
+            # a pooled connection goes back to the pool while waiting,
+            # other backends would reconnect on every poll
+            connection = connections['default']
+            if getattr(connection, 'pool', None) is not None and \
+                    not connection.in_atomic_block:
+                connection.close()
+            time.sleep(self.poll_interval)
+        data = changes.get_data(page)
+        last_seq = page[-1].seq if page else since
+        return Response({
+            'last_seq': last_seq,
+            'more': len(page) == limit,
+            'next': replace_query_param(
+                request.build_absolute_uri(), 'since', last_seq
+            ),
+            'changes': [{
+                'seq': change.seq,
+                'model': change.model,
+                'id': change.object_id,
+                'action': change.action,
+                'data': data.get((change.model, change.object_id)),
+            } for change in page],
+        })
+
+
+# http://localhost:8000/metrics/database/
+class DatabaseMetrics(generics.GenericAPIView):
+    '''
+    View reports for staff users how each database connects: its engine,
+        CONN_MAX_AGE and, for pooled backends, utilization and wait time of
+        the connection pools of this process.
+    '''
+    name = 'database-metrics'
+    permission_classes = (permissions.IsAdminUser,)
+    throttle_classes = ()
+
+    def get(self, request, *args, **kwargs):
+        pools = pool.get_stats()
+        databases = []
+        for alias in sorted(connections.databases):
+            settings_dict = connections.databases[alias]
+            databases.append({
+                'alias': alias,
+                'engine': settings_dict['ENGINE'],
+                'conn_max_age': settings_dict.get('CONN_MAX_AGE', 0),
+                'pools': pools.get(alias, {}),
+            })
+        return Response({'databases': databases})
+
+
+# http://localhost:8000/metrics/
+class PrometheusMetrics(generics.GenericAPIView):
+    '''
+    View exposes request timing histograms, score buffer and
+        authentication cache counters and connection pool stats of this
+        process in the Prometheus text format for staff users, see
+        instrumentation.expose.
+    '''
+    name = 'metrics'
+    permission_classes = (permissions.IsAdminUser,)
+    throttle_classes = ()
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            instrumentation.expose(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
 
 
 # http://localhost:8000/
@@ -204,5 +752,6 @@ class ApiRoot(generics.GenericAPIView):
             ),
             'games': reverse(GameList.name, request=request),
             'scores': reverse(PlayerScoreList.name, request=request),
-            'users': reverse(UserList.name, request=request)
+            'users': reverse(UserList.name, request=request),
+            'changes': reverse(ChangeList.name, request=request)
         })
@@ -0,0 +1,21 @@
+"""
+ASGI config for gamesapi project.
+
+It exposes the ASGI callable as a module-level variable named ``application``
+for ASGI servers such as uvicorn or daphne, e.g.
+
+    uvicorn gamesapi.asgi:application --workers 4
+
+Django 1.10 has no ASGI support of its own, games.asgi.ASGIHandler runs the
+WSGI application on a thread pool.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+from games.asgi import ASGIHandler
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gamesapi.settings")
+
+application = ASGIHandler(get_wsgi_application())
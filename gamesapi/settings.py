@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'games.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,6 +62,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request instrumentation, see games/instrumentation.py. When enabled,
+# responses carry a Server-Timing header and /metrics/ exposes per view
+# histograms.
+INSTRUMENTATION_ENABLED = False
+# same SQL run more times than this in one request is logged as N+1
+INSTRUMENTATION_N_PLUS_ONE_THRESHOLD = 10
+
 ROOT_URLCONF = 'gamesapi.urls'
 
 TEMPLATES = [
@@ -81,6 +89,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'gamesapi.wsgi.application'
 
+# Threads running requests of the ASGI application, gamesapi/asgi.py. Keep
+# it at the connection pool size (POOL MAX_SIZE), more threads only wait
+# for connections.
+ASGI_THREADS = 20
+
 
 # Database
 # https://docs.djangoproject.com/en/1.10/ref/settings/#databases
@@ -92,17 +105,109 @@ DATABASES = {
     }
 }
 '''
+# The pooled backend shares connections between the threads of a process,
+# see games/backends/postgresql_pool/base.py. Connections go back to the
+# pool at the end of each request (CONN_MAX_AGE 0). With the stock
+# 'django.db.backends.postgresql' engine, CONN_MAX_AGE keeps a connection
+# per thread open for that many seconds instead.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'games.backends.postgresql_pool',
         'NAME': 'games',
         'USER': 'iverick',
         'PASSWORD': 'password',
         'HOST': '127.0.0.1',
         'PORT': '5433',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MAX_SIZE': 20,
+            'MAX_LIFETIME': 1800,
+            'TIMEOUT': 10,
+            'CHECK_AFTER': 5,
+        },
     }
 }
 
+# Read replicas serve GET requests of the games API views, see
+# games/routers.py. Each replica gets an alias in DATABASES listed in
+# READ_REPLICAS, e.g.
+#     'replica': {
+#         'ENGINE': 'django.db.backends.postgresql',
+#         'NAME': 'games',
+#         'USER': 'iverick',
+#         'PASSWORD': 'password',
+#         'HOST': '127.0.0.1',
+#         'PORT': '5434',
+#         'TEST': {'MIRROR': 'default'},
+#     }
+DATABASE_ROUTERS = ['games.routers.ReplicaRouter']
+READ_REPLICAS = []
+# 'round-robin' or 'least-loaded'
+READ_REPLICA_SELECTION = 'round-robin'
+# seconds during which reads stay on the primary database after a write
+READ_REPLICA_MAX_LAG = 5
+# seconds a replica which failed to connect isn't used
+READ_REPLICA_RETRY = 30
+
+# Caches
+# https://docs.djangoproject.com/en/1.10/topics/cache/
+# 'shared' holds the response cache of games/cache.py, which every worker
+# process must serve alike. DatabaseCache needs no service besides the
+# database, create its table with `manage.py createcachetable`; it counts
+# its rows on every write and deletes 1/CULL_FREQUENCY of them once there
+# are MAX_ENTRIES, so size it for the responses stored within their
+# timeout. Memcached or redis serve it faster. Tag versions and
+# read-your-writes pins are kept in their own tables and never culled.
+# 'default' stays per process for caches which may lag, e.g. listing
+# counts and authentication verifications.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'games_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+
+# Write-behind ingestion, see games/ingestion.py. When enabled, a POST of a
+# single score to /player-scores/ is answered with 202 and a tracking id as
+# soon as the score is in a buffer file of the process, and a thread of the
+# process stores buffered scores in batches. Run `manage.py
+# flush_score_buffer` after worker processes stopped or crashed to store
+# the scores they left behind.
+SCORE_BUFFER_ENABLED = False
+SCORE_BUFFER_DIR = os.path.join(BASE_DIR, 'score_buffer')
+# scores per batch
+SCORE_BUFFER_FLUSH_SIZE = 1000
+# seconds a batch collects scores at most
+SCORE_BUFFER_FLUSH_INTERVAL = 1.0
+# sync buffer files to disk before answering, so accepted scores survive a
+# crash of the host and not only of the process
+SCORE_BUFFER_FSYNC = True
+
+# Score retention, see games/partitions.py. On PostgreSQL PlayerScore is
+# partitioned by month of score_date. `manage.py archive_scores` rolls up
+# the scores of months before the retention period into ScoreArchive rows,
+# drops their partitions and creates partitions for upcoming months. The
+# change feed reports the archived scores as deleted.
+SCORE_RETENTION_MONTHS = 24
+SCORE_PARTITIONS_AHEAD = 3
+
+# Change feed, see games/changes.py. `manage.py prune_changes` deletes
+# changes older than CHANGE_RETENTION_DAYS; run it daily, e.g. from cron.
+# Clients whose seq is older have to fetch the collections again.
+CHANGE_RETENTION_DAYS = 30
+# Seconds a /changes/?wait= request waits for a change at most. A waiting
+# request holds a worker thread (and an ASGI_THREADS thread) the whole
+# time and polls the database every second, so keep it short and size the
+# workers for the clients waiting at once.
+CHANGE_FEED_MAX_WAIT = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.10/ref/settings/#auth-password-validators
@@ -127,20 +232,30 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS':
-        'games.pagination.LimitOffsetPaginationWithMaxLimit',
+        'games.pagination.CountedKeysetPagination',
     'PAGE_SIZE': 5,
+    # games renderer and parser use orjson when it's installed
+    'DEFAULT_RENDERER_CLASSES': (
+        'games.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'games.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_FILTER_BACKENDS': (
         'rest_framework.filters.DjangoFilterBackend',
-        'rest_framework.filters.SearchFilter',
+        'games.filters.NameSearchFilter',
         'rest_framework.filters.OrderingFilter',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.BasicAuthentication',
+        'games.authentication.CachedBasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_THROTTLE_CLASSES': (
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'games.throttling.AnonRateThrottle',
+        'games.throttling.UserRateThrottle',
     ),
     'DEFAULT_THROTTLE_RATES': {
         'anon': '5/hour',